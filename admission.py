@@ -0,0 +1,211 @@
+# Admission control: per-priority concurrency limits, load shedding and
+# per-user rate limits, checked in before_request before any handler work.
+#
+# Each routed endpoint belongs to a priority class (the mapping lives next to
+# the routes in main.py; unlisted endpoints such as auth and admin pages are
+# never limited):
+# - critical: submitting reports and votes
+# - normal:   feed, nearby and viewport reads
+# - low:      full listings, bulk imports, exports
+# - stream:   /feed/stream, which holds its greenlet (or thread, under gthread) for
+#             as long as the client stays connected; the slot is released when the
+#             stream closes, not at teardown
+# A class admits at most ADMISSION_LIMITS[class] requests at once per server
+# process. The defaults keep normal and low well under GUNICORN_THREADS, so a
+# flood of reads can never occupy every thread and starve submissions. Streams
+# default to half of GUNICORN_WORKER_CONNECTIONS under the gevent worker and
+# GUNICORN_THREADS // 4 under gthread. A request
+# over its class limit waits up to ADMISSION_WAIT[class] seconds for a slot.
+# While any higher class has a request waiting, lower classes are shed at once.
+# Shed requests get 503 with Retry-After. A shed stream is not retried by the
+# browser; the map keeps polling /feed instead.
+#
+# Signed-in users also get a token bucket per class (ADMISSION_USER_RATES,
+# "rate:burst" in requests per second). Emptying one returns 429 with the
+# seconds until the next token. Buckets are per process: with N gunicorn
+# workers a user can get up to N times the configured rate. Users the `exempt`
+# callback accepts (admins, in main.py) skip the buckets but not the class limits.
+import math
+import os
+import threading
+import time
+
+from flask import g, jsonify, request, session
+
+PRIORITIES = ('critical', 'normal', 'low', 'stream')
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1').lower() not in ('0', 'false', 'no')
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+# Buckets kept before idle (full) ones are dropped.
+MAX_BUCKETS = 10000
+
+def _spec(value, cast):
+    """'critical=8,normal=4' -> {'critical': 8, 'normal': 4}."""
+    parsed = {}
+    for part in value.split(','):
+        if part.strip():
+            name, _, v = part.partition('=')
+            parsed[name.strip()] = cast(v)
+    return parsed
+
+def _rate(value):
+    rate, _, burst = value.partition(':')
+    return float(rate), float(burst or rate)
+
+_threads = int(os.environ.get('GUNICORN_THREADS', 8))
+if os.environ.get('GUNICORN_WORKER_CLASS', 'gevent') == 'gevent':
+    _streams = max(1, int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000)) // 2)
+else:
+    _streams = max(1, _threads // 4)
+ADMISSION_LIMITS = _spec(os.environ.get('ADMISSION_LIMITS', 'critical=%d,normal=%d,low=%d,stream=%d'
+                                        % (_threads, max(1, _threads // 2), max(1, _threads // 4), _streams)), int)
+ADMISSION_WAIT = _spec(os.environ.get('ADMISSION_WAIT', 'critical=2,normal=0.05,low=0,stream=0'), float)
+ADMISSION_USER_RATES = _spec(os.environ.get('ADMISSION_USER_RATES', 'critical=2:10,normal=5:20,low=1:5'), _rate)
+
+class AdmissionController:
+    """Per-class concurrency gate plus per-(user, class) token buckets for one process."""
+
+    def __init__(self, endpoints, limits=ADMISSION_LIMITS, waits=ADMISSION_WAIT, rates=ADMISSION_USER_RATES,
+                 enabled=ADMISSION_ENABLED, exempt=None):
+        self.endpoints = endpoints
+        # exempt(user_id) -> True skips the per-user rate limit
+        self.exempt = exempt
+        self.limits = limits
+        self.waits = waits
+        self.rates = rates
+        self.enabled = enabled
+        self._cond = threading.Condition()
+        self.inflight = dict.fromkeys(PRIORITIES, 0)
+        self.waiting = dict.fromkeys(PRIORITIES, 0)
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.queue_seconds = dict.fromkeys(PRIORITIES, 0.0)
+        # (class, reason) -> count; reason is priority, full, timeout or rate_limited
+        self.shed = {}
+        self._buckets = {}
+        self._bucket_lock = threading.Lock()
+
+    def _count_shed(self, cls, reason):
+        self.shed[(cls, reason)] = self.shed.get((cls, reason), 0) + 1
+        return reason
+
+    def _higher_waiting(self, cls):
+        return any(self.waiting[c] for c in PRIORITIES[:PRIORITIES.index(cls)])
+
+    def acquire(self, cls):
+        """Take a slot in cls. Returns None when admitted, else why the request was shed."""
+        limit = self.limits.get(cls)
+        with self._cond:
+            if self._higher_waiting(cls):
+                return self._count_shed(cls, 'priority')
+            if limit is None or self.inflight[cls] < limit:
+                self.inflight[cls] += 1
+                self.admitted[cls] += 1
+                return None
+            wait = self.waits.get(cls, 0)
+            if wait <= 0:
+                return self._count_shed(cls, 'full')
+            start = time.monotonic()
+            self.waiting[cls] += 1
+            try:
+                while self.inflight[cls] >= limit:
+                    remaining = start + wait - time.monotonic()
+                    if remaining <= 0:
+                        return self._count_shed(cls, 'timeout')
+                    self._cond.wait(remaining)
+                    if self._higher_waiting(cls):
+                        return self._count_shed(cls, 'priority')
+            finally:
+                self.waiting[cls] -= 1
+                self.queue_seconds[cls] += time.monotonic() - start
+            self.inflight[cls] += 1
+            self.admitted[cls] += 1
+            return None
+
+    def release(self, cls):
+        with self._cond:
+            self.inflight[cls] -= 1
+            self._cond.notify_all()
+
+    def detach(self):
+        """Keep the current request's slot past teardown. Returns a callable that releases it once.
+
+        For streamed responses, whose body runs after the request context is gone.
+        """
+        cls = g.pop('admission_class', None)
+        released = []
+
+        def release():
+            if cls is not None and not released:
+                released.append(True)
+                self.release(cls)
+        return release
+
+    def take_token(self, user_id, cls):
+        """Spend one of user_id's tokens for cls. Returns 0 if allowed, else seconds until the next token."""
+        rate = self.rates.get(cls)
+        if rate is None or rate[0] <= 0:
+            return 0
+        per_second, burst = rate
+        now = time.monotonic()
+        key = (user_id, cls)
+        with self._bucket_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * per_second)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+        with self._cond:
+            self._count_shed(cls, 'rate_limited')
+        return (1 - tokens) / per_second
+
+    def _prune(self, now):
+        """Drop buckets that have refilled completely; they behave exactly like new ones."""
+        for key, (tokens, last) in list(self._buckets.items()):
+            per_second, burst = self.rates[key[1]]
+            if tokens + (now - last) * per_second >= burst:
+                del self._buckets[key]
+
+    def gauges(self):
+        """(name, labels, value) triples for /metrics."""
+        out = []
+        for cls in PRIORITIES:
+            labels = (('class', cls),)
+            out.append(('admission_inflight', labels, self.inflight[cls]))
+            out.append(('admission_waiting', labels, self.waiting[cls]))
+            out.append(('admission_admitted_total', labels, self.admitted[cls]))
+            out.append(('admission_queue_seconds_total', labels, self.queue_seconds[cls]))
+        for (cls, reason), count in sorted(self.shed.items()):
+            out.append(('admission_shed_total', (('class', cls), ('reason', reason)), count))
+        return out
+
+def _reject(status, message, retry_after):
+    response = jsonify({"error": message})
+    response.headers['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+    return response, status
+
+def init_app(app, controller):
+    @app.before_request
+    def _admit():
+        cls = controller.endpoints.get(request.endpoint)
+        if cls is None or not controller.enabled:
+            return None
+        user_id = session.get('user_id')
+        if user_id is not None and not (controller.exempt and controller.exempt(user_id)):
+            wait = controller.take_token(user_id, cls)
+            if wait:
+                return _reject(429, "Too many requests, slow down", wait)
+        if controller.acquire(cls) is not None:
+            return _reject(503, "Server busy, please retry shortly", ADMISSION_RETRY_AFTER)
+        g.admission_class = cls
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        cls = g.pop('admission_class', None)
+        if cls is not None:
+            controller.release(cls)
@@ -0,0 +1,109 @@
+# Retention: reports older than ARCHIVE_AFTER_DAYS move, with their votes and
+# corroborations, from incident_reports / report_votes / report_corroborations
+# into the matching *_archive tables (created by db.py migrations).
+#
+# Work happens in batches of ARCHIVE_BATCH_SIZE reports, each batch its own short
+# BEGIN IMMEDIATE transaction, with a pause between batches so /report and vote
+# writers waiting on the lock get in. Several processes can run passes at once;
+# the write lock serializes them and a batch that finds nothing left ends the pass.
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db import _columns, connect
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', 0))  # 0 disables the background archiver
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', 0.05))
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))
+
+def archive_cutoff(days):
+    """created_at values below this are archived (same format submit_report writes)."""
+    return (datetime.utcnow() - timedelta(days=days)).isoformat() + "Z"
+
+def archive_batch(conn, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to batch_size reports created before cutoff. Returns the ids moved."""
+    report_cols = ", ".join(sorted(_columns(conn, 'incident_reports') & _columns(conn, 'incident_reports_archive')))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM incident_reports WHERE created_at < ? ORDER BY created_at, id LIMIT ?",
+            (cutoff, batch_size))]
+        if ids:
+            marks = ','.join('?' * len(ids))
+            archived_at = datetime.utcnow().isoformat() + "Z"
+            conn.execute("INSERT OR REPLACE INTO incident_reports_archive (%s, archived_at) SELECT %s, ? "
+                         "FROM incident_reports WHERE id IN (%s)" % (report_cols, report_cols, marks),
+                         [archived_at] + ids)
+            conn.execute("INSERT OR REPLACE INTO report_votes_archive (report_id, user_id, vote, voted_at) "
+                         "SELECT report_id, user_id, vote, voted_at FROM report_votes WHERE report_id IN (%s)" % marks,
+                         ids)
+            conn.execute("INSERT OR REPLACE INTO report_corroborations_archive "
+                         "SELECT * FROM report_corroborations WHERE report_id IN (%s)" % marks, ids)
+            # Reports first: the tally triggers on report_votes then have no row left to update.
+            conn.execute("DELETE FROM incident_reports WHERE id IN (%s)" % marks, ids)
+            conn.execute("DELETE FROM report_votes WHERE report_id IN (%s)" % marks, ids)
+            conn.execute("DELETE FROM report_corroborations WHERE report_id IN (%s)" % marks, ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return ids
+
+def archive_reports(conn, days, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_BATCH_PAUSE, on_batch=None):
+    """One full pass: archive everything older than days. Returns the number of reports moved."""
+    cutoff = archive_cutoff(days)
+    moved = 0
+    while True:
+        ids = archive_batch(conn, cutoff, batch_size)
+        if not ids:
+            return moved
+        moved += len(ids)
+        if on_batch is not None:
+            on_batch(ids)
+        if len(ids) < batch_size:
+            return moved
+        time.sleep(pause)
+
+class Archiver:
+    """Background thread running archive_reports() every interval seconds."""
+
+    def __init__(self, database, days=ARCHIVE_AFTER_DAYS, interval=ARCHIVE_INTERVAL, on_batch=None):
+        self.database = database
+        self.days = days
+        self.interval = interval
+        self.on_batch = on_batch
+        self._stop = threading.Event()
+        self._thread = None
+        self.archived = 0
+        self.passes = 0
+
+    def start(self):
+        if self.days <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        conn = connect(self.database)
+        try:
+            while not self._stop.is_set():
+                try:
+                    moved = archive_reports(conn, self.days, on_batch=self.on_batch)
+                    self.archived += moved
+                    self.passes += 1
+                    if moved:
+                        print(f"Archived {moved} reports older than {self.days:g} days")
+                except sqlite3.Error as e:
+                    print(f"Archive pass failed: {e}")
+                self._stop.wait(self.interval)
+        finally:
+            conn.close()
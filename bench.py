@@ -0,0 +1,993 @@
+"""Benchmarks for the incident report API.
+
+Each benchmark runs against a fresh SQLite database in a temporary directory,
+with Nominatim replaced by a local stub server, and prints its results as JSON
+(or writes them to --out, so runs can be diffed to catch regressions).
+
+    python bench.py load --reports 100000 --users 200 --votes 20 --out before.json
+    python bench.py bulk --records 2000
+    python bench.py distance --sizes 10000,100000,1000000
+    python bench.py ratelimit --workers 4 --interval 0.2
+    python bench.py backfill --reports 2000 --spots 40
+    python bench.py stream --sizes 20000,100000
+    python bench.py serialize --reports 20000
+    python bench.py loginstorm --logins 32 --seconds 5
+    python bench.py votes --voters 32 --votes 100
+    python bench.py admission --feeders 16 --listers 8 --seconds 10
+    python bench.py hotspots --reports 200000
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+from http.cookiejar import CookieJar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Benchmarks drive the app far harder than any one user would; admission control
+# is off unless a benchmark (bench.py admission) turns it on for its server.
+os.environ.setdefault('ADMISSION_ENABLED', '0')
+
+class _StubNominatim(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({"address": {"road": "Stub Rd", "city": "Benchville", "state": "VA"}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+class _RecordingNominatim(_StubNominatim):
+    def do_GET(self):
+        self.server.hits.append(time.time())
+        super().do_GET()
+
+def start_stub_nominatim(handler=_StubNominatim):
+    server = _QuietServer(('127.0.0.1', 0), handler)
+    server.hits = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_port
+
+def load_app(workdir=None):
+    """Import main with its database in workdir (a new temp dir by default) and geocoding stubbed."""
+    os.chdir(workdir or tempfile.mkdtemp(prefix='incident-bench-'))
+    sys.path.insert(0, ROOT)
+    import main
+    main.create_app()
+    _, url = start_stub_nominatim()
+    main.geocoder.base_url = url
+    main.geocoder.min_interval = 0
+    return main
+
+def login(main, username='admin', password='admin'):
+    client = main.app.test_client()
+    res = client.post('/login', json={'username': username, 'password': password})
+    assert res.status_code == 200, res.data
+    return client
+
+def synthetic_report(i, lat=38.8316, lon=-77.3076):
+    return {
+        "date": "2026-01-01T12:00",
+        "severity": ("low", "medium", "high", "critical")[i % 4],
+        "location": {"latitude": lat + (i % 100) * 1e-4, "longitude": lon + (i // 100) * 1e-4, "accuracyMeters": 10},
+        "details": "synthetic report %d" % i,
+    }
+
+# ---- Synthetic data ----
+# Reports cluster around real city centres with a roughly normal spread of a few miles.
+CITY_CENTERS = [
+    ("Fairfax", 38.8316, -77.3076),
+    ("Washington", 38.9072, -77.0369),
+    ("New York", 40.7128, -74.0060),
+    ("Chicago", 41.8781, -87.6298),
+    ("San Francisco", 37.7749, -122.4194),
+    ("Los Angeles", 34.0522, -118.2437),
+    ("Seattle", 47.6062, -122.3321),
+    ("Austin", 30.2672, -97.7431),
+]
+CITY_SPREAD_DEG = 0.04
+SEVERITIES = ("low", "medium", "high", "critical")
+
+def random_point(rng):
+    _, lat, lon = rng.choice(CITY_CENTERS)
+    return lat + rng.gauss(0, CITY_SPREAD_DEG), lon + rng.gauss(0, CITY_SPREAD_DEG)
+
+def seed(main, reports, users, votes_per_user, rng, batch=5000):
+    """Insert synthetic users, reports and votes straight into the database.
+
+    Goes through executemany rather than the API, so seeding 10^5-10^6 rows takes
+    seconds. Vote tallies are kept by the report_votes triggers as usual.
+    """
+    from werkzeug.security import generate_password_hash
+    from geo import grid_cell
+    conn = main.connect(main.DATABASE)
+    password_hash = generate_password_hash('bench')
+    conn.executemany("INSERT OR IGNORE INTO users (username, password_hash, account_type, created_at, email_verified) "
+                     "VALUES (?, ?, 'user', '2026-01-01T00:00:00Z', 1)",
+                     [("bench%d" % i, password_hash) for i in range(users)])
+    conn.commit()
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'bench%'")]
+    for start in range(0, reports, batch):
+        rows = []
+        for i in range(start, min(start + batch, reports)):
+            lat, lon = random_point(rng)
+            created = "2026-%02d-%02dT%02d:%02d:00Z" % (rng.randint(1, 9), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59))
+            rows.append((created[:10], rng.choice(SEVERITIES), lat, lon, 10.0, "synthetic report %d" % i, "Pending",
+                         created, rng.choice(user_ids) if user_ids else None, grid_cell(lat, lon)))
+        conn.executemany(main.INSERT_REPORT_SQL, rows)
+        conn.commit()
+    report_ids = [row[0] for row in conn.execute("SELECT id FROM incident_reports")]
+    if report_ids and votes_per_user:
+        votes = [(rid, uid, rng.choice((1, -1)))
+                 for uid in user_ids for rid in rng.sample(report_ids, min(votes_per_user, len(report_ids)))]
+        for start in range(0, len(votes), batch):
+            conn.executemany("INSERT OR IGNORE INTO report_votes (report_id, user_id, vote) VALUES (?, ?, ?)",
+                             votes[start:start + batch])
+            conn.commit()
+    conn.close()
+    return report_ids, user_ids
+
+# ---- Load benchmark ----
+# Each endpoint is a function (rng, report_ids) -> (method, path, json body).
+def _feed(rng, report_ids):
+    lat, lon = random_point(rng)
+    return 'POST', '/feed', {"latitude": lat, "longitude": lon}
+
+def _feed_neighbourhood(rng, report_ids):
+    # Many users polling from the same few blocks (city centres, within ~30m), as happens downtown
+    _, lat, lon = rng.choice(CITY_CENTERS)
+    return 'POST', '/feed', {"latitude": lat + rng.uniform(-0.0003, 0.0003), "longitude": lon + rng.uniform(-0.0003, 0.0003)}
+
+def _reports(rng, report_ids):
+    lat, lon = random_point(rng)
+    return 'GET', '/reports?limit=50&latitude=%f&longitude=%f' % (lat, lon), None
+
+def _reports_nearby(rng, report_ids):
+    lat, lon = random_point(rng)
+    return 'POST', '/reports/nearby', {"latitude": lat, "longitude": lon, "radius_miles": 0.5}
+
+def _report(rng, report_ids):
+    lat, lon = random_point(rng)
+    return 'POST', '/report', dict(synthetic_report(0), location={"latitude": lat, "longitude": lon})
+
+def _vote(rng, report_ids):
+    return 'POST', '/reports/%d/vote' % rng.choice(report_ids), {"vote": rng.choice((1, -1))}
+
+ENDPOINTS = {
+    "feed": _feed,
+    "feed_neighbourhood": _feed_neighbourhood,
+    "reports": _reports,
+    "reports_nearby": _reports_nearby,
+    "report": _report,
+    "vote": _vote,
+}
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))] * 1000, 3)
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+def run_test_client(main, endpoints, requests, report_ids, rng):
+    """Sequential requests through the Flask test client: in-process cost without HTTP."""
+    client = login(main, 'bench0', 'bench')
+    results = {}
+    for name in endpoints:
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            method, path, body = ENDPOINTS[name](rng, report_ids)
+            t0 = time.perf_counter()
+            res = client.open(path, method=method, json=body)
+            latencies.append(time.perf_counter() - t0)
+            errors += res.status_code >= 400
+        results[name] = summarize(latencies, errors, time.perf_counter() - start)
+    return results
+
+def _http_client(base_url, username):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    req = urllib.request.Request(base_url + '/login', data=json.dumps({"username": username, "password": "bench"}).encode(),
+                                 headers={"Content-Type": "application/json"})
+    opener.open(req).read()
+    return opener
+
+def _http_call(opener, base_url, method, path, body):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with opener.open(req, timeout=30) as res:
+            res.read()
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_server(workdir, endpoints, requests, report_ids, rng, workers, concurrency, nominatim_url):
+    """Drive a local multi-process server over real HTTP with `concurrency` client threads."""
+    port = _free_port()
+    env = dict(os.environ, NOMINATIM_URL=nominatim_url)
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench.py'), 'serve',
+                             '--port', str(port), '--workers', str(workers)],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = 'http://127.0.0.1:%d' % port
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        clients = [_http_client(base_url, 'bench%d' % (i % 10)) for i in range(concurrency)]
+        results = {}
+        for name in endpoints:
+            calls = [ENDPOINTS[name](rng, report_ids) for _ in range(requests)]
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+
+            def worker(index):
+                opener = clients[index]
+                for method, path, body in calls[index::concurrency]:
+                    t0 = time.perf_counter()
+                    status = _http_call(opener, base_url, method, path, body)
+                    elapsed = time.perf_counter() - t0
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += status >= 400
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(worker, range(concurrency)))
+            results[name] = summarize(latencies, errors[0], time.perf_counter() - start)
+        return results
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def bench_load(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='incident-bench-')
+    main = load_app(workdir)
+    start = time.perf_counter()
+    report_ids, _ = seed(main, args.reports, args.users, args.votes, rng)
+    seed_seconds = time.perf_counter() - start
+    endpoints = args.endpoints.split(',') if args.endpoints else list(ENDPOINTS)
+    result = {
+        "config": {"reports": args.reports, "users": args.users, "votes_per_user": args.votes,
+                   "requests": args.requests, "seed": args.seed, "workers": args.workers,
+                   "concurrency": args.concurrency},
+        "seed_seconds": round(seed_seconds, 2),
+        "test_client": run_test_client(main, endpoints, args.requests, report_ids, rng),
+    }
+    if args.workers:
+        result["server"] = run_server(workdir, endpoints, args.requests, report_ids, rng,
+                                      args.workers, args.concurrency, main.geocoder.base_url)
+    return result
+
+def serve(args):
+    """Internal: run the app under a forking werkzeug server (used by the load benchmark)."""
+    from werkzeug.serving import run_simple
+    sys.path.insert(0, ROOT)
+    import main
+    run_simple('127.0.0.1', args.port, main.create_app(), processes=args.workers, threaded=args.workers <= 1)
+
+def bench_bulk(args):
+    main = load_app()
+    client = login(main)
+    records = [synthetic_report(i) for i in range(args.records)]
+
+    start = time.perf_counter()
+    for record in records:
+        assert client.post('/report', json=record).status_code == 201
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    res = client.post('/reports/bulk', json=records)
+    bulk = time.perf_counter() - start
+    assert res.get_json()['inserted'] == len(records)
+
+    ndjson = "\n".join(json.dumps(r) for r in records)
+    start = time.perf_counter()
+    res = client.post('/reports/bulk', data=ndjson, content_type='application/x-ndjson')
+    bulk_ndjson = time.perf_counter() - start
+    assert res.get_json()['inserted'] == len(records)
+
+    return {
+        "records": len(records),
+        "single_seconds": round(single, 4),
+        "single_records_per_sec": round(len(records) / single, 1),
+        "bulk_json_seconds": round(bulk, 4),
+        "bulk_json_records_per_sec": round(len(records) / bulk, 1),
+        "bulk_ndjson_seconds": round(bulk_ndjson, 4),
+        "bulk_ndjson_records_per_sec": round(len(records) / bulk_ndjson, 1),
+        "speedup": round(single / bulk, 1),
+    }
+
+# ---- Distance engine benchmark ----
+# No database: points go straight into a DistanceIndex, and the baseline is the
+# per-row haversine_distance() loop the endpoints used before the engine.
+
+def _loop_within(points, lat, lon, radius):
+    from geo import haversine_distance
+    results = []
+    for report_id, report_lat, report_lon in points:
+        distance = haversine_distance(lat, lon, report_lat, report_lon)
+        if distance <= radius:
+            results.append((distance, report_id))
+    results.sort()
+    return results
+
+def _loop_nearest(points, lat, lon, k):
+    import heapq
+    from geo import haversine_distance
+    return heapq.nsmallest(k, ((haversine_distance(lat, lon, report_lat, report_lon), report_id)
+                               for report_id, report_lat, report_lon in points))
+
+def _time_queries(fn, queries):
+    start = time.perf_counter()
+    for lat, lon in queries:
+        fn(lat, lon)
+    return round((time.perf_counter() - start) * 1000 / len(queries), 3)
+
+def bench_distance(args):
+    from distance import DistanceIndex
+    from geo import np
+    rng = random.Random(args.seed)
+    results = {"numpy": np is not None, "radius_miles": args.radius, "k": args.k, "sizes": {}}
+    for size in [int(n) for n in args.sizes.split(',')]:
+        points = [(i + 1,) + random_point(rng) for i in range(size)]
+        queries = [random_point(rng) for _ in range(args.queries)]
+        engines = {"fallback": DistanceIndex(vectorized=False)}
+        if np is not None:
+            engines["numpy"] = DistanceIndex(vectorized=True)
+        # Loaded the way the app loads it: sync() from an incident_reports table
+        source = sqlite3.connect(':memory:')
+        source.execute("CREATE TABLE incident_reports (id INTEGER PRIMARY KEY, location_latitude REAL, "
+                       "location_longitude REAL)")
+        source.executemany("INSERT INTO incident_reports VALUES (?, ?, ?)", points)
+        for index in engines.values():
+            index.sync(source)
+        source.close()
+        row = {
+            "loop_within_ms": _time_queries(lambda lat, lon: _loop_within(points, lat, lon, args.radius), queries),
+            "loop_nearest_ms": _time_queries(lambda lat, lon: _loop_nearest(points, lat, lon, args.k), queries),
+        }
+        for name, index in engines.items():
+            row[name + "_within_ms"] = _time_queries(lambda lat, lon: index.within(lat, lon, args.radius), queries)
+            row[name + "_nearest_ms"] = _time_queries(lambda lat, lon: index.nearest(lat, lon, args.k), queries)
+        best = "numpy" if "numpy" in engines else "fallback"
+        lat, lon = queries[0]
+        assert [x[1] for x in index.nearest(lat, lon, args.k)] == [x[1] for x in _loop_nearest(points, lat, lon, args.k)]
+        row["within_speedup"] = round(row["loop_within_ms"] / max(row[best + "_within_ms"], 1e-6), 1)
+        row["nearest_speedup"] = round(row["loop_nearest_ms"] / max(row[best + "_nearest_ms"], 1e-6), 1)
+        results["sizes"][str(size)] = row
+    return results
+
+# ---- Multi-worker rate limit check ----
+# Boots the production entry point (gunicorn.conf.py) with several workers, gets
+# every worker geocoding at once, and checks the gaps between requests reaching
+# the stub Nominatim. Each worker has its own queue; only the shared limiter in
+# the database keeps them apart. Exits non-zero if the limit was broken.
+
+def bench_ratelimit(args):
+    workdir = tempfile.mkdtemp(prefix='incident-bench-')
+    main = load_app(workdir)
+    seed(main, args.lookups, 1, 0, random.Random(args.seed))
+    stub, url = start_stub_nominatim(_RecordingNominatim)
+    port = _free_port()
+    env = dict(os.environ, DATABASE_PATH=os.path.join(workdir, main.DATABASE), NOMINATIM_URL=url,
+               GEOCODE_MIN_INTERVAL=str(args.interval), WEB_CONCURRENCY=str(args.workers), PORT=str(port))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                             '--chdir', ROOT, '--bind', '127.0.0.1:%d' % port],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = 'http://127.0.0.1:%d' % port
+    try:
+        for _ in range(200):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        # Enough concurrent page loads that every worker serves some and enqueues every report
+        clients = [_http_client(base_url, 'bench0') for _ in range(args.workers * 4)]
+        with ThreadPoolExecutor(len(clients)) as pool:
+            list(pool.map(lambda opener: _http_call(opener, base_url, 'GET', '/reports', None), clients))
+        deadline = time.time() + args.lookups * args.interval * 2 + 10
+        while len(stub.hits) < args.lookups and time.time() < deadline:
+            time.sleep(0.2)
+    finally:
+        proc.terminate()
+        proc.wait()
+    hits = sorted(stub.hits)
+    gaps = [b - a for a, b in zip(hits, hits[1:])]
+    # Allow for scheduling jitter; a broken limiter shows gaps near zero, one per worker per slot.
+    floor = args.interval * 0.75
+    return {
+        "workers": args.workers,
+        "interval_seconds": args.interval,
+        "requests": len(hits),
+        "min_gap_seconds": round(min(gaps), 4) if gaps else None,
+        "mean_gap_seconds": round(sum(gaps) / len(gaps), 4) if gaps else None,
+        "violations": sum(gap < floor for gap in gaps),
+        "ok": len(hits) > 1 and all(gap >= floor for gap in gaps),
+    }
+
+# ---- Login storm ----
+# One gunicorn worker (gthread) serves a steady /feed poller while --logins
+# client threads sign in as fast as they can. "inline" hashes on the request
+# threads with no admission limit, as before the process pool; "pool" uses the
+# defaults from passwords.py. Each variant reports /feed latency before and
+# during the storm, and how many logins succeeded or got 503 (storm clients wait
+# Retry-After before trying again).
+LOGINSTORM_VARIANTS = {
+    'inline': {"PASSWORD_HASH_WORKERS": "0", "PASSWORD_HASH_QUEUE": "100000"},
+    'pool': {},
+}
+
+def _feed_latencies(opener, base_url, rng, seconds):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        method, path, body = _feed(rng, None)
+        t0 = time.perf_counter()
+        errors += _http_call(opener, base_url, method, path, body) >= 400
+        latencies.append(time.perf_counter() - t0)
+    return latencies, errors
+
+def _login_status(base_url, username):
+    req = urllib.request.Request(base_url + '/login', data=json.dumps({"username": username, "password": "bench"}).encode(),
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as res:
+            res.read()
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def _start_gunicorn(workdir, main, **env):
+    """gunicorn on workdir's database with extra environment; returns (process, base_url) once it listens."""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_PATH=os.path.join(workdir, main.DATABASE), NOMINATIM_URL=main.geocoder.base_url,
+               PORT=str(port), **env)
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                             '--chdir', ROOT, '--bind', '127.0.0.1:%d' % port],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return proc, 'http://127.0.0.1:%d' % port
+
+def bench_loginstorm(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='incident-bench-')
+    main = load_app(workdir)
+    seed(main, args.reports, max(args.logins, 1), 0, rng)
+    results = {"config": {"reports": args.reports, "logins": args.logins, "seconds": args.seconds,
+                          "threads": args.threads}}
+    # Clients honour Retry-After, as the web app's sign-in page would
+    retry_after = 1.0
+    for name, overrides in LOGINSTORM_VARIANTS.items():
+        proc, base_url = _start_gunicorn(workdir, main, WEB_CONCURRENCY='1', GUNICORN_THREADS=str(args.threads),
+                                         **overrides)
+        try:
+            # Also warms the hashing pool
+            opener = _http_client(base_url, 'bench0')
+            quiet, quiet_errors = _feed_latencies(opener, base_url, rng, args.seconds)
+            statuses = []
+            stop = threading.Event()
+
+            def storm(index):
+                while not stop.is_set():
+                    status = _login_status(base_url, 'bench%d' % index)
+                    statuses.append(status)
+                    if status == 503:
+                        stop.wait(retry_after)
+
+            threads = [threading.Thread(target=storm, args=(i,)) for i in range(args.logins)]
+            for t in threads:
+                t.start()
+            start = time.perf_counter()
+            busy, busy_errors = _feed_latencies(opener, base_url, rng, args.seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait()
+        results[name] = {
+            "feed_quiet": summarize(quiet, quiet_errors, args.seconds),
+            "feed_during_storm": summarize(busy, busy_errors, elapsed),
+            "logins_ok": statuses.count(200),
+            "logins_rejected_503": statuses.count(503),
+            "logins_per_sec": round(statuses.count(200) / elapsed, 1),
+        }
+    return results
+
+# ---- Admission control ----
+# Load generator: --feeders and --listers client threads (one user each) poll
+# /feed and the full GET /reports listing back to back, ignoring Retry-After,
+# while --submitters users each file one report per second. Runs once with
+# admission control off and once with the defaults from admission.py, and
+# reports /report latency next to what happened to the flood.
+def _status_counts(statuses):
+    counts = {}
+    for status in statuses:
+        counts[str(status)] = counts.get(str(status), 0) + 1
+    return counts
+
+def bench_admission(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='incident-bench-')
+    main = load_app(workdir)
+    flooders = args.feeders + args.listers
+    seed(main, args.reports, flooders + args.submitters, 0, rng)
+    results = {"config": {"reports": args.reports, "feeders": args.feeders, "listers": args.listers,
+                          "submitters": args.submitters, "seconds": args.seconds, "threads": args.threads}}
+    for name, enabled in (('off', '0'), ('on', '1')):
+        proc, base_url = _start_gunicorn(workdir, main, WEB_CONCURRENCY='1', GUNICORN_THREADS=str(args.threads),
+                                         ADMISSION_ENABLED=enabled, DEDUPE_RADIUS_METERS='0')
+        stop = threading.Event()
+        lock = threading.Lock()
+        flood = {"feed": [], "reports": []}
+        submit_latencies, submit_statuses = [], []
+        try:
+            clients = [_http_client(base_url, 'bench%d' % i) for i in range(flooders + args.submitters)]
+
+            def flooder(index):
+                kind = 'feed' if index < args.feeders else 'reports'
+                r = random.Random(index)
+                while not stop.is_set():
+                    method, path, body = _feed(r, None) if kind == 'feed' else ('GET', '/reports', None)
+                    status = _http_call(clients[index], base_url, method, path, body)
+                    with lock:
+                        flood[kind].append(status)
+
+            def submitter(index):
+                r = random.Random(index)
+                while not stop.is_set():
+                    method, path, body = _report(r, None)
+                    t0 = time.perf_counter()
+                    status = _http_call(clients[index], base_url, method, path, body)
+                    elapsed = time.perf_counter() - t0
+                    with lock:
+                        submit_latencies.append(elapsed)
+                        submit_statuses.append(status)
+                    stop.wait(max(0.0, 1.0 - elapsed))
+
+            threads = ([threading.Thread(target=flooder, args=(i,)) for i in range(flooders)]
+                       + [threading.Thread(target=submitter, args=(flooders + i,)) for i in range(args.submitters)])
+            for t in threads:
+                t.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+        finally:
+            proc.terminate()
+            proc.wait()
+        results[name] = {
+            "report": dict(summarize(submit_latencies, sum(s >= 400 for s in submit_statuses), args.seconds),
+                           statuses=_status_counts(submit_statuses)),
+            "feed_statuses": _status_counts(flood['feed']),
+            "reports_statuses": _status_counts(flood['reports']),
+        }
+    return results
+
+# ---- Vote storm ----
+# --voters clients vote on a handful of reports as fast as they can through
+# gunicorn, once with every vote committed on the request (VOTE_FLUSH_INTERVAL=0)
+# and once through the write-behind buffer. After the server stops (flushing at
+# exit) the stored tallies must match the last vote each client made.
+def bench_votes(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='incident-bench-')
+    main = load_app(workdir)
+    seed(main, args.reports, args.voters, 0, rng)
+    conn = main.connect(main.DATABASE)
+    user_ids = [conn.execute("SELECT id FROM users WHERE username = ?", ('bench%d' % i,)).fetchone()[0]
+                for i in range(args.voters)]
+    conn.close()
+    results = {"config": {"reports": args.reports, "voters": args.voters, "votes": args.votes,
+                          "workers": args.workers}}
+    from votes import VOTE_FLUSH_INTERVAL
+    for name, interval in (('sync', '0'), ('buffered', str(VOTE_FLUSH_INTERVAL or 0.1))):
+        conn = main.connect(main.DATABASE)
+        conn.execute("DELETE FROM report_votes")
+        conn.commit()
+        proc, base_url = _start_gunicorn(workdir, main, WEB_CONCURRENCY=str(args.workers),
+                                         VOTE_FLUSH_INTERVAL=interval)
+        last = {}
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        try:
+            clients = [_http_client(base_url, 'bench%d' % i) for i in range(args.voters)]
+
+            def voter(index):
+                r = random.Random(index)
+                for _ in range(args.votes):
+                    report_id, vote = r.randint(1, args.reports), r.choice((1, -1))
+                    t0 = time.perf_counter()
+                    status = _http_call(clients[index], base_url, 'POST', '/reports/%d/vote' % report_id,
+                                        {"vote": vote})
+                    with lock:
+                        latencies.append(time.perf_counter() - t0)
+                        errors[0] += status >= 400
+                        if status == 200:
+                            last[(report_id, user_ids[index])] = vote
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.voters) as pool:
+                list(pool.map(voter, range(args.voters)))
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait()
+        stored = {(r, u): v for r, u, v in conn.execute("SELECT report_id, user_id, vote FROM report_votes")}
+        results[name] = dict(summarize(latencies, errors[0], elapsed),
+                             durable=stored == last,
+                             stale_tallies=main.rebuild_vote_tallies(conn, check_only=True))
+        conn.close()
+    return results
+
+# ---- Geocode backfill ----
+# Seeds reports with no address at a handful of distinct spots and runs
+# `flask geocode-backfill` against the stub Nominatim twice: once cut short with
+# --limit, then to completion. The stub should see one request per spot, since
+# repeats are coalesced within a batch and served by the cache after it.
+
+def bench_backfill(args):
+    main = load_app()
+    report_ids, _ = seed(main, args.reports, 1, 0, random.Random(args.seed))
+    from geo import grid_cell
+    rng = random.Random(args.seed)
+    spots = [random_point(rng) for _ in range(args.spots)]
+    conn = main.connect(main.DATABASE)
+    conn.executemany("UPDATE incident_reports SET location_latitude = ?, location_longitude = ?, grid_cell = ?, "
+                     "location_address = NULL WHERE id = ?",
+                     [spots[i % len(spots)] + (grid_cell(*spots[i % len(spots)]), rid)
+                      for i, rid in enumerate(report_ids)])
+    conn.commit()
+    stub, url = start_stub_nominatim(_RecordingNominatim)
+    runner = main.app.test_cli_runner()
+    options = ['geocode-backfill', '--base-url', url, '--rate', str(args.rate), '--batch-size', str(args.batch_size)]
+    started = time.perf_counter()
+    first = runner.invoke(args=options + ['--limit', str(args.reports // 2)])
+    second = runner.invoke(args=options)
+    elapsed = time.perf_counter() - started
+    remaining = conn.execute("SELECT COUNT(*) FROM incident_reports WHERE location_address IS NULL").fetchone()[0]
+    conn.close()
+    hits = sorted(stub.hits)
+    return {
+        "reports": args.reports,
+        "spots": args.spots,
+        "requests": len(hits),
+        "seconds": round(elapsed, 2),
+        "reports_per_second": round(args.reports / elapsed, 1),
+        "max_requests_per_second": round(max(len(hits) - 1, 0) / (hits[-1] - hits[0]), 2) if len(hits) > 1 else None,
+        "remaining_null": remaining,
+        "output": (first.output + second.output).splitlines()[-1:],
+        "ok": first.exit_code == 0 and second.exit_code == 0 and remaining == 0 and len(hits) <= args.spots,
+    }
+
+# ---- Streaming listings: peak memory vs row count ----
+# Each variant runs in a fresh process against the same seeded database, so
+# ru_maxrss (a high-water mark) measures that one request. The buffered listing
+# should grow with the row count; the streamed ones should stay flat.
+
+STREAM_VARIANTS = {
+    'list': '/reports',
+    'stream_json': '/reports?stream=json',
+    'stream_ndjson': '/reports?stream=ndjson',
+    'stream_nearest': '/reports?stream=ndjson&latitude=38.8316&longitude=-77.3076',
+    'export_csv': '/admin/export/reports?format=csv',
+}
+
+def _peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def stream_child(args):
+    """Internal: one request against an already seeded workdir; prints its peak RSS growth as JSON."""
+    main = load_app(args.workdir)
+    client = login(main)
+    client.get('/reports?limit=1')
+    before = _peak_rss_mb()
+    start = time.perf_counter()
+    res = client.get(STREAM_VARIANTS[args.variant])
+    assert res.status_code == 200, res.status_code
+    size = sum(len(chunk) for chunk in res.response)
+    print(json.dumps({"peak_rss_growth_mb": round(_peak_rss_mb() - before, 1), "bytes": size,
+                      "seconds": round(time.perf_counter() - start, 2)}))
+
+def bench_stream(args):
+    results = {"sizes": {}}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        workdir = tempfile.mkdtemp(prefix='incident-bench-')
+        main = load_app(workdir)
+        seed(main, size, 1, 0, random.Random(args.seed))
+        # As after `flask geocode-backfill`, so the listings don't queue a lookup per row
+        conn = main.connect(main.DATABASE)
+        conn.execute("UPDATE incident_reports SET location_address = 'Stub Rd, Benchville, VA'")
+        conn.commit()
+        conn.close()
+        row = {}
+        for variant in STREAM_VARIANTS:
+            out = subprocess.run([sys.executable, os.path.join(ROOT, 'bench.py'), 'stream-child',
+                                  '--workdir', workdir, '--variant', variant],
+                                 check=True, capture_output=True, text=True).stdout
+            row[variant] = json.loads(out.strip().splitlines()[-1])
+        results["sizes"][str(size)] = row
+    sizes = list(results["sizes"].values())
+    growth = {variant: round(sizes[-1][variant]["peak_rss_growth_mb"] - sizes[0][variant]["peak_rss_growth_mb"], 1)
+              for variant in STREAM_VARIANTS}
+    results["growth_smallest_to_largest_mb"] = growth
+    # The engine's distance/order arrays are O(n) but ~24 bytes a report, hence the allowance.
+    results["ok"] = all(growth[v] <= args.flat_mb for v in STREAM_VARIANTS if v != 'list')
+    return results
+
+# ---- Per-row serialization cost ----
+# The generic report_row_to_dict() path against the fixed-column report_dict()
+# path (serialize.py), and the standard json encoder against the app's provider
+# (orjson when installed). Memory is the tracemalloc peak during one pass, per row.
+
+def _per_row(fn, rows, repeat):
+    import tracemalloc
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    seconds = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn(rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"us_per_row": round(seconds / len(rows) * 1e6, 2), "peak_bytes_per_row": round(peak / len(rows))}
+
+def bench_serialize(args):
+    import serialize
+    main = load_app()
+    seed(main, args.reports, 1, 0, random.Random(args.seed))
+    conn = main.connect(main.DATABASE)
+    conn.execute("UPDATE incident_reports SET location_address = 'Stub Rd, Benchville, VA'")
+    conn.commit()
+    generic = conn.execute("SELECT * FROM incident_reports").fetchall()
+    fixed = conn.execute("SELECT %s FROM incident_reports" % serialize.REPORT_SELECT).fetchall()
+    with main.app.test_request_context():
+        old = _per_row(lambda rows: [main.report_row_to_dict(r, address=main.get_report_address(conn, r),
+                                                             vote_score=r['vote_score'], upvote_count=r['upvote_count'],
+                                                             downvote_count=r['downvote_count']) for r in rows],
+                       generic, args.repeat)
+        new = _per_row(lambda rows: [serialize.report_dict_with_votes(r, main.report_address(conn, r)) for r in rows],
+                       fixed, args.repeat)
+        dicts = [serialize.report_dict_with_votes(r) for r in fixed]
+        std = _per_row(lambda items: json.dumps(items, sort_keys=True, separators=(',', ':')), dicts, args.repeat)
+        fast = _per_row(lambda items: main.app.json.dumps(items, separators=(',', ':')), dicts, args.repeat)
+    conn.close()
+    return {
+        "reports": args.reports,
+        "orjson": serialize.orjson is not None,
+        "to_dict": {"report_row_to_dict": old, "report_dict": new,
+                    "speedup": round(old["us_per_row"] / max(new["us_per_row"], 1e-9), 2)},
+        "encode": {"json": std, "provider": fast,
+                   "speedup": round(std["us_per_row"] / max(fast["us_per_row"], 1e-9), 2)},
+    }
+
+# ---- Hotspots ----
+# GET /hotspots reads trigger-maintained hotspot_counters. The reference here
+# recomputes the same ranking from every incident_reports row in Python, so the
+# run checks the counters (exits 1 if they disagree) and shows what they save.
+
+def _scan_hotspots(conn, k, recent_hours, baseline_hours, now):
+    from datetime import datetime, timezone
+    import hotspots
+    from geo import HOTSPOT_BUCKET_SECONDS, HOTSPOT_SEVERITY_WEIGHTS
+    recent_start = hotspots.current_bucket(now) - recent_hours + 1
+    baseline_start = recent_start - baseline_hours
+    recent, baseline = {}, {}
+    for cell, severity, created_at, corroborations in conn.execute(
+            "SELECT grid_cell, severity, created_at, corroboration_count FROM incident_reports WHERE grid_cell IS NOT NULL"):
+        when = datetime.strptime(created_at[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        bucket = int(when.timestamp()) // HOTSPOT_BUCKET_SECONDS
+        weight = HOTSPOT_SEVERITY_WEIGHTS.get(severity.lower(), 1) * (1 + corroborations)
+        if bucket >= recent_start:
+            recent[cell] = recent.get(cell, 0) + weight
+        elif bucket >= baseline_start:
+            baseline[cell] = baseline.get(cell, 0) + weight
+    hot = []
+    for cell, weight in recent.items():
+        ratio = (weight / recent_hours) / max(baseline.get(cell, 0) / baseline_hours, hotspots.HOTSPOT_BASELINE_FLOOR)
+        if weight >= hotspots.HOTSPOT_MIN_WEIGHT and ratio >= hotspots.HOTSPOT_MIN_RATIO:
+            hot.append((ratio, weight, cell))
+    return [cell for _, _, cell in sorted(hot, reverse=True)[:k]]
+
+def bench_hotspots(args):
+    from datetime import datetime, timedelta
+    import hotspots
+    from geo import grid_cell
+    main = load_app()
+    rng = random.Random(args.seed)
+    conn = main.connect(main.DATABASE)
+    now = datetime.utcnow()
+    span = args.baseline_hours + args.recent_hours
+    # A few surging spots on top of a steady background spread over the whole window
+    surges = [random_point(rng) for _ in range(args.surges)]
+    start = time.perf_counter()
+    for first in range(0, args.reports, 5000):
+        rows = []
+        for i in range(first, min(first + 5000, args.reports)):
+            if i % 20 == 0:
+                lat, lon = rng.choice(surges)
+                lat, lon, hours_ago = lat + rng.uniform(-0.002, 0.002), lon + rng.uniform(-0.002, 0.002), rng.uniform(0, args.recent_hours)
+            else:
+                (lat, lon), hours_ago = random_point(rng), rng.uniform(0, span)
+            created = (now - timedelta(hours=hours_ago)).isoformat(timespec='seconds') + "Z"
+            rows.append((created[:10], rng.choice(SEVERITIES), lat, lon, 10.0, "synthetic report %d" % i, "Pending",
+                         created, None, grid_cell(lat, lon)))
+        conn.executemany(main.INSERT_REPORT_SQL, rows)
+        conn.commit()
+    seed_seconds = time.perf_counter() - start
+    counters = conn.execute("SELECT COUNT(*) FROM hotspot_counters").fetchone()[0]
+    at = now.timestamp()
+
+    def timed(fn):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            result = fn()
+        return result, round((time.perf_counter() - t0) * 1000 / args.repeat, 3)
+
+    fast, counters_ms = timed(lambda: hotspots.top_hotspots(conn, args.k, args.recent_hours, args.baseline_hours, at))
+    slow, scan_ms = timed(lambda: _scan_hotspots(conn, args.k, args.recent_hours, args.baseline_hours, at))
+    start = time.perf_counter()
+    main.rebuild_hotspot_counters(conn)
+    rebuild_ms = round((time.perf_counter() - start) * 1000, 3)
+    conn.close()
+    return {
+        "reports": args.reports,
+        "counter_rows": counters,
+        "seed_reports_per_sec": round(args.reports / seed_seconds),
+        "counters_ms": counters_ms,
+        "scan_ms": scan_ms,
+        "speedup": round(scan_ms / max(counters_ms, 1e-6), 1),
+        "rebuild_ms": rebuild_ms,
+        "hotspots": len(fast),
+        "ok": [spot["cell"] for spot in fast] == slow,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', help='Write results JSON to this file instead of stdout')
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+    p = sub.add_parser('load', help='Latency percentiles and throughput per endpoint on seeded data')
+    p.add_argument('--reports', type=int, default=10000)
+    p.add_argument('--users', type=int, default=50)
+    p.add_argument('--votes', type=int, default=10, help='Votes cast by each user')
+    p.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    p.add_argument('--endpoints', help='Comma-separated subset of: ' + ', '.join(ENDPOINTS))
+    p.add_argument('--workers', type=int, default=4, help='Server processes for the HTTP run (0 to skip)')
+    p.add_argument('--concurrency', type=int, default=8, help='Client threads for the HTTP run')
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_load)
+    p = sub.add_parser('serve', help=argparse.SUPPRESS)
+    p.add_argument('--port', type=int, required=True)
+    p.add_argument('--workers', type=int, default=4)
+    p.set_defaults(func=serve)
+    p = sub.add_parser('bulk', help='POST /reports/bulk vs N calls of POST /report')
+    p.add_argument('--records', type=int, default=2000)
+    p.set_defaults(func=bench_bulk)
+    p = sub.add_parser('distance', help='Vectorized distance engine vs the per-row haversine loop')
+    p.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated report counts')
+    p.add_argument('--queries', type=int, default=5, help='Queries timed per size and method')
+    p.add_argument('--radius', type=float, default=2.0)
+    p.add_argument('--k', type=int, default=50)
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_distance)
+    p = sub.add_parser('ratelimit', help='Geocode rate limit across gunicorn workers (exits 1 if broken)')
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--interval', type=float, default=0.2, help='GEOCODE_MIN_INTERVAL for the run')
+    p.add_argument('--lookups', type=int, default=30, help='Reports (distinct locations) to geocode')
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_ratelimit)
+    p = sub.add_parser('serialize', help='Per-row cost of building and encoding report dicts')
+    p.add_argument('--reports', type=int, default=20000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_serialize)
+    p = sub.add_parser('stream', help='Peak RSS of buffered vs streamed listings as rows grow (exits 1 if not flat)')
+    p.add_argument('--sizes', default='20000,100000', help='Comma-separated report counts')
+    p.add_argument('--flat-mb', type=float, default=10.0, help='Allowed peak growth for streamed variants')
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_stream)
+    p = sub.add_parser('stream-child', help=argparse.SUPPRESS)
+    p.add_argument('--workdir', required=True)
+    p.add_argument('--variant', choices=list(STREAM_VARIANTS), required=True)
+    p.set_defaults(func=stream_child)
+    p = sub.add_parser('loginstorm', help='/feed latency under a concurrent login storm, inline vs pooled hashing')
+    p.add_argument('--reports', type=int, default=5000)
+    p.add_argument('--logins', type=int, default=32, help='Client threads signing in concurrently')
+    p.add_argument('--seconds', type=float, default=5.0, help='Duration of the quiet and storm phases')
+    p.add_argument('--threads', type=int, default=8, help='GUNICORN_THREADS for the server')
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_loginstorm)
+    p = sub.add_parser('admission', help='/report latency under a /feed + /reports flood, admission control off vs on')
+    p.add_argument('--reports', type=int, default=5000)
+    p.add_argument('--feeders', type=int, default=16, help='Client threads polling /feed')
+    p.add_argument('--listers', type=int, default=8, help='Client threads fetching the full /reports listing')
+    p.add_argument('--submitters', type=int, default=4, help='Users filing one report per second')
+    p.add_argument('--seconds', type=float, default=10.0)
+    p.add_argument('--threads', type=int, default=8, help='GUNICORN_THREADS for the server')
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_admission)
+    p = sub.add_parser('hotspots', help='GET /hotspots from the counters vs a full scan (exits 1 if they disagree)')
+    p.add_argument('--reports', type=int, default=200000)
+    p.add_argument('--surges', type=int, default=5, help='Spots receiving a burst of recent reports')
+    p.add_argument('--k', type=int, default=10)
+    p.add_argument('--recent-hours', type=int, default=3)
+    p.add_argument('--baseline-hours', type=int, default=168)
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_hotspots)
+    p = sub.add_parser('votes', help='Vote throughput, synchronous commits vs the write-behind buffer')
+    p.add_argument('--reports', type=int, default=3, help='Reports everyone votes on')
+    p.add_argument('--voters', type=int, default=32)
+    p.add_argument('--votes', type=int, default=100, help='Votes per voter')
+    p.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_votes)
+    p = sub.add_parser('backfill', help='flask geocode-backfill against a stub Nominatim (exits 1 on failure)')
+    p.add_argument('--reports', type=int, default=2000)
+    p.add_argument('--spots', type=int, default=40, help='Distinct locations among the reports')
+    p.add_argument('--rate', type=float, default=20.0, help='Requests per second allowed')
+    p.add_argument('--batch-size', type=int, default=100)
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_backfill)
+    args = parser.parse_args()
+    result = args.func(args)
+    if result is None:
+        return
+    output = json.dumps(result, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if result.get("ok") is False:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
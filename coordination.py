@@ -0,0 +1,85 @@
+# Cross-process coordination through the SQLite database itself, so several
+# worker processes (gunicorn -w N) can share one rate limit and one view of
+# cache invalidations without an outside service.
+#
+# SharedRateLimiter reserves request slots in a rate_limits row under BEGIN
+# IMMEDIATE. The write lock serializes reservations across processes, so
+# consecutive slots are at least `interval` apart no matter which process holds
+# them. SharedVersions keeps named counters in shared_versions. Writers bump them
+# in the same transaction as the change, and readers poll them at most every
+# poll_interval seconds to decide when to drop in-process cache entries.
+# init_lock() is a file lock so only one process runs migrations at a time.
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+INVALIDATION_POLL_SECONDS = float(os.environ.get('INVALIDATION_POLL_SECONDS', 0.5))
+
+class SharedRateLimiter:
+    """At most one acquire() per interval seconds for `name`, across every process using the database."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def acquire(self, conn, interval):
+        """Reserve the next free slot and sleep until it. Returns the seconds slept."""
+        if interval <= 0:
+            return 0.0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT next_at FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            slot = max(time.time(), row[0] if row else 0.0)
+            conn.execute("INSERT INTO rate_limits (name, next_at) VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET next_at = excluded.next_at", (self.name, slot + interval))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        wait = slot - time.time()
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0.0
+
+class SharedVersions:
+    """Named counters shared through the database, read with a short per-process poll interval."""
+
+    def __init__(self, poll_interval=INVALIDATION_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def bump(self, conn, name):
+        """Increment `name`; commits with the caller's transaction."""
+        conn.execute("INSERT INTO shared_versions (name, version) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET version = version + 1", (name,))
+
+    def get(self, conn, name):
+        now = time.monotonic()
+        seen = self._seen.get(name)
+        if seen is not None and now - seen[0] < self.poll_interval:
+            return seen[1]
+        row = conn.execute("SELECT version FROM shared_versions WHERE name = ?", (name,)).fetchone()
+        version = row[0] if row else 0
+        with self._lock:
+            self._seen[name] = (now, version)
+        return version
+
+@contextmanager
+def init_lock(database):
+    """Exclusive lock on `database`.lock for the duration of the block (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(database + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
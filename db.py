@@ -0,0 +1,520 @@
+# SQLite connection management and schema migrations.
+#
+# connect() applies the per-connection pragmas once; ConnectionPool keeps idle
+# connections around so requests don't pay connect + pragma cost every time.
+# main.get_db() hands one pooled connection to each request (stored on flask.g).
+import queue
+import sqlite3
+
+from geo import (CLUSTER_SEVERITIES, CLUSTER_ZOOMS, HOTSPOT_BUCKET_SECONDS, HOTSPOT_RETENTION_BUCKETS,
+                 HOTSPOT_SEVERITY_WEIGHTS, cluster_cell_size, grid_cell)
+
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=%d" % BUSY_TIMEOUT_MS,
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    # Vote tally triggers must also fire for rows removed by REPLACE.
+    "PRAGMA recursive_triggers=ON",
+)
+
+def connect(database):
+    """Open a configured connection. Usable from any thread, but by one at a time."""
+    conn = sqlite3.connect(database, timeout=BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """Bounded LIFO pool of idle connections to one database file."""
+
+    def __init__(self, database, size=8):
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.database)
+
+    def release(self, conn):
+        # Never hand a half-finished transaction to the next borrower.
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def idle_count(self):
+        return self._idle.qsize()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+# ---- Schema migrations ----
+# Each step upgrades the schema by one version inside a single transaction;
+# PRAGMA user_version records how far a database has got. Steps are idempotent
+# so databases created before versioning (user_version 0) upgrade cleanly.
+# Append new steps; never edit or reorder shipped ones.
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute("PRAGMA table_info(%s)" % table)}
+
+def _add_column(conn, table, column, decl):
+    """Add a column unless it already exists. Returns True if it was added."""
+    if column in _columns(conn, table):
+        return False
+    conn.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, column, decl))
+    return True
+
+def _migrate_base_schema(conn):
+    """incident_reports, users and report_votes"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS incident_reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            severity TEXT,
+            location_latitude REAL,
+            location_longitude REAL,
+            location_accuracy REAL,
+            details TEXT,
+            status TEXT,
+            created_at TEXT
+        )
+    ''')
+    _add_column(conn, 'incident_reports', 'verified', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'incident_reports', 'reported_by_user_id', 'INTEGER')
+    _add_column(conn, 'incident_reports', 'location_address', 'TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            account_type TEXT NOT NULL CHECK(account_type IN ('admin', 'user')),
+            created_at TEXT
+        )
+    ''')
+    # UNIQUE can't be added by ALTER TABLE; older databases get a unique index instead.
+    if _add_column(conn, 'users', 'email', 'TEXT'):
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+    _add_column(conn, 'users', 'email_verified', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'users', 'verification_token', 'TEXT')
+    # Users without email (seeded / legacy) are treated as verified
+    conn.execute("UPDATE users SET email_verified = 1 WHERE email IS NULL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS report_votes (
+            report_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            vote INTEGER NOT NULL CHECK(vote IN (1, -1)),
+            PRIMARY KEY (report_id, user_id),
+            FOREIGN KEY (report_id) REFERENCES incident_reports(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+def _migrate_grid_cell(conn):
+    """grid-cell spatial index on incident_reports"""
+    _add_column(conn, 'incident_reports', 'grid_cell', 'INTEGER')
+    conn.create_function('grid_cell', 2, grid_cell, deterministic=True)
+    conn.execute('''UPDATE incident_reports SET grid_cell = grid_cell(location_latitude, location_longitude)
+                    WHERE grid_cell IS NULL AND location_latitude IS NOT NULL AND location_longitude IS NOT NULL''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_grid_cell ON incident_reports(grid_cell)")
+
+def _migrate_geocode_cache(conn):
+    """geocode_cache table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            key TEXT PRIMARY KEY,
+            address TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_created_at ON geocode_cache(created_at)")
+
+def _migrate_vote_tallies(conn):
+    """trigger-maintained vote tallies on incident_reports"""
+    added = [_add_column(conn, 'incident_reports', col, 'INTEGER NOT NULL DEFAULT 0')
+             for col in ('vote_score', 'upvote_count', 'downvote_count')]
+    # Tallies change in the same transaction as the vote. REPLACE fires the
+    # delete trigger because connect() enables recursive_triggers.
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_report_votes_insert AFTER INSERT ON report_votes BEGIN
+            UPDATE incident_reports SET vote_score = vote_score + NEW.vote,
+                upvote_count = upvote_count + (NEW.vote = 1),
+                downvote_count = downvote_count + (NEW.vote = -1)
+            WHERE id = NEW.report_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_report_votes_delete AFTER DELETE ON report_votes BEGIN
+            UPDATE incident_reports SET vote_score = vote_score - OLD.vote,
+                upvote_count = upvote_count - (OLD.vote = 1),
+                downvote_count = downvote_count - (OLD.vote = -1)
+            WHERE id = OLD.report_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_report_votes_update AFTER UPDATE ON report_votes BEGIN
+            UPDATE incident_reports SET vote_score = vote_score - OLD.vote,
+                upvote_count = upvote_count - (OLD.vote = 1),
+                downvote_count = downvote_count - (OLD.vote = -1)
+            WHERE id = OLD.report_id;
+            UPDATE incident_reports SET vote_score = vote_score + NEW.vote,
+                upvote_count = upvote_count + (NEW.vote = 1),
+                downvote_count = downvote_count + (NEW.vote = -1)
+            WHERE id = NEW.report_id;
+        END
+    ''')
+    if any(added):
+        rebuild_vote_tallies(conn, commit=False)
+
+def _migrate_report_list_indexes(conn):
+    """indexes for GET /reports ordering and filters"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_created_at ON incident_reports(created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_severity ON incident_reports(severity, created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_verified ON incident_reports(verified, created_at, id)")
+
+def _migrate_lookup_indexes(conn):
+    """indexes for per-user and token lookups"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_report_votes_user_id ON report_votes(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_reported_by ON incident_reports(reported_by_user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_verification_token ON users(verification_token)")
+
+def _cluster_upsert(ref, sign):
+    """Statements adding (sign 1) or removing (sign -1) report `ref` (NEW/OLD) from every cluster level."""
+    located = "%s.location_latitude IS NOT NULL AND %s.location_longitude IS NOT NULL" % (ref, ref)
+    severity_cols = ", ".join(CLUSTER_SEVERITIES)
+    severity_vals = ", ".join("%d * (lower(%s.severity) = '%s')" % (sign, ref, sev) for sev in CLUSTER_SEVERITIES)
+    severity_sets = ", ".join("%s = %s + excluded.%s" % (sev, sev, sev) for sev in CLUSTER_SEVERITIES)
+    statements = []
+    for level in CLUSTER_ZOOMS:
+        size = repr(cluster_cell_size(level))
+        row = "CAST((%s.location_latitude + 90.0) / %s AS INTEGER)" % (ref, size)
+        col = "CAST((%s.location_longitude + 180.0) / %s AS INTEGER)" % (ref, size)
+        statements.append(
+            "INSERT INTO map_clusters (zoom, row, col, count, %s, lat_sum, lon_sum) "
+            "SELECT %d, %s, %s, %d, %s, %d * %s.location_latitude, %d * %s.location_longitude WHERE %s "
+            "ON CONFLICT(zoom, row, col) DO UPDATE SET count = count + excluded.count, %s, "
+            "lat_sum = lat_sum + excluded.lat_sum, lon_sum = lon_sum + excluded.lon_sum;"
+            % (severity_cols, level, row, col, sign, severity_vals, sign, ref, sign, ref, located, severity_sets))
+        if sign < 0:
+            statements.append("DELETE FROM map_clusters WHERE zoom = %d AND row = %s AND col = %s AND count <= 0;"
+                              % (level, row, col))
+    return "\n".join(statements)
+
+def _migrate_map_clusters(conn):
+    """trigger-maintained map cluster hierarchy"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS map_clusters (
+            zoom INTEGER NOT NULL,
+            row INTEGER NOT NULL,
+            col INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            low INTEGER NOT NULL,
+            medium INTEGER NOT NULL,
+            high INTEGER NOT NULL,
+            critical INTEGER NOT NULL,
+            lat_sum REAL NOT NULL,
+            lon_sum REAL NOT NULL,
+            PRIMARY KEY (zoom, row, col)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_map_clusters_insert AFTER INSERT ON incident_reports BEGIN\n%s\nEND"
+                 % _cluster_upsert('NEW', 1))
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_map_clusters_delete AFTER DELETE ON incident_reports BEGIN\n%s\nEND"
+                 % _cluster_upsert('OLD', -1))
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_map_clusters_update "
+                 "AFTER UPDATE OF location_latitude, location_longitude, severity ON incident_reports BEGIN\n%s\n%s\nEND"
+                 % (_cluster_upsert('OLD', -1), _cluster_upsert('NEW', 1)))
+    rebuild_map_clusters(conn, commit=False)
+
+def _migrate_cell_versions(conn):
+    """per-grid-cell data versions for response caching"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cell_versions (
+            cell INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    bump = ("INSERT INTO cell_versions (cell, version) VALUES (%s.grid_cell, 1) "
+            "ON CONFLICT(cell) DO UPDATE SET version = version + 1;")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_cell_versions_insert AFTER INSERT ON incident_reports "
+                 "WHEN NEW.grid_cell IS NOT NULL BEGIN %s END" % (bump % 'NEW'))
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_cell_versions_delete AFTER DELETE ON incident_reports "
+                 "WHEN OLD.grid_cell IS NOT NULL BEGIN %s END" % (bump % 'OLD'))
+    # Any column change (votes via the tally triggers, verification, geocoded address) invalidates the cell.
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_cell_versions_update_old AFTER UPDATE ON incident_reports "
+                 "WHEN OLD.grid_cell IS NOT NULL BEGIN %s END" % (bump % 'OLD'))
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_cell_versions_update_new AFTER UPDATE ON incident_reports "
+                 "WHEN NEW.grid_cell IS NOT NULL AND NEW.grid_cell IS NOT OLD.grid_cell BEGIN %s END"
+                 % (bump % 'NEW'))
+
+def _migrate_archive_tables(conn):
+    """archive tables for report retention"""
+    # Mirrors incident_reports; archive.archive_batch copies the columns both tables
+    # share, so later incident_reports columns should be added here as well.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS incident_reports_archive (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            severity TEXT,
+            location_latitude REAL,
+            location_longitude REAL,
+            location_accuracy REAL,
+            details TEXT,
+            status TEXT,
+            created_at TEXT,
+            verified INTEGER DEFAULT 0,
+            reported_by_user_id INTEGER,
+            location_address TEXT,
+            grid_cell INTEGER,
+            vote_score INTEGER NOT NULL DEFAULT 0,
+            upvote_count INTEGER NOT NULL DEFAULT 0,
+            downvote_count INTEGER NOT NULL DEFAULT 0,
+            archived_at TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_archive_created_at "
+                 "ON incident_reports_archive(created_at, id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS report_votes_archive (
+            report_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            vote INTEGER NOT NULL,
+            PRIMARY KEY (report_id, user_id)
+        )
+    ''')
+
+def _migrate_coordination_tables(conn):
+    """rate_limits and shared_versions for multi-process coordination"""
+    conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, next_at REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS shared_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+def _migrate_ungeocoded_index(conn):
+    """partial index over reports still waiting for an address"""
+    # Only NULL-address rows are indexed, so the geocode backfill finds its next
+    # batch without walking the reports that are already done.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_ungeocoded "
+                 "ON incident_reports(id) WHERE location_address IS NULL")
+
+def _migrate_corroborations(conn):
+    """duplicate reports folded into canonical incidents"""
+    for table in ('incident_reports', 'incident_reports_archive'):
+        _add_column(conn, table, 'corroboration_count', 'INTEGER NOT NULL DEFAULT 0')
+    for table, key in (('report_corroborations', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+                       ('report_corroborations_archive', 'INTEGER PRIMARY KEY')):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS %s (
+                id %s,
+                report_id INTEGER NOT NULL,
+                user_id INTEGER,
+                date TEXT,
+                severity TEXT,
+                location_latitude REAL,
+                location_longitude REAL,
+                location_accuracy REAL,
+                details TEXT,
+                status TEXT,
+                created_at TEXT
+            )
+        ''' % (table, key))
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_%s_report ON %s(report_id)" % (table, table))
+    # Submit-time duplicate lookup (incidents.find_canonical)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_incident_reports_dedupe "
+                 "ON incident_reports(severity, grid_cell, created_at)")
+
+def _migrate_vote_timestamps(conn):
+    """voted_at on report_votes, so the newest vote wins however late it is flushed"""
+    _add_column(conn, 'report_votes', 'voted_at', 'REAL')
+
+def _hotspot_bucket(ref):
+    """SQL for the HOTSPOT_BUCKET_SECONDS bucket of ref.created_at (NULL when it doesn't parse)."""
+    prefix = ref + "." if ref else ""
+    return "CAST(strftime('%%s', substr(%screated_at, 1, 19)) AS INTEGER) / %d" % (prefix, HOTSPOT_BUCKET_SECONDS)
+
+def _hotspot_cutoff():
+    """SQL for the oldest bucket hotspot_counters keeps (HOTSPOT_RETENTION_BUCKETS back from now)."""
+    return "CAST(strftime('%%s', 'now') AS INTEGER) / %d - %d" % (HOTSPOT_BUCKET_SECONDS, HOTSPOT_RETENTION_BUCKETS)
+
+def _hotspot_weight(ref):
+    """SQL for a report's severity weight, counting each corroboration as another report."""
+    prefix = ref + "." if ref else ""
+    cases = " ".join("WHEN '%s' THEN %d" % item for item in HOTSPOT_SEVERITY_WEIGHTS.items())
+    return "(CASE lower(%sseverity) %s ELSE 1 END) * (1 + %scorroboration_count)" % (prefix, cases, prefix)
+
+def _hotspot_upsert(ref, sign):
+    """Statements adding (sign 1) or removing (sign -1) report `ref` (NEW/OLD) from its hotspot counter."""
+    bucket = _hotspot_bucket(ref)
+    statements = [
+        "INSERT INTO hotspot_counters (cell, bucket, weight, count) "
+        "SELECT %s.grid_cell, %s, %d * %s, %d * (1 + %s.corroboration_count) "
+        "WHERE %s.grid_cell IS NOT NULL AND %s IS NOT NULL "
+        "ON CONFLICT(cell, bucket) DO UPDATE SET weight = weight + excluded.weight, count = count + excluded.count;"
+        % (ref, bucket, sign, _hotspot_weight(ref), sign, ref, ref, bucket)]
+    if sign < 0:
+        statements.append("DELETE FROM hotspot_counters WHERE cell = %s.grid_cell AND bucket = %s AND count <= 0;"
+                          % (ref, bucket))
+    return "\n".join(statements)
+
+def _migrate_hotspot_counters(conn):
+    """trigger-maintained per-cell hourly counters for hotspot detection"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hotspot_counters (
+            cell INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            weight INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (cell, bucket)
+        ) WITHOUT ROWID
+    ''')
+    # Recent buckets across all cells, read by /hotspots without touching the table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_hotspot_counters_bucket "
+                 "ON hotspot_counters(bucket, cell, weight, count)")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_hotspot_counters_insert AFTER INSERT ON incident_reports BEGIN\n%s\nEND"
+                 % _hotspot_upsert('NEW', 1))
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_hotspot_counters_delete AFTER DELETE ON incident_reports BEGIN\n%s\nEND"
+                 % _hotspot_upsert('OLD', -1))
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_hotspot_counters_update AFTER UPDATE OF grid_cell, severity, "
+                 "created_at, corroboration_count ON incident_reports BEGIN\n%s\n%s\nEND"
+                 % (_hotspot_upsert('OLD', -1), _hotspot_upsert('NEW', 1)))
+    rebuild_hotspot_counters(conn, commit=False)
+
+def _migrate_feed_events(conn):
+    """feed_events log relaying SSE events between server processes"""
+    # AUTOINCREMENT: seq never goes backwards, even after pruning empties the table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feed_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            payload TEXT NOT NULL
+        )
+    ''')
+
+def _migrate_corroboration_user_index(conn):
+    """index corroborations by user for account deletion"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_report_corroborations_user ON report_corroborations(user_id)")
+
+def _migrate_hotspot_pruning(conn):
+    """prune hotspot counters older than the longest /hotspots window"""
+    # Fires once per new (cell, hour) counter, not per report; the delete is a range on
+    # idx_hotspot_counters_bucket that is empty except for buckets that just expired.
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_hotspot_counters_prune AFTER INSERT ON hotspot_counters BEGIN\n"
+                 "DELETE FROM hotspot_counters WHERE bucket < %s;\nEND" % _hotspot_cutoff())
+    conn.execute("DELETE FROM hotspot_counters WHERE bucket < " + _hotspot_cutoff())
+
+def _migrate_archived_vote_timestamps(conn):
+    """voted_at on report_votes_archive, kept when votes are archived"""
+    _add_column(conn, 'report_votes_archive', 'voted_at', 'REAL')
+
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_grid_cell,
+    _migrate_geocode_cache,
+    _migrate_vote_tallies,
+    _migrate_report_list_indexes,
+    _migrate_lookup_indexes,
+    _migrate_map_clusters,
+    _migrate_cell_versions,
+    _migrate_archive_tables,
+    _migrate_coordination_tables,
+    _migrate_ungeocoded_index,
+    _migrate_corroborations,
+    _migrate_vote_timestamps,
+    _migrate_hotspot_counters,
+    _migrate_feed_events,
+    _migrate_corroboration_user_index,
+    _migrate_hotspot_pruning,
+    _migrate_archived_vote_timestamps,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations. Returns how many ran (0 when the schema is current)."""
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError("Database schema version %d is newer than this code (%d)" % (version, SCHEMA_VERSION))
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        step = MIGRATIONS[number - 1]
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute("PRAGMA user_version = %d" % number)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {number}: {step.__doc__}")
+    return SCHEMA_VERSION - version
+
+def rebuild_vote_tallies(conn, check_only=False, commit=True):
+    """Recompute vote tallies from report_votes. Returns the number of reports that were out of sync."""
+    c = conn.cursor()
+    c.execute('''
+        SELECT r.id, COALESCE(v.score, 0), COALESCE(v.up, 0), COALESCE(v.down, 0)
+        FROM incident_reports r
+        LEFT JOIN (SELECT report_id, SUM(vote) AS score, SUM(vote = 1) AS up, SUM(vote = -1) AS down
+                   FROM report_votes GROUP BY report_id) v ON v.report_id = r.id
+        WHERE r.vote_score != COALESCE(v.score, 0)
+           OR r.upvote_count != COALESCE(v.up, 0)
+           OR r.downvote_count != COALESCE(v.down, 0)
+    ''')
+    stale = c.fetchall()
+    if stale and not check_only:
+        c.executemany("UPDATE incident_reports SET vote_score = ?, upvote_count = ?, downvote_count = ? WHERE id = ?",
+                      [(row[1], row[2], row[3], row[0]) for row in stale])
+        if commit:
+            conn.commit()
+    return len(stale)
+
+def rebuild_map_clusters(conn, commit=True):
+    """Recompute map_clusters from incident_reports. Returns the number of cluster cells."""
+    conn.execute("DELETE FROM map_clusters")
+    severity_sums = ", ".join("SUM(lower(severity) = '%s')" % sev for sev in CLUSTER_SEVERITIES)
+    for level in CLUSTER_ZOOMS:
+        size = repr(cluster_cell_size(level))
+        conn.execute('''
+            INSERT INTO map_clusters (zoom, row, col, count, %s, lat_sum, lon_sum)
+            SELECT %d, CAST((location_latitude + 90.0) / %s AS INTEGER) AS r,
+                   CAST((location_longitude + 180.0) / %s AS INTEGER) AS c,
+                   COUNT(*), %s, SUM(location_latitude), SUM(location_longitude)
+            FROM incident_reports
+            WHERE location_latitude IS NOT NULL AND location_longitude IS NOT NULL
+            GROUP BY r, c
+        ''' % (", ".join(CLUSTER_SEVERITIES), level, size, size, severity_sums))
+    count = conn.execute("SELECT COUNT(*) FROM map_clusters").fetchone()[0]
+    if commit:
+        conn.commit()
+    return count
+
+def rebuild_hotspot_counters(conn, commit=True):
+    """Recompute hotspot_counters from incident_reports. Returns the number of (cell, bucket) counters."""
+    conn.execute("DELETE FROM hotspot_counters")
+    conn.execute('''
+        INSERT INTO hotspot_counters (cell, bucket, weight, count)
+        SELECT grid_cell, bucket, SUM(weight), SUM(1 + corroboration_count)
+        FROM (SELECT grid_cell, %s AS bucket, %s AS weight, corroboration_count
+              FROM incident_reports WHERE grid_cell IS NOT NULL)
+        WHERE bucket >= %s
+        GROUP BY grid_cell, bucket
+    ''' % (_hotspot_bucket(None), _hotspot_weight(None), _hotspot_cutoff()))
+    count = conn.execute("SELECT COUNT(*) FROM hotspot_counters").fetchone()[0]
+    if commit:
+        conn.commit()
+    return count
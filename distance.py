@@ -0,0 +1,242 @@
+# In-memory distance engine over every located report.
+#
+# Coordinates live in contiguous float64 arrays (radians, with cos(lat)
+# precomputed) alongside an int64 id array, so "within r miles" and "nearest k"
+# are one vectorized haversine pass plus np.argpartition instead of a Python
+# loop and a full sort. Without NumPy the same API runs on plain lists.
+#
+# The index is a cache of incident_reports, never the source of truth:
+# - sync() appends rows with ids above the highest one seen. Ids only grow and
+#   SQLite serializes writers, so no insert is missed.
+# - discard() tombstones a deleted id; tombstones are compacted away in bulk.
+# - rows() re-reads matches by id, so a report deleted by another process is
+#   dropped (and discarded) the first time a query turns it up.
+import bisect
+import heapq
+import math
+import threading
+
+from geo import EARTH_RADIUS_MILES, np
+
+INITIAL_CAPACITY = 1024
+# Compact once this fraction of slots are tombstones.
+COMPACT_RATIO = 0.25
+# Upper bound on ids looked up per round when filters reject nearest matches.
+MAX_FETCH_BATCH = 4096
+
+class DistanceIndex:
+    def __init__(self, vectorized=None):
+        self.vectorized = np is not None if vectorized is None else bool(vectorized and np is not None)
+        self._lock = threading.Lock()
+        self.max_id = 0
+        self._count = 0
+        self._dead = 0
+        if self.vectorized:
+            self._ids = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+            self._lat = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+            self._lon = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+            self._cos = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        else:
+            self._ids, self._lat, self._lon, self._cos = [], [], [], []
+
+    def __len__(self):
+        return self._count - self._dead
+
+    # ---- Maintenance ----
+
+    def sync(self, conn):
+        """Pull reports inserted since the last sync. Returns how many were added."""
+        with self._lock:
+            rows = conn.execute("SELECT id, location_latitude, location_longitude FROM incident_reports "
+                                "WHERE id > ? ORDER BY id", (self.max_id,)).fetchall()
+            if not rows:
+                return 0
+            self.max_id = rows[-1][0]
+            located = [row for row in rows if row[1] is not None and row[2] is not None]
+            self._append([row[0] for row in located], [row[1] for row in located], [row[2] for row in located])
+            return len(located)
+
+    def _append(self, ids, lats, lons):
+        n = len(ids)
+        if not n:
+            return
+        if not self.vectorized:
+            lat_rad = [math.radians(v) for v in lats]
+            self._ids.extend(ids)
+            self._lat.extend(lat_rad)
+            self._lon.extend(math.radians(v) for v in lons)
+            self._cos.extend(math.cos(v) for v in lat_rad)
+            self._count += n
+            return
+        end = self._count + n
+        if end > len(self._ids):
+            capacity = max(end, 2 * len(self._ids))
+            # New arrays, not resize(): readers may still hold views of the old ones.
+            for name in ('_ids', '_lat', '_lon', '_cos'):
+                old = getattr(self, name)
+                grown = np.empty(capacity, dtype=old.dtype)
+                grown[:self._count] = old[:self._count]
+                setattr(self, name, grown)
+        lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+        self._ids[self._count:end] = ids
+        self._lat[self._count:end] = lat_rad
+        self._lon[self._count:end] = np.radians(np.asarray(lons, dtype=np.float64))
+        self._cos[self._count:end] = np.cos(lat_rad)
+        self._count = end
+
+    def discard(self, report_id):
+        """Forget a deleted report. Unknown ids are ignored."""
+        with self._lock:
+            if self.vectorized:
+                i = int(np.searchsorted(self._ids[:self._count], report_id))
+            else:
+                i = bisect.bisect_left(self._ids, report_id)
+            if i >= self._count or self._ids[i] != report_id or math.isnan(self._lat[i]):
+                return
+            # NaN coordinates make every distance comparison false.
+            self._lat[i] = math.nan
+            self._dead += 1
+            if self._dead > INITIAL_CAPACITY and self._dead > self._count * COMPACT_RATIO:
+                self._compact()
+
+    def _compact(self):
+        if self.vectorized:
+            keep = ~np.isnan(self._lat[:self._count])
+            for name in ('_ids', '_lat', '_lon', '_cos'):
+                setattr(self, name, getattr(self, name)[:self._count][keep])
+            self._count = len(self._ids)
+        else:
+            keep = [i for i, v in enumerate(self._lat) if not math.isnan(v)]
+            for name in ('_ids', '_lat', '_lon', '_cos'):
+                column = getattr(self, name)
+                setattr(self, name, [column[i] for i in keep])
+            self._count = len(keep)
+        self._dead = 0
+
+    # ---- Queries ----
+    # Both return [(distance_miles, report_id)] ordered by (distance, id).
+
+    def _snapshot(self):
+        with self._lock:
+            n = self._count
+            if self.vectorized:
+                return self._ids[:n], self._lat[:n], self._lon[:n], self._cos[:n]
+            # Lists only grow in place or get replaced whole, so no copy is needed.
+            return self._ids, self._lat, self._lon, self._cos
+
+    def _distances(self, lat, lon, lats, lons, coss):
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        sin_dlat = np.sin((lats - lat1) * 0.5)
+        sin_dlon = np.sin((lons - lon1) * 0.5)
+        a = sin_dlat * sin_dlat + math.cos(lat1) * coss * sin_dlon * sin_dlon
+        return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _iter_distances(self, lat, lon, snapshot):
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        cos1 = math.cos(lat1)
+        for report_id, lat2, lon2, cos2 in zip(*snapshot):
+            if math.isnan(lat2):
+                continue
+            a = math.sin((lat2 - lat1) * 0.5) ** 2 + cos1 * cos2 * math.sin((lon2 - lon1) * 0.5) ** 2
+            yield 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(a, 1.0))), report_id
+
+    def within(self, lat, lon, radius_miles):
+        """Every indexed report within radius_miles of (lat, lon)."""
+        snapshot = self._snapshot()
+        if not self.vectorized:
+            return sorted(x for x in self._iter_distances(lat, lon, snapshot) if x[0] <= radius_miles)
+        ids = snapshot[0]
+        d = self._distances(lat, lon, *snapshot[1:])
+        hits = np.flatnonzero(d <= radius_miles)
+        return self._ordered(d[hits], ids[hits])
+
+    def nearest(self, lat, lon, k, after=None):
+        """The k closest reports, optionally only those ordered after the (distance, id) pair `after`."""
+        snapshot = self._snapshot()
+        if k <= 0:
+            return []
+        if not self.vectorized:
+            candidates = self._iter_distances(lat, lon, snapshot)
+            if after is not None:
+                after = tuple(after)
+                candidates = (x for x in candidates if x > after)
+            return heapq.nsmallest(k, candidates)
+        ids = snapshot[0]
+        d = self._distances(lat, lon, *snapshot[1:])
+        if after is not None:
+            valid = (d > after[0]) | ((d == after[0]) & (ids > after[1]))
+        else:
+            valid = ~np.isnan(d)
+        candidates = np.flatnonzero(valid)
+        if len(candidates) > k:
+            dc = d[candidates]
+            bound = dc[np.argpartition(dc, k - 1)[:k]].max()
+            # Keep every tie at the boundary so ordering by id stays exact.
+            candidates = candidates[dc <= bound]
+        return self._ordered(d[candidates], ids[candidates])[:k]
+
+    def iter_nearest(self, lat, lon, chunk=MAX_FETCH_BATCH):
+        """Every indexed report, closest first, as lists of up to chunk (distance, id) pairs.
+
+        Only the distance and order arrays are held; the pairs are built a chunk at a time.
+        """
+        snapshot = self._snapshot()
+        if not self.vectorized:
+            ordered = sorted(self._iter_distances(lat, lon, snapshot))
+            for start in range(0, len(ordered), chunk):
+                yield ordered[start:start + chunk]
+            return
+        ids = snapshot[0]
+        d = self._distances(lat, lon, *snapshot[1:])
+        live = np.flatnonzero(~np.isnan(d))
+        order = live[np.lexsort((ids[live], d[live]))]
+        for start in range(0, len(order), chunk):
+            part = order[start:start + chunk]
+            yield list(zip(d[part].tolist(), ids[part].tolist()))
+
+    def _ordered(self, distances, ids):
+        order = np.lexsort((ids, distances))
+        return list(zip(distances[order].tolist(), ids[order].tolist()))
+
+    # ---- Row lookup ----
+
+    def rows(self, conn, matches, where=None, params=(), columns='*'):
+        """(distance, row) for matches whose report still exists and satisfies `where`.
+
+        Ids missing from the table were deleted elsewhere and are discarded.
+        """
+        if not matches:
+            return []
+        ids = [report_id for _, report_id in matches]
+        found = {}
+        for start in range(0, len(ids), MAX_FETCH_BATCH):
+            chunk = ids[start:start + MAX_FETCH_BATCH]
+            c = conn.execute("SELECT %s, (%s) AS _matches FROM incident_reports WHERE id IN (%s)"
+                             % (columns, where or "1", ','.join('?' * len(chunk))), list(params) + chunk)
+            found.update((row['id'], row) for row in c.fetchall())
+        results = []
+        for distance, report_id in matches:
+            row = found.get(report_id)
+            if row is None:
+                self.discard(report_id)
+            elif row['_matches']:
+                results.append((distance, row))
+        return results
+
+    def nearest_rows(self, conn, lat, lon, k, after=None, where=None, params=(), columns='*'):
+        """The k closest existing reports satisfying `where`, as (distance, row).
+
+        Widens the search geometrically while filters keep rejecting matches.
+        """
+        results = []
+        batch = k
+        while len(results) < k:
+            matches = self.nearest(lat, lon, batch, after)
+            if not matches:
+                break
+            results.extend(self.rows(conn, matches, where, params, columns))
+            if len(matches) < batch:
+                break
+            after = matches[-1]
+            batch = min(batch * 4, MAX_FETCH_BATCH)
+        return results[:k]
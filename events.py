@@ -0,0 +1,221 @@
+# Server-Sent Events for the feed.
+#
+# Clients subscribe with a location and radius; each subscription is registered
+# under the grid cells (see geo.py) its circle covers. Write paths publish a
+# delta for the report's cell and only subscribers registered there (plus the
+# few with very wide radii) are checked, so publishing never walks every
+# connection. Subscribers wait on their own queue with no polling; under the
+# default gevent worker (gunicorn.conf.py) that means thousands of idle streams
+# cost greenlets, not OS threads. Under GUNICORN_WORKER_CLASS=gthread every open
+# stream holds a thread, so admission control (class "stream") caps them much
+# lower; clients over the cap fall back to polling /feed.
+#
+# Each server process has its own broker, so publish() also queues the event for
+# the feed_events table. A relay thread per process appends the queued events in
+# one transaction every FEED_RELAY_INTERVAL seconds and tails rows other processes
+# wrote (seq > last seen), delivering them to its own subscribers. A write on any
+# worker therefore reaches every open stream within about one interval. Rows
+# older than FEED_EVENT_RETENTION seconds (at most twice that) are pruned.
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from db import connect
+from geo import cell_ranges, grid_cell, haversine_distance
+
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+# Streams end after this long and the browser reconnects (after the retry delay),
+# so a thread held by a stream is handed back regularly even if the client stays.
+FEED_STREAM_MAX_SECONDS = float(os.environ.get('FEED_STREAM_MAX_SECONDS', 300))
+FEED_RELAY_INTERVAL = float(os.environ.get('FEED_RELAY_INTERVAL', 0.25))  # 0: single process, no relay
+FEED_EVENT_RETENTION = float(os.environ.get('FEED_EVENT_RETENTION', 300))
+# Rows read from feed_events per query while catching up.
+RELAY_BATCH = 1000
+# Circles covering more cells than this are matched by distance on every publish instead.
+MAX_SUBSCRIBER_CELLS = 1024
+
+class Subscriber:
+    __slots__ = ('lat', 'lon', 'radius', 'cells', 'queue', 'overflowed')
+
+    def __init__(self, lat, lon, radius):
+        self.lat = lat
+        self.lon = lon
+        self.radius = radius
+        self.cells = None
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+class FeedBroker:
+    def __init__(self, database=None, interval=FEED_RELAY_INTERVAL, retention=FEED_EVENT_RETENTION):
+        self._by_cell = {}
+        self._wide = set()
+        self._lock = threading.Lock()
+        self.subscriber_count = 0
+        self.database = database
+        self.interval = interval
+        self.retention = retention
+        self._outbox = []
+        self._origin = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.relayed_out = 0
+        self.relayed_in = 0
+
+    def subscribe(self, lat, lon, radius):
+        sub = Subscriber(lat, lon, radius)
+        ranges = cell_ranges(lat, lon, radius)
+        if ranges is not None and sum(hi - lo + 1 for lo, hi in ranges) <= MAX_SUBSCRIBER_CELLS:
+            sub.cells = [cell for lo, hi in ranges for cell in range(lo, hi + 1)]
+        with self._lock:
+            if sub.cells is None:
+                self._wide.add(sub)
+            else:
+                for cell in sub.cells:
+                    self._by_cell.setdefault(cell, set()).add(sub)
+            self.subscriber_count += 1
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub.cells is None:
+                self._wide.discard(sub)
+            else:
+                for cell in sub.cells:
+                    subs = self._by_cell.get(cell)
+                    if subs is not None:
+                        subs.discard(sub)
+                        if not subs:
+                            del self._by_cell[cell]
+            self.subscriber_count -= 1
+
+    def publish(self, event, lat, lon, payload):
+        """Deliver an event about a report at (lat, lon) to every subscriber whose circle contains it.
+
+        Also queued for the other server processes when the relay is running.
+        """
+        if grid_cell(lat, lon) is None:
+            return 0
+        if self._thread is not None and not self._stop.is_set():
+            with self._lock:
+                self._outbox.append((event, lat, lon, json.dumps(payload)))
+        return self._deliver(event, lat, lon, payload)
+
+    def _deliver(self, event, lat, lon, payload):
+        """Hand an event to this process's matching subscribers."""
+        cell = grid_cell(lat, lon)
+        with self._lock:
+            candidates = list(self._by_cell.get(cell, ())) + list(self._wide)
+        delivered = 0
+        for sub in candidates:
+            distance = haversine_distance(sub.lat, sub.lon, lat, lon)
+            if distance > sub.radius:
+                continue
+            message = dict(payload, distance_miles=round(distance, 2))
+            try:
+                sub.queue.put_nowait((event, message))
+                delivered += 1
+            except queue.Full:
+                # A client this far behind gets told to reload instead of a partial history.
+                sub.overflowed = True
+        return delivered
+
+    # ---- Cross-process relay ----
+
+    def start(self):
+        if self.interval <= 0 or self.database is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        # Set here, after gunicorn forks, so every worker has its own origin.
+        self._origin = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="feed-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the relay after writing out any queued events, waiting at most timeout seconds."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        conn = connect(self.database)
+        try:
+            last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM feed_events").fetchone()[0]
+            # Every `retention` seconds, drop what was already there `retention` seconds ago
+            prune_at, prune_seq = time.monotonic() + self.retention, last_seq
+            while True:
+                stopping = self._stop.wait(self.interval)
+                try:
+                    self._write_outbox(conn)
+                    if stopping:
+                        return
+                    last_seq = self._read_events(conn, last_seq)
+                    if time.monotonic() >= prune_at:
+                        conn.execute("DELETE FROM feed_events WHERE seq <= ?", (prune_seq,))
+                        conn.commit()
+                        prune_at, prune_seq = time.monotonic() + self.retention, last_seq
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    if stopping or self._stop.is_set():
+                        print(f"Feed relay failed while stopping, dropping queued events: {e}")
+                        return
+                    print(f"Feed relay failed, will retry: {e}")
+        finally:
+            conn.close()
+
+    def _write_outbox(self, conn):
+        with self._lock:
+            batch, self._outbox = self._outbox, []
+        if not batch:
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO feed_events (origin, event, latitude, longitude, payload) "
+                             "VALUES (?, ?, ?, ?, ?)", [(self._origin,) + item for item in batch])
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            with self._lock:
+                self._outbox[:0] = batch
+            raise
+        self.relayed_out += len(batch)
+
+    def _read_events(self, conn, last_seq):
+        """Deliver rows other processes wrote after last_seq; returns the new last seq."""
+        while True:
+            rows = conn.execute("SELECT seq, origin, event, latitude, longitude, payload FROM feed_events "
+                                "WHERE seq > ? ORDER BY seq LIMIT %d" % RELAY_BATCH, (last_seq,)).fetchall()
+            for seq, origin, event, lat, lon, payload in rows:
+                if origin != self._origin:
+                    self._deliver(event, lat, lon, json.loads(payload))
+                    self.relayed_in += 1
+            if rows:
+                last_seq = rows[-1][0]
+            if len(rows) < RELAY_BATCH:
+                return last_seq
+
+    def stream(self, sub, heartbeat=HEARTBEAT_SECONDS, max_seconds=FEED_STREAM_MAX_SECONDS):
+        """Generator of SSE frames for one subscriber; unsubscribes when the client goes away or time runs out."""
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if sub.overflowed:
+                    sub.overflowed = False
+                    with sub.queue.mutex:
+                        sub.queue.queue.clear()
+                    yield "event: resync\ndata: {}\n\n"
+                try:
+                    event, message = sub.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "event: %s\ndata: %s\n\n" % (event, json.dumps(message))
+        finally:
+            self.unsubscribe(sub)
@@ -0,0 +1,116 @@
+# Shared response cache for the location queries (/feed, /reports/nearby).
+#
+# Callers in the same neighbourhood share one entry per (endpoint, grid cell of
+# the caller, radius). An entry holds the report rows from every grid cell a
+# caller anywhere in that cell could reach, so each request still does its own
+# exact distance filter. Rows are serialized once, on first use, and shared;
+# per-user fields (user_vote) are overlaid on copies rather than stored.
+#
+# Freshness comes from cell_versions, a per-cell counter that triggers on
+# incident_reports bump on every insert, update and delete (see db.py). Versions
+# only grow, so the sum over an entry's cells changes whenever any of them does.
+# That sum is checked with one indexed query per request, and it also feeds the
+# ETag, so it holds across worker processes without any cross-process messages.
+from collections import OrderedDict
+import hashlib
+import math
+import os
+import threading
+
+from geo import CELL_DEG, MILES_PER_DEGREE_LAT, _cell_col, _cell_row, cell_ranges, haversine_many
+
+FEED_CACHE_MAX_ENTRIES = int(os.environ.get('FEED_CACHE_MAX_ENTRIES', 1024))
+# Bound on cached reports across all entries; least recently used entries go first.
+FEED_CACHE_MAX_ROWS = int(os.environ.get('FEED_CACHE_MAX_ROWS', 200000))
+
+class CacheEntry:
+    __slots__ = ('version', 'lats', 'lons', 'rows', 'reports')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.lats = [row['location_latitude'] for row in rows]
+        self.lons = [row['location_longitude'] for row in rows]
+        self.rows = rows
+        # Report dicts are built the first time a request returns the row, then shared.
+        self.reports = {}
+
+    def within(self, lat, lon, radius_miles, serialize):
+        """(distance, report dict) for cached reports within radius of (lat, lon), closest first."""
+        distances = haversine_many(lat, lon, self.lats, self.lons)
+        hits = [(d, i) for i, d in enumerate(distances) if d <= radius_miles]
+        hits.sort()
+        results = []
+        for d, i in hits:
+            report = self.reports.get(i)
+            if report is None:
+                report = self.reports[i] = serialize(self.rows[i])
+            results.append((d, report))
+        return results
+
+class FeedCache:
+    def __init__(self, max_entries=FEED_CACHE_MAX_ENTRIES, max_rows=FEED_CACHE_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def cover(self, lat, lon, radius_miles):
+        """(key cell, grid_cell ranges) reachable from anywhere in the caller's cell, or None if too wide."""
+        row, col = _cell_row(lat), _cell_col(lon)
+        center_lat = (row + 0.5) * CELL_DEG - 90.0
+        center_lon = (col + 0.5) * CELL_DEG - 180.0
+        # Half the cell's diagonal; longitude degrees are never longer than latitude degrees.
+        pad = CELL_DEG * MILES_PER_DEGREE_LAT * math.sqrt(0.5)
+        ranges = cell_ranges(center_lat, center_lon, radius_miles + pad)
+        if ranges is None:
+            return None
+        return (row, col), ranges
+
+    def version(self, conn, ranges):
+        if not ranges:
+            return 0  # no cells, so nothing can ever change
+        where = " OR ".join(["cell BETWEEN ? AND ?"] * len(ranges))
+        row = conn.execute("SELECT COALESCE(SUM(version), 0) FROM cell_versions WHERE " + where,
+                           [bound for r in ranges for bound in r]).fetchone()
+        return row[0]
+
+    def etag(self, *parts):
+        return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def note_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def put(self, key, version, rows):
+        entry = CacheEntry(version, rows)
+        if len(rows) > self.max_rows:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._rows -= len(old.rows)
+            self._entries[key] = entry
+            self._rows += len(rows)
+            while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= len(evicted.rows)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "rows": self._rows, "hits": self.hits,
+                    "misses": self.misses, "not_modified": self.not_modified}
@@ -9,6 +9,7 @@ function MapPage() {
   const userMarkerRef = useRef(null);
   const reportMarkersRef = useRef([]);
   const notifiedReportIdsRef = useRef(new Set());
+  const feedStreamOpenRef = useRef(false);
 
   const [status, setStatus] = useState('Ready.');
   const [formOpen, setFormOpen] = useState(false);
@@ -75,7 +76,30 @@ function MapPage() {
     reportMarkersRef.current = [];
   }, []);
 
-  const updateReportMarkers = useCallback((reports) => {
+  const clusterElement = useCallback((cluster) => {
+    const el = document.createElement('button');
+    const size = Math.min(24 + Math.log2(cluster.count) * 6, 64);
+    const sev = cluster.severity || {};
+    el.type = 'button';
+    el.textContent = cluster.count >= 1000 ? `${Math.round(cluster.count / 100) / 10}k` : String(cluster.count);
+    el.title = `${cluster.count} reports: ${sev.critical || 0} critical, ${sev.high || 0} high, ${sev.medium || 0} medium, ${sev.low || 0} low`;
+    el.setAttribute('aria-label', el.title);
+    el.style.cssText = `
+      width: ${size}px;
+      height: ${size}px;
+      border-radius: 50%;
+      border: 2px solid white;
+      background: ${(sev.critical || 0) + (sev.high || 0) > cluster.count / 2 ? '#c0392b' : '#e67e22'};
+      color: white;
+      font-weight: bold;
+      font-size: 12px;
+      cursor: pointer;
+      box-shadow: 0 1px 4px rgba(0,0,0,0.4);
+    `;
+    return el;
+  }, []);
+
+  const updateReportMarkers = useCallback((reports, clusters) => {
     if (!mapRef.current) return;
     clearReportMarkers();
     (reports || []).forEach((report) => {
@@ -87,14 +111,32 @@ function MapPage() {
         .addTo(mapRef.current);
       reportMarkersRef.current.push(markerItem);
     });
-  }, [clearReportMarkers, reportPopupHtml]);
+    (clusters || []).forEach((cluster) => {
+      const el = clusterElement(cluster);
+      el.addEventListener('click', (e) => {
+        e.stopPropagation();
+        mapRef.current.flyTo({ center: [cluster.longitude, cluster.latitude], zoom: mapRef.current.getZoom() + 2 });
+      });
+      const markerItem = new maplibregl.Marker({ element: el })
+        .setLngLat([cluster.longitude, cluster.latitude])
+        .addTo(mapRef.current);
+      reportMarkersRef.current.push(markerItem);
+    });
+  }, [clearReportMarkers, clusterElement, reportPopupHtml]);
 
+  // Markers for the visible map only: the server sends clusters at low zoom, reports up close.
   const refreshReportMarkers = useCallback(async () => {
+    if (!mapRef.current) return;
+    const bounds = mapRef.current.getBounds();
+    const params = new URLSearchParams({
+      bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(','),
+      zoom: String(mapRef.current.getZoom()),
+    });
     try {
-      const res = await fetch('/reports', { credentials: 'same-origin' });
+      const res = await fetch(`/reports/viewport?${params}`, { credentials: 'same-origin' });
       if (res.ok) {
-        const reports = await res.json();
-        updateReportMarkers(reports);
+        const data = await res.json();
+        updateReportMarkers(data.reports, data.clusters);
       }
     } catch (err) {}
   }, [updateReportMarkers]);
@@ -246,6 +288,14 @@ function MapPage() {
     }
   }, [coords]);
 
+  const updateFeedReport = useCallback((reportId, changes) => {
+    setFeedItems((items) => items.map((item) => (
+      item.report && item.report.id === reportId
+        ? { ...item, report: { ...item.report, ...changes } }
+        : item
+    )));
+  }, []);
+
   const voteReport = useCallback(async (reportId, vote) => {
     try {
       const res = await fetch(`/reports/${reportId}/vote`, {
@@ -254,9 +304,13 @@ function MapPage() {
         credentials: 'same-origin',
         body: JSON.stringify({ vote }),
       });
-      if (res.ok) fetchFeed();
+      if (res.ok) {
+        const data = await res.json().catch(() => null);
+        if (data) updateFeedReport(reportId, data);
+        else fetchFeed();
+      }
     } catch (err) {}
-  }, [fetchFeed]);
+  }, [fetchFeed, updateFeedReport]);
 
   const verifyReport = useCallback(async (reportId) => {
     try {
@@ -264,7 +318,7 @@ function MapPage() {
         method: 'POST',
         credentials: 'same-origin',
       });
-      if (res.ok) fetchFeed();
+      if (res.ok && !feedStreamOpenRef.current) fetchFeed();
     } catch (err) {}
   }, [fetchFeed]);
 
@@ -276,7 +330,7 @@ function MapPage() {
         credentials: 'same-origin',
       });
       if (res.ok) {
-        fetchFeed();
+        if (!feedStreamOpenRef.current) fetchFeed();
         refreshReportMarkers();
       }
     } catch (err) {}
@@ -350,8 +404,11 @@ function MapPage() {
             .setPopup(new maplibregl.Popup().setHTML('<strong>You are here</strong>'))
             .addTo(mapRef.current);
         }
+        refreshReportMarkers();
       });
 
+      mapRef.current.on('moveend', () => refreshReportMarkers());
+
       mapRef.current.on('click', (e) => {
         const clicked = {
           latitude: e.lngLat.lat,
@@ -367,7 +424,7 @@ function MapPage() {
     };
 
     initMap();
-  }, [apiKey, coords, fetchFeed, formOpen, getCoords, setMarker]);
+  }, [apiKey, coords, fetchFeed, formOpen, getCoords, refreshReportMarkers, setMarker]);
 
   useEffect(() => {
     loadUser();
@@ -381,9 +438,69 @@ function MapPage() {
     checkNearbyReports();
   }, [checkNearbyReports, coords, fetchFeed, refreshReportMarkers]);
 
+  // Live feed deltas over SSE; the 30s poll below only refetches while the stream is down.
+  useEffect(() => {
+    if (!coords || !coords.latitude || !coords.longitude || !('EventSource' in window)) return undefined;
+    const params = new URLSearchParams({
+      latitude: coords.latitude,
+      longitude: coords.longitude,
+      radius_miles: 0.5,
+    });
+    const source = new EventSource(`/feed/stream?${params.toString()}`, { withCredentials: true });
+    const parse = (e) => {
+      try {
+        return JSON.parse(e.data);
+      } catch (err) {
+        return null;
+      }
+    };
+    source.onopen = () => { feedStreamOpenRef.current = true; };
+    source.onerror = () => { feedStreamOpenRef.current = false; };
+    source.addEventListener('report_created', (e) => {
+      const data = parse(e);
+      if (!data || !data.report) return;
+      setFeedItems((items) => {
+        if (items.some((item) => item.report && item.report.id === data.report_id)) return items;
+        const next = [...items, { distance_miles: data.distance_miles, report: data.report }];
+        next.sort((a, b) => a.distance_miles - b.distance_miles);
+        return next;
+      });
+      setFeedMessage('');
+      refreshReportMarkers();
+    });
+    source.addEventListener('report_voted', (e) => {
+      const data = parse(e);
+      if (!data) return;
+      updateFeedReport(data.report_id, {
+        vote_score: data.vote_score,
+        upvote_count: data.upvote_count,
+        downvote_count: data.downvote_count,
+      });
+    });
+    source.addEventListener('report_corroborated', (e) => {
+      const data = parse(e);
+      if (data) updateFeedReport(data.report_id, { corroboration_count: data.corroboration_count });
+    });
+    source.addEventListener('report_verified', (e) => {
+      const data = parse(e);
+      if (data) updateFeedReport(data.report_id, { verified: true });
+    });
+    source.addEventListener('report_deleted', (e) => {
+      const data = parse(e);
+      if (!data) return;
+      setFeedItems((items) => items.filter((item) => !item.report || item.report.id !== data.report_id));
+      refreshReportMarkers();
+    });
+    source.addEventListener('resync', () => fetchFeed());
+    return () => {
+      feedStreamOpenRef.current = false;
+      source.close();
+    };
+  }, [coords, fetchFeed, refreshReportMarkers, updateFeedReport]);
+
   useEffect(() => {
     const feedInterval = window.setInterval(() => {
-      fetchFeed();
+      if (!feedStreamOpenRef.current) fetchFeed();
       refreshReportMarkers();
     }, 30000);
     return () => window.clearInterval(feedInterval);
@@ -452,7 +569,9 @@ function MapPage() {
       const body = await res.json().catch(() => ({}));
       if (!res.ok) throw new Error(`HTTP ${res.status}: ${JSON.stringify(body)}`);
 
-      setStatus('Submitted ✅ (report saved)');
+      setStatus(body.merged
+        ? `Submitted ✅ (added to an existing nearby report, ${body.corroboration_count + 1} reports)`
+        : 'Submitted ✅ (report saved)');
       closeForm();
       checkNearbyReports();
       fetchFeed();
@@ -583,6 +702,9 @@ function MapPage() {
                     {badgeText}
                   </span>
                   <strong>{(report.severity || '').toLowerCase()}</strong> · {distance_miles} mi
+                  {report.corroboration_count > 0 && (
+                    <span className="ml-2 text-[11px] text-gray-500">+{report.corroboration_count} similar</span>
+                  )}
                   <div className="mt-1 text-[11px] text-gray-500">🕐 {formatReportDateTime(report.date, report.created_at)}</div>
                   {addr && (
                     <div className="mt-1 text-[11px] text-gray-500" title={addr}>
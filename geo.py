@@ -0,0 +1,164 @@
+# Geographic helpers: distance math and the grid-cell spatial index used by
+# incident_reports.grid_cell.
+#
+# The globe is cut into CELL_DEG x CELL_DEG cells numbered row-major from
+# (-90, -180), so every latitude row of cells is a contiguous integer range.
+# A radius query becomes a handful of `grid_cell BETWEEN lo AND hi` ranges
+# (one per row the search box touches), each answered by the B-tree index.
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional: distance math falls back to pure Python
+    np = None
+
+EARTH_RADIUS_MILES = 3959
+MILES_PER_DEGREE_LAT = 69.0
+CELL_DEG = 0.01
+CELLS_PER_ROW = int(round(360 / CELL_DEG))
+CELL_ROWS = int(round(180 / CELL_DEG))
+# Beyond this many rows the range list stops paying for itself; fall back to a scan.
+MAX_CELL_ROWS = 200
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return c * EARTH_RADIUS_MILES
+
+# Below this many points the NumPy call overhead costs more than the loop.
+VECTORIZE_MIN_POINTS = 32
+
+def haversine_many(lat, lon, lats, lons):
+    """Distances in miles from (lat, lon) to each (lats[i], lons[i]), as a list."""
+    if np is None or len(lats) < VECTORIZE_MIN_POINTS:
+        return [haversine_distance(lat, lon, lat2, lon2) for lat2, lon2 in zip(lats, lons)]
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    sin_dlat = np.sin((lat2 - lat1) * 0.5)
+    sin_dlon = np.sin((lon2 - lon1) * 0.5)
+    a = sin_dlat * sin_dlat + math.cos(lat1) * np.cos(lat2) * sin_dlon * sin_dlon
+    return (2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+
+def _cell_row(lat):
+    return min(max(int(math.floor((lat + 90.0) / CELL_DEG)), 0), CELL_ROWS - 1)
+
+def _cell_col(lon):
+    return min(max(int(math.floor((lon + 180.0) / CELL_DEG)), 0), CELLS_PER_ROW - 1)
+
+def grid_cell(lat, lon):
+    """Grid cell id for a coordinate, or None when the location is unknown."""
+    if lat is None or lon is None:
+        return None
+    try:
+        return _cell_row(float(lat)) * CELLS_PER_ROW + _cell_col(float(lon))
+    except (TypeError, ValueError):
+        return None
+
+def bounding_box(lat, lon, radius_miles):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_miles."""
+    dlat = radius_miles / MILES_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 89.9)))
+    dlon = min(radius_miles / (MILES_PER_DEGREE_LAT * max(cos_lat, 1e-6)), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def cell_ranges(lat, lon, radius_miles):
+    """Inclusive grid_cell ranges covering the circle, or None if too wide to be useful."""
+    return box_cell_ranges(*bounding_box(lat, lon, radius_miles))
+
+def box_cell_ranges(min_lat, max_lat, min_lon, max_lon):
+    """Inclusive grid_cell ranges covering a box, or None if too tall to be useful.
+
+    Longitudes may run past +/-180 for boxes that cross the antimeridian.
+    """
+    row_lo, row_hi = _cell_row(min_lat), _cell_row(max_lat)
+    if row_hi - row_lo + 1 > MAX_CELL_ROWS:
+        return None
+    # Boxes crossing the antimeridian are split into two column spans.
+    if min_lon < -180.0 or max_lon > 180.0:
+        if max_lon - min_lon >= 360.0:
+            spans = [(0, CELLS_PER_ROW - 1)]
+        elif min_lon < -180.0:
+            spans = [(_cell_col(min_lon + 360.0), CELLS_PER_ROW - 1), (0, _cell_col(max_lon))]
+        else:
+            spans = [(_cell_col(min_lon), CELLS_PER_ROW - 1), (0, _cell_col(max_lon - 360.0))]
+    else:
+        spans = [(_cell_col(min_lon), _cell_col(max_lon))]
+    ranges = []
+    for row in range(row_lo, row_hi + 1):
+        base = row * CELLS_PER_ROW
+        for col_lo, col_hi in spans:
+            ranges.append((base + col_lo, base + col_hi))
+    return ranges
+
+def candidate_rows(conn, lat, lon, radius_miles, columns='*'):
+    """incident_reports rows in the grid cells covering the circle (a superset of the answer)."""
+    return rows_in_cells(conn, cell_ranges(lat, lon, radius_miles), columns)
+
+def rows_in_cells(conn, ranges, columns='*'):
+    """incident_reports rows whose grid_cell falls in the ranges (None means every located row)."""
+    if ranges == []:
+        return []
+    if ranges is None:
+        where = "location_latitude IS NOT NULL AND location_longitude IS NOT NULL"
+        params = []
+    else:
+        where = " OR ".join(["grid_cell BETWEEN ? AND ?"] * len(ranges))
+        params = [bound for r in ranges for bound in r]
+    c = conn.cursor()
+    c.execute("SELECT %s FROM incident_reports WHERE %s" % (columns, where), params)
+    return c.fetchall()
+
+def within_radius(rows, lat, lon, radius_miles):
+    """(distance, row) for rows within radius_miles of (lat, lon), closest first."""
+    located = [row for row in rows
+               if row['location_latitude'] is not None and row['location_longitude'] is not None]
+    distances = haversine_many(lat, lon, [row['location_latitude'] for row in located],
+                               [row['location_longitude'] for row in located])
+    results = [(distance, row) for distance, row in zip(distances, located) if distance <= radius_miles]
+    results.sort(key=lambda x: x[0])
+    return results
+
+# ---- Map clustering ----
+# map_clusters holds per-cell aggregates (count, severity breakdown, coordinate
+# sums for the centroid) at one level per CLUSTER_ZOOMS entry. A level's cells
+# are about 64px across at its zoom (a 256px tile spans 360 / 2**zoom degrees).
+# Triggers in db.py maintain every level; changing these needs a new migration.
+CLUSTER_ZOOMS = (2, 4, 6, 8, 10, 12, 14)
+CLUSTER_SEVERITIES = ('low', 'medium', 'high', 'critical')
+
+def cluster_cell_size(level_zoom):
+    return 90.0 / 2 ** level_zoom
+
+def cluster_level(zoom):
+    """The CLUSTER_ZOOMS level to draw at a map zoom."""
+    level = CLUSTER_ZOOMS[0]
+    for level_zoom in CLUSTER_ZOOMS:
+        if level_zoom <= zoom:
+            level = level_zoom
+    return level
+
+def cluster_cell(level_zoom, lat, lon):
+    """(row, col) of a coordinate at a cluster level; int() matches SQLite's CAST in the triggers."""
+    size = cluster_cell_size(level_zoom)
+    return int((lat + 90.0) / size), int((lon + 180.0) / size)
+
+# ---- Hotspots ----
+# hotspot_counters holds, per grid cell and per HOTSPOT_BUCKET_SECONDS of
+# created_at, the number of reports and their severity-weighted sum. Triggers in
+# db.py maintain it; changing these needs a new migration (or rebuild-hotspots).
+HOTSPOT_BUCKET_SECONDS = 3600
+HOTSPOT_SEVERITY_WEIGHTS = {'low': 1, 'medium': 2, 'high': 4, 'critical': 8}
+# Longest recent_hours and baseline_hours /hotspots accepts. Buckets older than
+# both windows together are pruned (see the hotspot migrations in db.py).
+HOTSPOT_MAX_HOURS = 24 * 90
+HOTSPOT_RETENTION_BUCKETS = 2 * HOTSPOT_MAX_HOURS * 3600 // HOTSPOT_BUCKET_SECONDS
+
+def cell_bounds(cell):
+    """(min_lat, min_lon, max_lat, max_lon) of a grid cell."""
+    row, col = divmod(cell, CELLS_PER_ROW)
+    min_lat, min_lon = row * CELL_DEG - 90.0, col * CELL_DEG - 180.0
+    return min_lat, min_lon, min_lat + CELL_DEG, min_lon + CELL_DEG
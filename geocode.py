@@ -0,0 +1,467 @@
+# Reverse geocoding (lat/lon -> closest address via Nominatim), done off the request path.
+#
+# Request handlers only enqueue jobs; a single daemon thread per process drains
+# the queue in batches on its own event loop and writes the results to
+# incident_reports.location_address. Until then readers show the coordinates.
+# Requests go through AsyncGeocodeClient: a token bucket paces them, and
+# Nominatim's one-request-per-second policy is enforced across every worker
+# process by a SharedRateLimiter slot in the database. Lookups go through
+# GeocodeCache first, and concurrent lookups of the same rounded coordinate
+# share one in-flight request. backfill() reuses the same pieces for the
+# `flask geocode-backfill` command.
+from collections import OrderedDict
+import asyncio
+import json
+import os
+import queue
+import ssl
+import threading
+import time
+import urllib.parse
+
+from coordination import SharedRateLimiter
+from db import connect
+
+NOMINATIM_URL = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org')
+GEOCODE_MIN_INTERVAL = float(os.environ.get('GEOCODE_MIN_INTERVAL', 1.1))
+USER_AGENT = "IncidentReportApp/1.0"
+
+# Cache keys round coordinates to this many decimal places (4 ~= 11 m).
+GEOCODE_CACHE_PRECISION = int(os.environ.get('GEOCODE_CACHE_PRECISION', 4))
+GEOCODE_CACHE_TTL = float(os.environ.get('GEOCODE_CACHE_TTL', 30 * 24 * 3600))
+GEOCODE_CACHE_MEMORY_SIZE = int(os.environ.get('GEOCODE_CACHE_MEMORY_SIZE', 2048))
+GEOCODE_CACHE_MAX_ROWS = int(os.environ.get('GEOCODE_CACHE_MAX_ROWS', 100000))
+
+def placeholder_address(lat, lon):
+    return "%.5f, %.5f" % (lat, lon)
+
+def format_address(data, lat, lon):
+    addr = data.get("address") or {}
+    parts = [
+        addr.get("road") or addr.get("footway"),
+        addr.get("house_number"),
+        addr.get("suburb") or addr.get("neighbourhood") or addr.get("village") or addr.get("town") or addr.get("city"),
+        addr.get("state"),
+        addr.get("country"),
+    ]
+    display = ", ".join(p for p in parts if p)
+    return display or data.get("display_name") or placeholder_address(lat, lon)
+
+async def _get_json(url, timeout):
+    """GET url on the running event loop and decode the JSON body. Raises on network, HTTP or decode errors."""
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=ssl.create_default_context() if secure else None),
+        timeout)
+    try:
+        writer.write(("GET %s HTTP/1.0\r\nHost: %s\r\nUser-Agent: %s\r\nAccept: application/json\r\n"
+                      "Connection: close\r\n\r\n" % (path, parts.netloc, USER_AGENT)).encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = head.split(b"\r\n", 1)[0].split()
+    if len(status) < 2 or status[1] != b"200":
+        raise OSError("Nominatim returned %s" % head.split(b"\r\n", 1)[0].decode(errors='replace'))
+    return json.loads(body.decode())
+
+class TokenBucket:
+    """Up to `burst` requests at once, refilled at one token per `interval` seconds.
+
+    acquire() reserves its token before awaiting, so concurrent callers on one
+    event loop queue up in order without a lock.
+    """
+
+    def __init__(self, interval, burst=1):
+        self.interval = interval
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        """Wait for a token. Returns the seconds waited."""
+        if self.interval <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        wait = -self._tokens * self.interval
+        await asyncio.sleep(wait)
+        return wait
+
+class AsyncGeocodeClient:
+    """Reverse lookups on asyncio, paced by a TokenBucket.
+
+    Concurrent lookups that round to the same cache key share one in-flight
+    request. With `database` set, every request also takes a SharedRateLimiter
+    slot so several processes stay under Nominatim's limit together.
+    """
+
+    def __init__(self, base_url=None, min_interval=GEOCODE_MIN_INTERVAL, burst=1, timeout=5,
+                 precision=GEOCODE_CACHE_PRECISION, database=None):
+        self.base_url = base_url
+        self.bucket = TokenBucket(min_interval, burst)
+        self.timeout = timeout
+        self.precision = precision
+        self.database = database
+        self._inflight = {}
+        self._limiter = SharedRateLimiter('nominatim')
+        self._limiter_conn = None
+        self._limiter_lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.sleep_seconds = 0.0
+        self.network_seconds = 0.0
+
+    @property
+    def min_interval(self):
+        return self.bucket.interval
+
+    @min_interval.setter
+    def min_interval(self, value):
+        self.bucket.interval = value
+
+    def key(self, lat, lon):
+        return "%.*f,%.*f" % (self.precision, float(lat), self.precision, float(lon))
+
+    async def reverse(self, lat, lon):
+        """Address for (lat, lon). Raises on network or decode errors."""
+        key = self.key(lat, lon)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(lat, lon))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: one caller being cancelled must not cancel the request for the others.
+        return await asyncio.shield(task)
+
+    async def _fetch(self, lat, lon):
+        self.sleep_seconds += await self.bucket.acquire()
+        if self.database is not None:
+            self.sleep_seconds += await asyncio.get_running_loop().run_in_executor(None, self._reserve_shared)
+        query = urllib.parse.urlencode({"lat": lat, "lon": lon, "format": "json"})
+        url = "%s/reverse?%s" % ((self.base_url or NOMINATIM_URL).rstrip('/'), query)
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            data = await _get_json(url, self.timeout)
+        finally:
+            self.network_seconds += time.perf_counter() - started
+        return format_address(data, lat, lon)
+
+    def _reserve_shared(self):
+        # Runs in an executor thread; the lock keeps reservations on the one connection in turn.
+        with self._limiter_lock:
+            if self._limiter_conn is None:
+                self._limiter_conn = connect(self.database)
+            return self._limiter.acquire(self._limiter_conn, self.bucket.interval)
+
+    def close(self):
+        with self._limiter_lock:
+            if self._limiter_conn is not None:
+                self._limiter_conn.close()
+                self._limiter_conn = None
+
+class GeocodeCache:
+    """Two-tier address cache keyed by quantized lat/lon.
+
+    An in-process LRU sits in front of the geocode_cache table (created by a
+    db.MIGRATIONS step).
+    Entries expire after ttl seconds; the table is trimmed oldest-first to max_rows.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, precision=GEOCODE_CACHE_PRECISION, ttl=GEOCODE_CACHE_TTL,
+                 memory_size=GEOCODE_CACHE_MEMORY_SIZE, max_rows=GEOCODE_CACHE_MAX_ROWS):
+        self.precision = precision
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def key(self, lat, lon):
+        return "%.*f,%.*f" % (self.precision, float(lat), self.precision, float(lon))
+
+    def _remember(self, key, address, created_at):
+        with self._lock:
+            self._memory[key] = (address, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, conn, lat, lon):
+        """Cached address for the coordinate, or None. Never does network I/O."""
+        key = self.key(lat, lon)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+        row = conn.execute("SELECT address, created_at FROM geocode_cache WHERE key = ? AND created_at > ?",
+                           (key, now - self.ttl)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.db_hits += 1
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, conn, lat, lon, address, commit=True):
+        key = self.key(lat, lon)
+        now = time.time()
+        self._remember(key, address, now)
+        conn.execute("INSERT OR REPLACE INTO geocode_cache (key, address, created_at) VALUES (?, ?, ?)",
+                     (key, address, now))
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self.evict(conn, now)
+        if commit:
+            conn.commit()
+
+    def evict(self, conn, now=None):
+        """Drop expired rows, then the oldest rows beyond max_rows."""
+        now = time.time() if now is None else now
+        conn.execute("DELETE FROM geocode_cache WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute("""DELETE FROM geocode_cache WHERE key IN (
+                            SELECT key FROM geocode_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)""",
+                     (self.max_rows,))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "precision": self.precision,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else None,
+            }
+
+# Jobs taken off the queue per event-loop pass; they are looked up concurrently.
+GEOCODE_WORKER_BATCH = int(os.environ.get('GEOCODE_WORKER_BATCH', 64))
+
+class GeocodeWorker:
+    """Queue of (report_id, lat, lon) jobs drained by one rate-limited background thread."""
+
+    def __init__(self, database, cache=None, base_url=None, min_interval=GEOCODE_MIN_INTERVAL):
+        self.database = database
+        self.cache = cache
+        self.client = AsyncGeocodeClient(base_url, min_interval,
+                                         precision=cache.precision if cache else GEOCODE_CACHE_PRECISION)
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        # False drops new jobs (the tests replay requests without looking anything up).
+        self.enabled = True
+        # Counters for /metrics; the request-side ones live on the client.
+        self.failures = 0
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+    @base_url.setter
+    def base_url(self, value):
+        self.client.base_url = value
+
+    @property
+    def min_interval(self):
+        return self.client.min_interval
+
+    @min_interval.setter
+    def min_interval(self, value):
+        self.client.min_interval = value
+
+    @property
+    def requests(self):
+        return self.client.requests
+
+    @property
+    def coalesced(self):
+        return self.client.coalesced
+
+    @property
+    def sleep_seconds(self):
+        return self.client.sleep_seconds
+
+    @property
+    def network_seconds(self):
+        return self.client.network_seconds
+
+    def enqueue(self, report_id, lat, lon):
+        """Schedule a lookup; repeat requests for a report already queued are ignored."""
+        if lat is None or lon is None or not self.enabled:
+            return False
+        with self._lock:
+            if report_id in self._pending:
+                return False
+            self._pending.add(report_id)
+        self._queue.put((report_id, lat, lon))
+        self.start()
+        return True
+
+    def enqueue_many(self, jobs):
+        """Schedule (report_id, lat, lon) lookups in one pass; used by bulk ingestion."""
+        if not self.enabled:
+            return 0
+        fresh = []
+        with self._lock:
+            for report_id, lat, lon in jobs:
+                if lat is None or lon is None or report_id in self._pending:
+                    continue
+                self._pending.add(report_id)
+                fresh.append((report_id, lat, lon))
+        for job in fresh:
+            self._queue.put(job)
+        if fresh:
+            self.start()
+        return len(fresh)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="geocode-worker", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the worker to exit once it reaches the end of the current queue."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Block until every queued job has been processed."""
+        self._queue.join()
+
+    def _run(self):
+        # The blocking queue.get() stays on this plain daemon thread; only the
+        # lookups for a batch run on the loop.
+        conn = connect(self.database)
+        self.client.database = self.database
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while batch[-1] is not None and len(batch) < GEOCODE_WORKER_BATCH:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                jobs = [job for job in batch if job is not None]
+                try:
+                    loop.run_until_complete(self._lookup_all(conn, jobs))
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if batch[-1] is None:
+                    return
+        finally:
+            loop.close()
+            self.client.close()
+            conn.close()
+
+    async def _lookup_all(self, conn, jobs):
+        await asyncio.gather(*(self._lookup(conn, *job) for job in jobs))
+
+    async def _lookup(self, conn, report_id, lat, lon):
+        try:
+            address = self.cache.get(conn, lat, lon) if self.cache else None
+            if address is None:
+                address = await self.client.reverse(lat, lon)
+                if self.cache:
+                    self.cache.put(conn, lat, lon, address)
+            conn.execute("UPDATE incident_reports SET location_address = ? WHERE id = ?",
+                         (address, report_id))
+            conn.commit()
+        except Exception as e:
+            self.failures += 1
+            # Leave the address NULL; the next read re-enqueues it.
+            print(f"Geocode failed for report {report_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(report_id)
+
+# ---- Backfill ----
+
+GEOCODE_BACKFILL_BATCH = int(os.environ.get('GEOCODE_BACKFILL_BATCH', 100))
+# Served by the partial index over reports still waiting for an address.
+BACKFILL_BATCH_SQL = ("SELECT id, location_latitude, location_longitude FROM incident_reports "
+                      "WHERE location_address IS NULL AND id > ? "
+                      "AND location_latitude IS NOT NULL AND location_longitude IS NOT NULL ORDER BY id LIMIT ?")
+
+async def backfill(conn, client, cache=None, batch_size=GEOCODE_BACKFILL_BATCH, limit=None, progress=None):
+    """Geocode every located report whose location_address is NULL.
+
+    Rows are read in id order, batch_size at a time; each batch is looked up
+    concurrently and written back with one executemany UPDATE. Only NULL rows
+    are read, so an interrupted run resumes where it stopped. progress(stats)
+    is called after every batch. Returns the final stats dict.
+    """
+    total = conn.execute("SELECT COUNT(*) FROM incident_reports WHERE location_address IS NULL "
+                         "AND location_latitude IS NOT NULL AND location_longitude IS NOT NULL").fetchone()[0]
+    if limit is not None:
+        total = min(total, limit)
+    stats = {"total": total, "done": 0, "cached": 0, "failed": 0, "started": time.monotonic()}
+    last_id = 0
+    while stats["done"] + stats["failed"] < total:
+        rows = conn.execute(BACKFILL_BATCH_SQL,
+                            (last_id, min(batch_size, total - stats["done"] - stats["failed"]))).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        async def lookup(lat, lon):
+            address = cache.get(conn, lat, lon) if cache else None
+            if address is not None:
+                stats["cached"] += 1
+                return address, False
+            return await client.reverse(lat, lon), True
+
+        results = await asyncio.gather(*(lookup(row[1], row[2]) for row in rows), return_exceptions=True)
+        # Nothing is written while lookups are in flight: an open write transaction
+        # here would block the SharedRateLimiter reservations they are waiting on.
+        updates = []
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                stats["failed"] += 1
+                print(f"Geocode failed for report {row[0]}: {result}")
+                continue
+            address, fetched = result
+            if fetched and cache:
+                cache.put(conn, row[1], row[2], address, commit=False)
+            updates.append((address, row[0]))
+        conn.executemany("UPDATE incident_reports SET location_address = ? WHERE id = ?", updates)
+        conn.commit()
+        stats["done"] += len(updates)
+        if progress is not None:
+            progress(stats)
+    return stats
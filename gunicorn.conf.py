@@ -0,0 +1,37 @@
+# gunicorn -c gunicorn.conf.py
+#
+# Settings come from the environment so one file serves every deployment:
+# PORT, WEB_CONCURRENCY (worker processes), GUNICORN_WORKER_CLASS,
+# GUNICORN_WORKER_CONNECTIONS (gevent) and GUNICORN_THREADS (gthread).
+# Workers share state only through the database (see coordination.py), so any
+# number of them can run against one DATABASE_PATH.
+import os
+
+wsgi_app = 'wsgi:app'
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# The default gevent worker (needs the gevent package) serves each request on a
+# greenlet, so an open /feed/stream costs a greenlet rather than a thread; up to
+# GUNICORN_WORKER_CONNECTIONS per worker. Admission control caps open streams at
+# half of that (ADMISSION_LIMITS stream=). SQLite calls still block the whole
+# worker while they run, which is why the other classes keep thread-sized limits.
+# GUNICORN_WORKER_CLASS=gthread goes back to a thread per request and
+# GUNICORN_THREADS // 4 streams.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+if worker_class == 'gevent':
+    # Before on_starting imports main: its locks and queues must be the cooperative ones.
+    from gevent import monkey
+    monkey.patch_all()
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))  # gthread only
+timeout = 60
+graceful_timeout = 30
+# Background threads (geocoder, archiver) must start in each worker, not the master.
+preload_app = False
+
+def on_starting(server):
+    """Migrate once in the master before any worker imports the app."""
+    from coordination import init_lock
+    import main
+    with init_lock(main.DATABASE):
+        main.init_db()
@@ -0,0 +1,74 @@
+# Hotspot detection from rolling per-cell counters.
+#
+# hotspot_counters (db.py) holds one row per (grid cell, hour of created_at)
+# with the report count and a severity-weighted sum (geo.HOTSPOT_SEVERITY_WEIGHTS;
+# each corroboration counts as one more report of the same severity, in the
+# canonical report's hour). Triggers on incident_reports keep it current, so
+# every submit, delete, merge, split and archive costs one or two row updates
+# and nothing here ever reads incident_reports. Buckets older than
+# HOTSPOT_RETENTION_BUCKETS (twice the longest window /hotspots accepts) are
+# deleted whenever a new counter row is written.
+#
+# A cell is hot when its weight per hour over the last recent_hours (the current
+# partial hour included) is at least HOTSPOT_MIN_RATIO times its weight per hour
+# over the baseline_hours before that. Baselines below HOTSPOT_BASELINE_FLOOR are
+# raised to it, so a single report in an otherwise quiet cell is not "infinitely"
+# hot; HOTSPOT_MIN_WEIGHT drops cells with too little recent activity to matter.
+import os
+import time
+
+from geo import HOTSPOT_BUCKET_SECONDS, cell_bounds
+
+HOTSPOT_RECENT_HOURS = int(os.environ.get('HOTSPOT_RECENT_HOURS', 3))
+HOTSPOT_BASELINE_HOURS = int(os.environ.get('HOTSPOT_BASELINE_HOURS', 7 * 24))
+HOTSPOT_MIN_WEIGHT = float(os.environ.get('HOTSPOT_MIN_WEIGHT', 4))
+HOTSPOT_MIN_RATIO = float(os.environ.get('HOTSPOT_MIN_RATIO', 2))
+HOTSPOT_BASELINE_FLOOR = float(os.environ.get('HOTSPOT_BASELINE_FLOOR', 1 / 24))  # weight per hour
+# Cells per baseline lookup; keeps the IN list under SQLite's variable limit.
+BASELINE_CHUNK = 500
+
+# Every cell active in the recent window: a range on idx_hotspot_counters_bucket, which covers the query.
+# Named explicitly, since GROUP BY cell otherwise tempts the planner into walking the whole primary key.
+RECENT_SQL = '''SELECT cell, SUM(weight), SUM(count) FROM hotspot_counters INDEXED BY idx_hotspot_counters_bucket
+                WHERE bucket >= ? GROUP BY cell HAVING SUM(weight) >= ?'''
+# Baseline for the candidates only: one primary-key range per cell.
+BASELINE_SQL = '''SELECT cell, SUM(weight) FROM hotspot_counters
+                  WHERE cell IN (%s) AND bucket >= ? AND bucket < ? GROUP BY cell'''
+
+def current_bucket(now=None):
+    return int(time.time() if now is None else now) // HOTSPOT_BUCKET_SECONDS
+
+def top_hotspots(conn, k, recent_hours=HOTSPOT_RECENT_HOURS, baseline_hours=HOTSPOT_BASELINE_HOURS, now=None):
+    """Up to k hot cells, hottest (highest recent/baseline ratio) first."""
+    recent_start = current_bucket(now) - recent_hours + 1
+    baseline_start = recent_start - baseline_hours
+    recent = {r[0]: (r[1], r[2]) for r in conn.execute(RECENT_SQL, (recent_start, HOTSPOT_MIN_WEIGHT))}
+    baseline = {}
+    cells = list(recent)
+    for i in range(0, len(cells), BASELINE_CHUNK):
+        chunk = cells[i:i + BASELINE_CHUNK]
+        baseline.update(conn.execute(BASELINE_SQL % ",".join('?' * len(chunk)),
+                                     chunk + [baseline_start, recent_start]).fetchall())
+    hot = []
+    for cell, (weight, count) in recent.items():
+        recent_rate = weight / recent_hours
+        baseline_rate = baseline.get(cell, 0) / baseline_hours
+        ratio = recent_rate / max(baseline_rate, HOTSPOT_BASELINE_FLOOR)
+        if ratio >= HOTSPOT_MIN_RATIO:
+            hot.append((ratio, weight, cell, count, recent_rate, baseline_rate))
+    hot.sort(reverse=True)
+    spots = []
+    for ratio, weight, cell, count, recent_rate, baseline_rate in hot[:k]:
+        south, west, north, east = [round(v, 6) for v in cell_bounds(cell)]
+        spots.append({
+            "cell": cell,
+            "latitude": round((south + north) / 2, 6),
+            "longitude": round((west + east) / 2, 6),
+            "bounds": {"south": south, "west": west, "north": north, "east": east},
+            "recent_weight": weight,
+            "recent_count": count,
+            "recent_rate": recent_rate,
+            "baseline_rate": baseline_rate,
+            "ratio": ratio,
+        })
+    return spots
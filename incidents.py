@@ -0,0 +1,112 @@
+# Duplicate detection at submit time.
+#
+# A report filed within DEDUPE_RADIUS_METERS and DEDUPE_WINDOW_MINUTES of an
+# existing report with the same severity does not become a new incident_reports
+# row. It is stored in report_corroborations against that canonical report,
+# whose corroboration_count goes up by one. Feeds, caches, clusters and the
+# geocoder therefore only ever see the canonical row.
+#
+# The lookup is an index seek: (severity, grid_cell, created_at) over the few
+# grid cells covering the radius, then an exact haversine on what comes back.
+# Callers hold BEGIN IMMEDIATE around lookup + insert, so two people reporting
+# the same thing at once cannot both create a canonical row.
+#
+# Admins can undo or force the grouping: split_incident() turns corroborations
+# back into reports of their own, merge_reports() folds whole reports (with
+# their votes and corroborations) into a canonical one.
+import os
+from datetime import datetime, timedelta
+
+from geo import cell_ranges, grid_cell, haversine_many
+
+DEDUPE_RADIUS_METERS = float(os.environ.get('DEDUPE_RADIUS_METERS', 100))  # 0 disables deduplication
+DEDUPE_WINDOW_MINUTES = float(os.environ.get('DEDUPE_WINDOW_MINUTES', 60))
+METERS_PER_MILE = 1609.344
+
+# Report fields a corroboration keeps, so a split can restore the original report.
+CORROBORATION_FIELDS = ('date', 'severity', 'location_latitude', 'location_longitude', 'location_accuracy',
+                        'details', 'status', 'created_at')
+
+def dedupe_since(window_minutes=DEDUPE_WINDOW_MINUTES):
+    """Reports created at or after this (same format submit_report writes) are merge candidates."""
+    return (datetime.utcnow() - timedelta(minutes=window_minutes)).isoformat() + "Z"
+
+def find_canonical(conn, severity, lat, lon, since, radius_meters=DEDUPE_RADIUS_METERS):
+    """Id of the closest report with this severity within radius_meters, created at or after since, or None."""
+    if radius_meters <= 0 or lat is None or lon is None:
+        return None
+    radius_miles = radius_meters / METERS_PER_MILE
+    ranges = cell_ranges(lat, lon, radius_miles)
+    if ranges is None:
+        return None
+    # Severity and the time bound sit inside each OR term so every term is one index range.
+    term = "(severity = ? AND grid_cell BETWEEN ? AND ? AND created_at >= ?)"
+    rows = conn.execute("SELECT id, location_latitude, location_longitude FROM incident_reports WHERE "
+                        + " OR ".join([term] * len(ranges)),
+                        [v for lo, hi in ranges for v in (severity, lo, hi, since)]).fetchall()
+    if not rows:
+        return None
+    distances = haversine_many(lat, lon, [r[1] for r in rows], [r[2] for r in rows])
+    distance, report_id = min((d, r[0]) for d, r in zip(distances, rows))
+    return report_id if distance <= radius_miles else None
+
+def corroborate(conn, report_id, user_id, fields):
+    """Attach a duplicate (CORROBORATION_FIELDS values) to report_id. Returns the new corroboration_count."""
+    conn.execute("INSERT INTO report_corroborations (report_id, user_id, %s) VALUES (?, ?, %s)"
+                 % (", ".join(CORROBORATION_FIELDS), ", ".join('?' * len(CORROBORATION_FIELDS))),
+                 [report_id, user_id] + list(fields))
+    conn.execute("UPDATE incident_reports SET corroboration_count = corroboration_count + 1 WHERE id = ?",
+                 (report_id,))
+    return conn.execute("SELECT corroboration_count FROM incident_reports WHERE id = ?", (report_id,)).fetchone()[0]
+
+def split_incident(conn, report_id, corroboration_ids=None):
+    """Turn corroborations of report_id (all of them by default) back into separate reports.
+
+    Runs inside the caller's transaction. Returns {corroboration id: new report id}.
+    """
+    sql = "SELECT id, user_id, %s FROM report_corroborations WHERE report_id = ?" % ", ".join(CORROBORATION_FIELDS)
+    params = [report_id]
+    if corroboration_ids is not None:
+        sql += " AND id IN (%s)" % ",".join('?' * len(corroboration_ids))
+        params += list(corroboration_ids)
+    created = {}
+    for row in conn.execute(sql + " ORDER BY id", params).fetchall():
+        fields = dict(zip(CORROBORATION_FIELDS, row[2:]))
+        c = conn.execute("INSERT INTO incident_reports (%s, reported_by_user_id, grid_cell, verified) "
+                         "VALUES (%s, ?, ?, 0)" % (", ".join(CORROBORATION_FIELDS), ", ".join('?' * len(fields))),
+                         list(fields.values())
+                         + [row[1], grid_cell(fields['location_latitude'], fields['location_longitude'])])
+        created[row[0]] = c.lastrowid
+    if created:
+        conn.execute("DELETE FROM report_corroborations WHERE id IN (%s)" % ",".join('?' * len(created)),
+                     list(created))
+        conn.execute("UPDATE incident_reports SET corroboration_count = corroboration_count - ? WHERE id = ?",
+                     (len(created), report_id))
+    return created
+
+def merge_reports(conn, report_id, duplicate_ids):
+    """Fold whole reports into report_id inside the caller's transaction. Returns the ids merged.
+
+    Each duplicate becomes a corroboration, its own corroborations move across,
+    and its voters' votes carry over unless they already voted on report_id.
+    """
+    merged = []
+    for duplicate_id in duplicate_ids:
+        if duplicate_id == report_id:
+            continue
+        row = conn.execute("SELECT reported_by_user_id, corroboration_count, %s FROM incident_reports WHERE id = ?"
+                           % ", ".join(CORROBORATION_FIELDS), (duplicate_id,)).fetchone()
+        if row is None:
+            continue
+        conn.execute("INSERT INTO report_corroborations (report_id, user_id, %s) VALUES (?, ?, %s)"
+                     % (", ".join(CORROBORATION_FIELDS), ", ".join('?' * len(CORROBORATION_FIELDS))),
+                     [report_id, row[0]] + list(row[2:]))
+        conn.execute("UPDATE report_corroborations SET report_id = ? WHERE report_id = ?", (report_id, duplicate_id))
+        conn.execute("INSERT OR IGNORE INTO report_votes (report_id, user_id, vote, voted_at) "
+                     "SELECT ?, user_id, vote, voted_at FROM report_votes WHERE report_id = ?", (report_id, duplicate_id))
+        conn.execute("DELETE FROM report_votes WHERE report_id = ?", (duplicate_id,))
+        conn.execute("DELETE FROM incident_reports WHERE id = ?", (duplicate_id,))
+        conn.execute("UPDATE incident_reports SET corroboration_count = corroboration_count + ? WHERE id = ?",
+                     (1 + row[1], report_id))
+        merged.append(duplicate_id)
+    return merged
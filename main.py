@@ -1,34 +1,87 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask import (Flask, request, jsonify, render_template, redirect, url_for, session, g, has_app_context, Response,
+                   stream_with_context)
 from flask_cors import CORS
 from datetime import datetime
 from functools import wraps
+import asyncio
+import atexit
+import base64
+import click
+import csv
+import io
+import json
 import math
 import sqlite3
 import os
-import urllib.request
-import urllib.parse
-import json
-import time
 import re
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import time
+from werkzeug.security import generate_password_hash
+from archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, Archiver, archive_reports
+from coordination import SharedVersions, init_lock
+from db import (SCHEMA_VERSION, ConnectionPool, connect, migrate, rebuild_hotspot_counters, rebuild_map_clusters,
+                rebuild_vote_tallies)
+from distance import DistanceIndex
+from events import FeedBroker
+from feedcache import FeedCache
+from geo import (haversine_many, grid_cell, cell_ranges, box_cell_ranges, candidate_rows, rows_in_cells, within_radius,
+                 CLUSTER_SEVERITIES, HOTSPOT_MAX_HOURS, cluster_cell, cluster_cell_size, cluster_level)
+import admission
+from admission import AdmissionController
+import metrics
+from metrics import phase
+from serialize import (ADDRESS, ID, LATITUDE, LONGITUDE, REPORT_SELECT, FastJSONProvider, report_dict,
+                       report_dict_with_votes)
+from passwords import PASSWORD_HASH_METHOD, PASSWORD_HASH_RETRY_AFTER, HasherBusy, PasswordHasher
+from votes import VoteBuffer
+from hotspots import HOTSPOT_BASELINE_HOURS, HOTSPOT_RECENT_HOURS, top_hotspots
+from incidents import corroborate, dedupe_since, find_canonical, merge_reports, split_incident
+from geocode import (GEOCODE_BACKFILL_BATCH, GEOCODE_MIN_INTERVAL, AsyncGeocodeClient, GeocodeCache, GeocodeWorker,
+                     backfill, placeholder_address)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-change-in-production')
 CORS(app, supports_credentials=True)
+metrics.init_app(app)
+
+# Admission control (admission.py): priority class per endpoint. Endpoints not
+# listed here (auth, admin pages) are never limited or shed.
+ADMISSION_CLASSES = {
+    'submit_report': 'critical',
+    'vote_report': 'critical',
+    'get_feed': 'normal',
+    'get_nearby_reports': 'normal',
+    'get_viewport': 'normal',
+    'get_hotspots': 'normal',
+    'feed_stream': 'stream',
+    'get_reports': 'low',
+    'submit_reports_bulk': 'low',
+    'admin_export_reports': 'low',
+    'admin_archive_reports': 'low',
+}
+
+def _rate_limit_exempt(user_id):
+    """Admins skip the per-user rate limits: the admin page reloads the full listing after every action."""
+    user = load_user(user_id)
+    return user is not None and user['account_type'] == 'admin'
+
+admission_controller = AdmissionController(ADMISSION_CLASSES, exempt=_rate_limit_exempt)
+admission.init_app(app, admission_controller)
 
 # Database setup
-DATABASE = 'incident_reports.db'
+DATABASE = os.environ.get('DATABASE_PATH', 'incident_reports.db')
 
 def init_db():
-    """Initialize or recreate the database. Create all tables and migrate if needed."""
-    need_create = True
+    """Initialize or recreate the database. Apply pending migrations and seed users; no-op when current."""
     if os.path.exists(DATABASE):
         try:
             conn = sqlite3.connect(DATABASE)
             c = conn.cursor()
             c.execute("SELECT 1 FROM incident_reports LIMIT 1")
+            # Finish the statement before closing, or the read lock outlives close()
+            c.fetchone()
             conn.close()
-            need_create = False
         except (sqlite3.Error, sqlite3.OperationalError):
             try:
                 os.remove(DATABASE)
@@ -36,113 +89,48 @@ def init_db():
             except OSError as e:
                 print(f"Could not remove {DATABASE}: {e}")
 
-    conn = sqlite3.connect(DATABASE)
+    conn = connect(DATABASE)
     c = conn.cursor()
-
-    if need_create:
-        c.execute('''
-            CREATE TABLE incident_reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT,
-                severity TEXT,
-                location_latitude REAL,
-                location_longitude REAL,
-                location_accuracy REAL,
-                details TEXT,
-                status TEXT,
-                created_at TEXT,
-                verified INTEGER DEFAULT 0,
-                reported_by_user_id INTEGER,
-                location_address TEXT
-            )
-        ''')
-    else:
-        # Migration: add new columns if missing
-        try:
-            c.execute("ALTER TABLE incident_reports ADD COLUMN verified INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE incident_reports ADD COLUMN reported_by_user_id INTEGER")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE incident_reports ADD COLUMN location_address TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            account_type TEXT NOT NULL CHECK(account_type IN ('admin', 'user')),
-            created_at TEXT,
-            email TEXT UNIQUE,
-            email_verified INTEGER DEFAULT 0,
-            verification_token TEXT
-        )
-    ''')
-    # Migration: add email columns if missing (existing DBs)
-    for col, sql in [
-        ('email', 'ALTER TABLE users ADD COLUMN email TEXT'),
-        ('email_verified', 'ALTER TABLE users ADD COLUMN email_verified INTEGER DEFAULT 0'),
-        ('verification_token', 'ALTER TABLE users ADD COLUMN verification_token TEXT'),
-    ]:
-        try:
-            c.execute(sql)
-            conn.commit()
-        except sqlite3.OperationalError:
-            pass
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS report_votes (
-            report_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            vote INTEGER NOT NULL CHECK(vote IN (1, -1)),
-            PRIMARY KEY (report_id, user_id),
-            FOREIGN KEY (report_id) REFERENCES incident_reports(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    conn.commit()
-
-    # Ensure users without email are treated as verified (seeded / legacy)
-    try:
-        c.execute("UPDATE users SET email_verified = 1 WHERE email IS NULL")
-        conn.commit()
-    except sqlite3.OperationalError:
-        pass
+    if migrate(conn) == 0:
+        conn.close()
+        return
     # Seed default admin and user if no users exist
     c.execute("SELECT COUNT(*) FROM users")
     if c.fetchone()[0] == 0:
         c.execute("""INSERT INTO users (username, password_hash, account_type, created_at, email_verified)
                      VALUES (?, ?, ?, ?, 1)""",
-                  ('admin', generate_password_hash('admin'), 'admin', datetime.utcnow().isoformat() + "Z"))
+                  ('admin', generate_password_hash('admin', PASSWORD_HASH_METHOD), 'admin', datetime.utcnow().isoformat() + "Z"))
         c.execute("""INSERT INTO users (username, password_hash, account_type, created_at, email_verified)
                      VALUES (?, ?, ?, ?, 1)""",
-                  ('user', generate_password_hash('user'), 'user', datetime.utcnow().isoformat() + "Z"))
+                  ('user', generate_password_hash('user', PASSWORD_HASH_METHOD), 'user', datetime.utcnow().isoformat() + "Z"))
         conn.commit()
         print("Seeded users: admin/admin, user/user")
 
     conn.close()
     print(f"Database {DATABASE} initialized")
 
+db_pool = ConnectionPool(DATABASE)
+
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Connection for the current request; every caller in the request shares it.
 
-init_db()
+    Outside an app context this returns a fresh connection the caller must close.
+    """
+    if not has_app_context():
+        return connect(DATABASE)
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+        metrics.instrument_connection(g.db)
+    return g.db
 
-required_fields = ['date', 'severity', 'location', 'details']
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        metrics.release_connection(conn)
+        db_pool.release(conn)
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return c * 3959
+required_fields = ['date', 'severity', 'location', 'details']
 
 def login_required(f):
     @wraps(f)
@@ -161,31 +149,158 @@ def admin_required(f):
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({"error": "Login required"}), 401
             return redirect(url_for('login'))
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT account_type FROM users WHERE id = ?", (session['user_id'],))
-        row = c.fetchone()
-        conn.close()
-        if not row or row[0] != 'admin':
+        user = load_user(session['user_id'])
+        if not user or user['account_type'] != 'admin':
             return jsonify({"error": "Admin required"}), 403
         return f(*args, **kwargs)
     return wrapped
 
-def get_current_user():
-    if 'user_id' not in session:
-        return None
+# Authenticated user lookups are cached in-process for USER_CACHE_TTL seconds.
+# admin_update_user() / admin_delete_user() drop the entry immediately in their
+# own process and bump the shared 'users' version; other worker processes see
+# the bump within INVALIDATION_POLL_SECONDS and clear their caches.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 5))
+USER_CACHE_MAX = 10000
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+_user_cache_version = 0
+shared_versions = SharedVersions()
+
+def load_user(user_id):
+    """{"id", "username", "account_type"} for a user id (None if it doesn't exist), cached briefly."""
+    global _user_cache_version
     conn = get_db()
+    version = shared_versions.get(conn, 'users')
+    if version != _user_cache_version:
+        with _user_cache_lock:
+            _user_cache.clear()
+            _user_cache_version = version
+    now = time.monotonic()
+    entry = _user_cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
     c = conn.cursor()
-    c.execute("SELECT id, username, account_type FROM users WHERE id = ?", (session['user_id'],))
+    c.execute("SELECT id, username, account_type FROM users WHERE id = ?", (user_id,))
     row = c.fetchone()
-    conn.close()
-    if not row:
+    user = {"id": row[0], "username": row[1], "account_type": row[2]} if row else None
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_MAX:
+            for key in [k for k, v in _user_cache.items() if v[0] <= now]:
+                del _user_cache[key]
+            if len(_user_cache) >= USER_CACHE_MAX:
+                _user_cache.clear()
+        _user_cache[user_id] = (now + USER_CACHE_TTL, user)
+    return user
+
+def invalidate_user(conn, user_id):
+    """Drop a user's cached entry here and, once conn commits, in every other worker."""
+    shared_versions.bump(conn, 'users')
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+def get_current_user():
+    if 'user_id' not in session:
         return None
-    return {"id": row[0], "username": row[1], "account_type": row[2]}
+    return load_user(session['user_id'])
+
+# Feed push: write paths publish deltas to SSE subscribers near the report
+feed_broker = FeedBroker(DATABASE)
+atexit.register(feed_broker.stop)
+
+# Vectorized distance engine for nearest-k ordering and radii too wide for the grid index
+distance_index = DistanceIndex()
+
+def reports_within(conn, lat, lon, radius):
+    """(distance, row) for reports within radius miles, closest first."""
+    if cell_ranges(lat, lon, radius) is not None:
+        with phase('sql'):
+            candidates = candidate_rows(conn, lat, lon, radius, REPORT_SELECT)
+        with phase('distance'):
+            return within_radius(candidates, lat, lon, radius)
+    with phase('sql'):
+        distance_index.sync(conn)
+    with phase('distance'):
+        matches = distance_index.within(lat, lon, radius)
+    with phase('sql'):
+        return distance_index.rows(conn, matches, columns=REPORT_SELECT)
+
+# Shared /feed and /reports/nearby results per neighbourhood, revalidated against cell_versions
+feed_cache = FeedCache()
+
+def cached_reports_within(conn, endpoint, lat, lon, radius, serialize):
+    """(etag, [(distance, report dict)]) for reports within radius, shared through feed_cache.
+
+    Rows are REPORT_COLUMNS rows; serialize(row) builds the user-independent report dict. The list is None when the
+    caller's If-None-Match already matches (answer 304); etag is None if the query is
+    too wide to cache.
+    """
+    cover = feed_cache.cover(lat, lon, radius)
+    if cover is None:
+        return None, [(distance, serialize(row)) for distance, row in reports_within(conn, lat, lon, radius)]
+    cell, ranges = cover
+    key = (endpoint, cell, radius)
+    with phase('sql'):
+        version = feed_cache.version(conn, ranges)
+    etag = feed_cache.etag(key, version, lat, lon, session.get('user_id'))
+    if request.if_none_match.contains_weak(etag):
+        feed_cache.note_not_modified()
+        return etag, None
+    entry = feed_cache.get(key, version)
+    if entry is None:
+        with phase('sql'):
+            rows = rows_in_cells(conn, ranges, REPORT_SELECT)
+        entry = feed_cache.put(key, version, rows)
+    with phase('distance'):
+        return etag, entry.within(lat, lon, radius, serialize)
+
+def cached_response(body, etag):
+    """JSON response carrying a weak ETag; with body None, an empty 304."""
+    response = Response(status=304) if body is None else jsonify(body)
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Reverse geocode: lat/lon -> closest address (Nominatim), filled in by a background worker.
+geocode_cache = GeocodeCache()
+geocoder = GeocodeWorker(DATABASE, cache=geocode_cache)
+
+# Retention: reports older than ARCHIVE_AFTER_DAYS move to the archive tables in small batches
+def _forget_archived(ids):
+    for report_id in ids:
+        distance_index.discard(report_id)
+
+archiver = Archiver(DATABASE, on_batch=_forget_archived)
+
+# Votes are buffered and group-committed (votes.py); stop() at exit flushes the rest
+vote_buffer = VoteBuffer(DATABASE)
+atexit.register(vote_buffer.stop)
+
+# ---- App factory ----
+# Importing this module has no side effects beyond building the app; create_app()
+# migrates the database and starts background work. Under gunicorn the master runs
+# init_db() once (gunicorn.conf.py) and each worker calls create_app(migrate_db=False).
+def create_app(database=None, migrate_db=True):
+    """Configure the module's app for serving and return it."""
+    global DATABASE, db_pool
+    if database is not None and database != DATABASE:
+        DATABASE = database
+        db_pool.close_all()
+        db_pool = ConnectionPool(DATABASE)
+        geocoder.database = DATABASE
+        archiver.database = DATABASE
+        vote_buffer.database = DATABASE
+        feed_broker.database = DATABASE
+    if migrate_db:
+        with init_lock(DATABASE):
+            init_db()
+    archiver.start()
+    vote_buffer.start()
+    feed_broker.start()
+    return app
 
-# Reverse geocode: lat/lon -> closest address (Nominatim). Caches in DB.
-_last_geocode_time = 0
 def get_report_address(conn, report):
+    """Stored address for a report, or its coordinates while the worker looks it up. Never blocks."""
     keys = report.keys() if hasattr(report, 'keys') else []
     if 'location_address' in keys and report['location_address']:
         return report['location_address']
@@ -193,33 +308,20 @@ def get_report_address(conn, report):
     lon = report['location_longitude']
     if lat is None or lon is None:
         return None
-    try:
-        global _last_geocode_time
-        now = time.time()
-        if now - _last_geocode_time < 1.1:
-            time.sleep(1.1 - (now - _last_geocode_time))
-        url = "https://nominatim.openstreetmap.org/reverse?lat=%s&lon=%s&format=json" % (lat, lon)
-        req = urllib.request.Request(url, headers={"User-Agent": "IncidentReportApp/1.0"})
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            data = json.loads(resp.read().decode())
-        addr = data.get("address") or {}
-        parts = [
-            addr.get("road") or addr.get("footway"),
-            addr.get("house_number"),
-            addr.get("suburb") or addr.get("neighbourhood") or addr.get("village") or addr.get("town") or addr.get("city"),
-            addr.get("state"),
-            addr.get("country"),
-        ]
-        display = ", ".join(p for p in parts if p)
-        if not display:
-            display = data.get("display_name") or ("%.5f, %.5f" % (lat, lon))
-        c = conn.cursor()
-        c.execute("UPDATE incident_reports SET location_address = ? WHERE id = ?", (display, report['id']))
-        conn.commit()
-        _last_geocode_time = time.time()
-        return display
-    except Exception:
-        return "%.5f, %.5f" % (lat, lon)
+    return pending_address(conn, report['id'], lat, lon)
+
+def report_address(conn, row):
+    """get_report_address() for REPORT_COLUMNS rows (see serialize.py)."""
+    address = row[ADDRESS]
+    if address or row[LATITUDE] is None or row[LONGITUDE] is None:
+        return address or None
+    return pending_address(conn, row[ID], row[LATITUDE], row[LONGITUDE])
+
+def pending_address(conn, report_id, lat, lon):
+    """Cached address or the coordinates, while the worker looks the report up."""
+    with phase('geocode'):
+        geocoder.enqueue(report_id, lat, lon)
+        return geocode_cache.get(conn, lat, lon) or placeholder_address(lat, lon)
 
 def report_row_to_dict(report, vote_score=None, user_vote=None, address=None, upvote_count=None, downvote_count=None):
     keys = report.keys() if hasattr(report, 'keys') else []
@@ -238,6 +340,8 @@ def report_row_to_dict(report, vote_score=None, user_vote=None, address=None, up
         "created_at": report['created_at'],
         "verified": bool(verified),
     }
+    if 'corroboration_count' in keys:
+        d["corroboration_count"] = report['corroboration_count']
     if address is not None:
         d["address"] = address
     elif 'location_address' in keys and report['location_address']:
@@ -255,6 +359,16 @@ def report_row_to_dict(report, vote_score=None, user_vote=None, address=None, up
     return d
 
 # ---- Auth routes ----
+# Password hashing runs in a bounded process pool (passwords.py); when it is
+# saturated /login and /register answer 503 with Retry-After straight away.
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.close)
+
+def _hasher_busy():
+    response = jsonify({"error": "Too many sign-ins right now, please retry shortly"})
+    response.headers['Retry-After'] = str(PASSWORD_HASH_RETRY_AFTER)
+    return response, 503
+
 def _email_valid(email):
     if not email or not isinstance(email, str):
         return False
@@ -276,9 +390,18 @@ def login():
     c = conn.cursor()
     c.execute("SELECT id, password_hash, email_verified FROM users WHERE username = ?", (username,))
     row = c.fetchone()
-    conn.close()
-    if not row or not check_password_hash(row[1], password):
+    if not row:
         return jsonify({"error": "Invalid username or password"}), 401
+    try:
+        ok, new_hash = password_hasher.verify(row[1], password)
+    except HasherBusy:
+        return _hasher_busy()
+    if not ok:
+        return jsonify({"error": "Invalid username or password"}), 401
+    if new_hash is not None:
+        # Hash parameters changed since this password was set; upgrade it in place.
+        c.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?", (new_hash, row[0], row[1]))
+        conn.commit()
     # Require email verification when user has email (column may be missing in old DBs)
     try:
         verified = row[2]
@@ -311,18 +434,23 @@ def register():
     c = conn.cursor()
     c.execute("SELECT id FROM users WHERE username = ?", (username,))
     if c.fetchone():
-        conn.close()
         return jsonify({"error": "Username already taken"}), 409
     c.execute("SELECT id FROM users WHERE email = ?", (email,))
     if c.fetchone():
-        conn.close()
         return jsonify({"error": "Email already registered"}), 409
-    c.execute("""INSERT INTO users (username, password_hash, account_type, created_at, email, email_verified)
-                 VALUES (?, ?, 'user', ?, ?, 1)""",
-              (username, generate_password_hash(password), datetime.utcnow().isoformat() + "Z", email))
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return _hasher_busy()
+    try:
+        c.execute("""INSERT INTO users (username, password_hash, account_type, created_at, email, email_verified)
+                     VALUES (?, ?, 'user', ?, ?, 1)""",
+                  (username, password_hash, datetime.utcnow().isoformat() + "Z", email))
+    except sqlite3.IntegrityError:
+        # Someone took the name or email while the hash was computed.
+        return jsonify({"error": "Username or email already registered"}), 409
     conn.commit()
     user_id = c.lastrowid
-    conn.close()
     return jsonify({
         "message": "Account created. You can sign in now.",
         "user_id": user_id
@@ -338,11 +466,9 @@ def verify_email():
     c.execute("SELECT id, username FROM users WHERE verification_token = ?", (token,))
     row = c.fetchone()
     if not row:
-        conn.close()
         return redirect(url_for('login') + '?error=invalid_token')
     c.execute("UPDATE users SET email_verified = 1, verification_token = NULL WHERE id = ?", (row[0],))
     conn.commit()
-    conn.close()
     return redirect(url_for('login') + '?verified=1')
 
 @app.route('/logout', methods=['POST', 'GET'])
@@ -366,15 +492,30 @@ def home():
     return render_template("quickstart.html")
 
 # ---- Report submit ----
-@app.route('/report', methods=['POST'])
-@login_required
-def submit_report():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"error": "Invalid or missing JSON body"}), 400
+INSERT_REPORT_SQL = '''
+    INSERT INTO incident_reports
+    (date, severity, location_latitude, location_longitude, location_accuracy, details, status, created_at, verified, reported_by_user_id, grid_cell)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)
+'''
+
+def _coordinate(value, limit):
+    """value as a float within -limit..limit (None stays None); raises ValueError otherwise."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    value = float(value)
+    if not -limit <= value <= limit:
+        raise ValueError(value)
+    return value
+
+def _parse_report(data, user_id, created_at):
+    """Validate one submitted report. Returns (insert params, None) or (None, error body)."""
+    if not isinstance(data, dict):
+        return None, {"error": "Report must be a JSON object"}
     missing = [f for f in required_fields if f not in data or data[f] in (None, "")]
     if missing:
-        return jsonify({"error": "Missing required fields", "missing": missing}), 400
+        return None, {"error": "Missing required fields", "missing": missing}
     location = data.get('location', {})
     if isinstance(location, dict):
         lat = location.get('latitude')
@@ -382,52 +523,416 @@ def submit_report():
         accuracy = location.get('accuracyMeters')
     else:
         lat = lon = accuracy = None
+    try:
+        lat = _coordinate(lat, 90)
+        lon = _coordinate(lon, 180)
+    except (TypeError, ValueError):
+        return None, {"error": "location latitude/longitude must be numbers within -90..90 and -180..180"}
     status = data.get('status', 'Pending')
-    user_id = session.get('user_id')
+    return (data['date'], data['severity'], lat, lon, accuracy, data['details'], status,
+            created_at, user_id, grid_cell(lat, lon)), None
+
+def _publish_created(conn, rows):
+    for row in rows:
+        if row['grid_cell'] is None:
+            continue
+        feed_broker.publish('report_created', row['location_latitude'], row['location_longitude'], {
+            "report_id": row['id'],
+            "report": report_row_to_dict(row, vote_score=0, address=get_report_address(conn, row),
+                                         upvote_count=0, downvote_count=0),
+        })
+
+@app.route('/report', methods=['POST'])
+@login_required
+def submit_report():
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Invalid or missing JSON body"}), 400
+    created_at = datetime.utcnow().isoformat() + "Z"
+    params, error = _parse_report(data, session.get('user_id'), created_at)
+    if error:
+        return jsonify(error), 400
+    lat, lon = params[2], params[3]
     conn = get_db()
     c = conn.cursor()
-    c.execute('''
-        INSERT INTO incident_reports 
-        (date, severity, location_latitude, location_longitude, location_accuracy, details, status, created_at, verified, reported_by_user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
-    ''', (
-        data['date'], data['severity'], lat, lon, accuracy, data['details'], status,
-        datetime.utcnow().isoformat() + "Z", user_id
-    ))
+    # Lookup and insert share the write lock, so simultaneous duplicates fold into one report.
+    c.execute("BEGIN IMMEDIATE")
+    canonical = find_canonical(conn, params[1], lat, lon, dedupe_since())
+    if canonical is not None:
+        count = corroborate(conn, canonical, params[8], params[:8])
+        conn.commit()
+        report = conn.execute("SELECT * FROM incident_reports WHERE id = ?", (canonical,)).fetchone()
+        feed_broker.publish('report_corroborated', report['location_latitude'], report['location_longitude'],
+                            {"report_id": canonical, "corroboration_count": count})
+        return jsonify({"message": "Added to an existing nearby report", "merged": True,
+                        "duplicate_of": canonical, "corroboration_count": count,
+                        "report": report_row_to_dict(report, address=get_report_address(conn, report))}), 200
+    c.execute(INSERT_REPORT_SQL, params)
     conn.commit()
     report_id = c.lastrowid
-    conn.close()
-    location_out = location if isinstance(location, dict) else {}
+    geocoder.enqueue(report_id, lat, lon)
+    if params[-1] is not None:
+        c.execute("SELECT * FROM incident_reports WHERE id = ?", (report_id,))
+        _publish_created(conn, c.fetchall())
+    location = data.get('location', {})
+    location_out = dict(location, latitude=lat, longitude=lon) if isinstance(location, dict) else {}
     response_data = {
         "id": report_id, "date": data['date'], "severity": data['severity'],
-        "location": location_out, "details": data['details'], "status": status,
-        "created_at": datetime.utcnow().isoformat() + "Z", "verified": False
+        "location": location_out, "details": data['details'], "status": params[6],
+        "created_at": created_at, "verified": False, "corroboration_count": 0
     }
     return jsonify({"message": "Report submitted successfully!", "report": response_data}), 201
 
-# ---- Reports list (optional: ?latitude=&longitude= to order by distance) ----
-@app.route('/reports', methods=['GET'])
+# ---- Bulk submit: JSON array or NDJSON (one report per line) ----
+# Records are validated one by one; valid ones are inserted with executemany in
+# transactions of BULK_BATCH_SIZE. The response lists a result per input record.
+# Bulk imports skip duplicate detection; admins can merge afterwards.
+BULK_BATCH_SIZE = 500
+BULK_MAX_RECORDS = 10000
+
+def _bulk_records():
+    """Records from the request body as a list, or None if it can't be parsed."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        records = []
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)
+        return records
+    data = request.get_json(silent=True)
+    return data if isinstance(data, list) else None
+
+@app.route('/reports/bulk', methods=['POST'])
 @login_required
-def get_reports():
+def submit_reports_bulk():
+    records = _bulk_records()
+    if records is None:
+        return jsonify({"error": "Body must be a JSON array or NDJSON"}), 400
+    if len(records) > BULK_MAX_RECORDS:
+        return jsonify({"error": "Too many records", "max": BULK_MAX_RECORDS}), 413
+    user_id = session.get('user_id')
+    created_at = datetime.utcnow().isoformat() + "Z"
+    results = [None] * len(records)
+    valid = []
+    for index, record in enumerate(records):
+        params, error = _parse_report(record, user_id, created_at)
+        if error:
+            results[index] = dict(error, index=index)
+        else:
+            valid.append((index, params))
+
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT * FROM incident_reports ORDER BY created_at DESC')
-    db_reports = c.fetchall()
+    jobs = []
+    for start in range(0, len(valid), BULK_BATCH_SIZE):
+        batch = valid[start:start + BULK_BATCH_SIZE]
+        # The write lock is held for the whole batch, so AUTOINCREMENT ids are contiguous
+        c.execute("BEGIN IMMEDIATE")
+        c.executemany(INSERT_REPORT_SQL, [params for _, params in batch])
+        last_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+        conn.commit()
+        first_id = last_id - len(batch) + 1
+        for offset, (index, params) in enumerate(batch):
+            results[index] = {"index": index, "id": first_id + offset}
+            jobs.append((first_id + offset, params[2], params[3]))
+        c.execute("SELECT * FROM incident_reports WHERE id BETWEEN ? AND ? AND grid_cell IS NOT NULL",
+                  (first_id, last_id))
+        _publish_created(conn, c.fetchall())
+    geocoder.enqueue_many(jobs)
+    inserted = len(jobs)
+    return jsonify({"inserted": inserted, "failed": len(records) - inserted, "results": results}), 200
+
+# ---- Reports list ----
+# Without limit/cursor this returns the full array, as older clients expect.
+# With them it returns {"reports": [...], "next_cursor": ...} pages in keyset order:
+# newest first, or closest first when ?latitude=&longitude= are given.
+# Filters: severity (comma-separated), status, verified, since/until (created_at).
+# fields= projects each report onto a subset of its keys.
+# stream=ndjson|json (or Accept: application/x-ndjson) streams the full listing
+# instead: rows come off the cursor STREAM_BATCH_SIZE at a time and are written
+# out as they are serialized, so memory stays flat however many rows match.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+REPORT_FIELDS = ('id', 'date', 'severity', 'location', 'details', 'status', 'created_at',
+                 'verified', 'address', 'corroboration_count', 'distance_miles')
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+
+def _fetch_batches(cursor, size=STREAM_BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+def _stream_response(batches, fmt, headers=None):
+    """Streamed body from an iterable of lists of dicts: NDJSON lines or one JSON array."""
+    def dumps(item):
+        # Compact, as jsonify is outside debug mode
+        return app.json.dumps(item, separators=(",", ":"))
+
+    def generate():
+        if fmt == 'ndjson':
+            for items in batches:
+                if items:
+                    yield "".join(dumps(item) + "\n" for item in items)
+            return
+        separator = "["
+        for items in batches:
+            if items:
+                yield separator + ",".join(dumps(item) for item in items)
+                separator = ","
+        yield "[]\n" if separator == "[" else "]\n"
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt], headers=headers)
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor, by_distance=False):
+    """[created_at, id], or [distance, id] when by_distance, from a cursor; None if it is not one."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    key, last_id = values
+    # bool is an int subclass, and json.loads accepts NaN and Infinity
+    if type(last_id) is not int:
+        return None
+    if by_distance:
+        valid = type(key) in (int, float) and math.isfinite(key)
+    else:
+        valid = isinstance(key, str)
+    return values if valid else None
+
+def _report_filters(args):
+    """SQL WHERE clauses and params for the /reports filters, or an error message."""
+    clauses, params = [], []
+    severities = [s.strip() for s in (args.get('severity') or '').split(',') if s.strip()]
+    if severities:
+        clauses.append("severity IN (%s)" % ','.join('?' * len(severities)))
+        params.extend(severities)
+    if args.get('status'):
+        clauses.append("status = ?")
+        params.append(args['status'])
+    verified = (args.get('verified') or '').lower()
+    if verified:
+        if verified not in ('1', '0', 'true', 'false'):
+            return None, None, "verified must be true or false"
+        clauses.append("verified = ?")
+        params.append(1 if verified in ('1', 'true') else 0)
+    if args.get('since'):
+        clauses.append("created_at >= ?")
+        params.append(args['since'])
+    if args.get('until'):
+        clauses.append("created_at < ?")
+        params.append(args['until'])
+    return clauses, params, None
+
+@app.route('/reports', methods=['GET'])
+@login_required
+def get_reports():
     user_lat = request.args.get('latitude', type=float)
     user_lon = request.args.get('longitude', type=float)
-    reports = []
-    for r in db_reports:
-        addr = get_report_address(conn, r)
-        d = report_row_to_dict(r, address=addr)
-        if user_lat is not None and user_lon is not None and r['location_latitude'] is not None and r['location_longitude'] is not None:
-            d['distance_miles'] = round(haversine_distance(user_lat, user_lon, r['location_latitude'], r['location_longitude']), 2)
+    by_distance = user_lat is not None and user_lon is not None
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    paginate = limit is not None or cursor is not None
+    if paginate:
+        limit = min(max(limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    after = None
+    if cursor:
+        after = _decode_cursor(cursor, by_distance)
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+    fields = [f.strip() for f in (request.args.get('fields') or '').split(',') if f.strip()]
+    unknown = [f for f in fields if f not in REPORT_FIELDS]
+    if unknown:
+        return jsonify({"error": "Unknown fields", "unknown": unknown}), 400
+    clauses, params, error = _report_filters(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    stream = (request.args.get('stream') or '').lower()
+    if not stream and 'application/x-ndjson' in request.headers.get('Accept', ''):
+        stream = 'ndjson'
+    if stream and stream not in STREAM_FORMATS:
+        return jsonify({"error": "stream must be one of: " + ", ".join(STREAM_FORMATS)}), 400
+    if stream and paginate:
+        return jsonify({"error": "stream cannot be combined with limit or cursor"}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+    if stream:
+        origin = (user_lat, user_lon) if by_distance else None
+        return _stream_response(_listing_batches(conn, _stream_rows(conn, clauses, params, origin), fields), stream)
+    next_cursor = None
+    if by_distance:
+        if paginate:
+            # Nearest-k from the distance engine; only the page's rows are read
+            with phase('sql'):
+                distance_index.sync(conn)
+            with phase('distance'):
+                page = distance_index.nearest_rows(conn, user_lat, user_lon, limit + 1, after,
+                                                   " AND ".join(clauses) or None, params, REPORT_SELECT)
+            if len(page) > limit:
+                page = page[:limit]
+                next_cursor = _encode_cursor([page[-1][0], page[-1][1]['id']])
+            rows = page
         else:
-            d['distance_miles'] = None
-        reports.append(d)
-    conn.close()
-    if user_lat is not None and user_lon is not None:
-        reports.sort(key=lambda x: (x['distance_miles'] is None, x['distance_miles'] or 0))
-    return jsonify(reports), 200
+            where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+            with phase('sql'):
+                c.execute('SELECT %s FROM incident_reports%s ORDER BY created_at DESC' % (REPORT_SELECT, where), params)
+                db_reports = c.fetchall()
+            with phase('distance'):
+                located = [r for r in db_reports
+                           if r['location_latitude'] is not None and r['location_longitude'] is not None]
+                distances = haversine_many(user_lat, user_lon, [r['location_latitude'] for r in located],
+                                           [r['location_longitude'] for r in located])
+                rows = sorted(zip(distances, located), key=lambda x: x[0])
+                rows += [(None, r) for r in db_reports
+                         if r['location_latitude'] is None or r['location_longitude'] is None]
+    else:
+        if after is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        sql = 'SELECT %s FROM incident_reports%s ORDER BY created_at DESC, id DESC' % (REPORT_SELECT, where)
+        if paginate:
+            sql += ' LIMIT %d' % (limit + 1)
+        with phase('sql'):
+            c.execute(sql, params)
+            rows = [(None, r) for r in c.fetchall()]
+        if paginate and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor([rows[-1][1]['created_at'], rows[-1][1]['id']])
+
+    reports = [_listing_dict(conn, distance, r, fields) for distance, r in rows]
+    with phase('serialize'):
+        if paginate:
+            return jsonify({"reports": reports, "next_cursor": next_cursor}), 200
+        return jsonify(reports), 200
+
+def _listing_dict(conn, distance, r, fields):
+    d = report_dict(r, report_address(conn, r))
+    d['distance_miles'] = round(distance, 2) if distance is not None else None
+    if fields:
+        d = {f: d[f] for f in fields}
+    return d
+
+def _listing_batches(conn, batches, fields):
+    for rows in batches:
+        yield [_listing_dict(conn, distance, r, fields) for distance, r in rows]
+
+def _stream_rows(conn, clauses, params, origin=None):
+    """Batches of (distance, row), ordered like the unpaginated listing (distance ties by id)."""
+    where = " AND ".join(clauses)
+    if origin is None:
+        c = conn.execute('SELECT %s FROM incident_reports%s ORDER BY created_at DESC, id DESC'
+                         % (REPORT_SELECT, " WHERE " + where if where else ""), params)
+        for rows in _fetch_batches(c):
+            yield [(None, r) for r in rows]
+        return
+    # Closest first from the distance engine, then reports without a location
+    distance_index.sync(conn)
+    for matches in distance_index.iter_nearest(origin[0], origin[1], STREAM_BATCH_SIZE):
+        yield distance_index.rows(conn, matches, where or None, params, REPORT_SELECT)
+    c = conn.execute('SELECT %s FROM incident_reports WHERE (location_latitude IS NULL OR location_longitude IS NULL)%s '
+                     'ORDER BY created_at DESC, id DESC' % (REPORT_SELECT, " AND " + where if where else ""), params)
+    for rows in _fetch_batches(c):
+        yield [(None, r) for r in rows]
+
+# ---- Map viewport: clusters from map_clusters at low zoom, individual reports at high zoom ----
+VIEWPORT_REPORT_ZOOM = 15
+VIEWPORT_MAX_REPORTS = 1000
+VIEWPORT_MAX_CLUSTERS = 5000
+
+def _viewport_clusters(conn, zoom, south, north, west, east):
+    level = cluster_level(zoom)
+    row_lo, col_lo = cluster_cell(level, south, west)
+    row_hi, col_hi = cluster_cell(level, north, east)
+    cols = int(360 / cluster_cell_size(level))
+    if east - west >= 360:
+        col_clause, params = "1", []
+    elif east > 180:
+        # Crosses the antimeridian: col wraps from the right edge back to 0
+        col_clause, params = "(col >= ? OR col <= ?)", [col_lo, col_hi - cols]
+    else:
+        col_clause, params = "col BETWEEN ? AND ?", [col_lo, col_hi]
+    c = conn.execute('''SELECT count, %s, lat_sum, lon_sum FROM map_clusters
+                        WHERE zoom = ? AND row BETWEEN ? AND ? AND %s LIMIT %d'''
+                     % (", ".join(CLUSTER_SEVERITIES), col_clause, VIEWPORT_MAX_CLUSTERS + 1),
+                     [level, row_lo, row_hi] + params)
+    rows = c.fetchall()
+    clusters = [{
+        "latitude": r['lat_sum'] / r['count'],
+        "longitude": r['lon_sum'] / r['count'],
+        "count": r['count'],
+        "severity": {sev: r[sev] for sev in CLUSTER_SEVERITIES},
+    } for r in rows[:VIEWPORT_MAX_CLUSTERS]]
+    return {"zoom": zoom, "cell_size_deg": cluster_cell_size(level), "clusters": clusters, "reports": [],
+            "truncated": len(rows) > VIEWPORT_MAX_CLUSTERS}
+
+@app.route('/reports/viewport', methods=['GET'])
+@login_required
+def get_viewport():
+    """bbox=west,south,east,north (degrees) and zoom (map zoom level)."""
+    try:
+        west, south, east, north = [float(v) for v in request.args.get('bbox', '').split(',')]
+        zoom = float(request.args['zoom'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "bbox=west,south,east,north and zoom are required"}), 400
+    if not (-90 <= south <= north <= 90):
+        return jsonify({"error": "bbox south/north must be within -90..90 and ordered"}), 400
+    # Normalize so west is in [-180, 180) and east > west (east > 180 means the box wraps)
+    width = east - west
+    if width < 0:
+        width += 360
+    west = (west + 180) % 360 - 180
+    east = west + min(width, 360)
+    conn = get_db()
+    ranges = box_cell_ranges(south, north, west, east) if zoom >= VIEWPORT_REPORT_ZOOM else None
+    if ranges is None:
+        with phase('sql'):
+            body = _viewport_clusters(conn, zoom, south, north, west, east)
+        with phase('serialize'):
+            return jsonify(body), 200
+    with phase('sql'):
+        c = conn.execute("SELECT %s FROM incident_reports WHERE (%s) ORDER BY created_at DESC LIMIT %d"
+                         % (REPORT_SELECT, " OR ".join(["grid_cell BETWEEN ? AND ?"] * len(ranges)), VIEWPORT_MAX_REPORTS + 1),
+                         [bound for r in ranges for bound in r])
+        rows = c.fetchall()
+    reports = [report_dict(r, report_address(conn, r)) for r in rows[:VIEWPORT_MAX_REPORTS]]
+    with phase('serialize'):
+        return jsonify({"zoom": zoom, "clusters": [], "reports": reports,
+                        "truncated": len(rows) > VIEWPORT_MAX_REPORTS}), 200
+
+# ---- Hotspots: grid cells whose recent report rate is well above their baseline (hotspots.py) ----
+HOTSPOT_MAX_K = 100
+
+@app.route('/hotspots', methods=['GET'])
+@login_required
+def get_hotspots():
+    """k (default 10), recent_hours and baseline_hours (whole hours)."""
+    try:
+        k = int(request.args.get('k', 10))
+        recent_hours = int(request.args.get('recent_hours', HOTSPOT_RECENT_HOURS))
+        baseline_hours = int(request.args.get('baseline_hours', HOTSPOT_BASELINE_HOURS))
+    except ValueError:
+        return jsonify({"error": "k, recent_hours and baseline_hours must be integers"}), 400
+    if not (1 <= k <= HOTSPOT_MAX_K):
+        return jsonify({"error": f"k must be between 1 and {HOTSPOT_MAX_K}"}), 400
+    if not (1 <= recent_hours <= HOTSPOT_MAX_HOURS and 1 <= baseline_hours <= HOTSPOT_MAX_HOURS):
+        return jsonify({"error": f"recent_hours and baseline_hours must be between 1 and {HOTSPOT_MAX_HOURS}"}), 400
+    with phase('sql'):
+        spots = top_hotspots(get_db(), k, recent_hours, baseline_hours)
+    with phase('serialize'):
+        return jsonify({"recent_hours": recent_hours, "baseline_hours": baseline_hours, "hotspots": spots}), 200
 
 # ---- Feed: reports within 0.5 miles with vote scores (for logged-in user location) ----
 @app.route('/feed', methods=['POST'])
@@ -442,49 +947,50 @@ def get_feed():
     user_id = session.get('user_id')
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT * FROM incident_reports')
-    db_reports = c.fetchall()
-    # Get vote scores and per-type counts per report
-    c.execute('SELECT report_id, SUM(vote) AS score FROM report_votes GROUP BY report_id')
-    scores = {row[0]: row[1] for row in c.fetchall()}
-    c.execute('SELECT report_id, vote, COUNT(*) FROM report_votes GROUP BY report_id, vote')
-    upvotes = {}
-    downvotes = {}
-    for row in c.fetchall():
-        rid, vote, cnt = row[0], row[1], row[2]
-        if vote == 1:
-            upvotes[rid] = cnt
-        else:
-            downvotes[rid] = cnt
-    c.execute('SELECT report_id, vote FROM report_votes WHERE user_id = ?', (user_id,))
-    user_votes = {row[0]: row[1] for row in c.fetchall()}
+
+    def serialize(report):
+        return report_dict_with_votes(report, report_address(conn, report))
+
+    etag, nearby = cached_reports_within(conn, 'feed', user_lat, user_lon, radius, serialize)
+    if nearby is None:
+        return cached_response(None, etag)
+    # Vote tallies live on the report rows; only this user's own votes need a lookup
+    user_votes = {}
+    if nearby:
+        ids = [report['id'] for _, report in nearby]
+        with phase('sql'):
+            c.execute('SELECT report_id, vote FROM report_votes WHERE user_id = ? AND report_id IN (%s)'
+                      % ','.join('?' * len(ids)), [user_id] + ids)
+            user_votes = {row[0]: row[1] for row in c.fetchall()}
     feed = []
-    for report in db_reports:
-        report_lat = report['location_latitude']
-        report_lon = report['location_longitude']
-        if report_lat is None or report_lon is None:
-            continue
-        distance = haversine_distance(user_lat, user_lon, report_lat, report_lon)
-        if distance > radius:
-            continue
-        rid = report['id']
-        addr = get_report_address(conn, report)
-        feed.append({
-            "distance_miles": round(distance, 2),
-            "report": report_row_to_dict(
-                report,
-                vote_score=scores.get(rid, 0),
-                user_vote=user_votes.get(rid),
-                address=addr,
-                upvote_count=upvotes.get(rid, 0),
-                downvote_count=downvotes.get(rid, 0)
-            )
-        })
-    conn.close()
-    feed.sort(key=lambda x: x['distance_miles'])
-    return jsonify({"feed": feed}), 200
+    for distance, report in nearby:
+        # Cached dicts are shared between users; the caller's vote goes on a copy
+        if report['id'] in user_votes:
+            report = dict(report, user_vote=user_votes[report['id']])
+        feed.append({"distance_miles": round(distance, 2), "report": report})
+    with phase('serialize'):
+        return cached_response({"feed": feed}, etag)
+
+# ---- Feed push: SSE stream of deltas for one location (polling /feed stays as fallback) ----
+@app.route('/feed/stream', methods=['GET'])
+@login_required
+def feed_stream():
+    user_lat = request.args.get('latitude', type=float)
+    user_lon = request.args.get('longitude', type=float)
+    radius = request.args.get('radius_miles', 0.5, type=float)
+    if user_lat is None or user_lon is None:
+        return jsonify({"error": "Missing latitude/longitude"}), 400
+    sub = feed_broker.subscribe(user_lat, user_lon, radius)
+    response = Response(feed_broker.stream(sub), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # The stream keeps its admission slot (and its thread) until it closes
+    response.call_on_close(admission_controller.detach())
+    return response
 
 # ---- Vote on report ----
+# With the vote buffer on (VOTE_FLUSH_INTERVAL > 0) the vote is held in memory
+# and the response is marked "pending": its tally is provisional, and other
+# reads show the vote once it is flushed, within VOTE_FLUSH_INTERVAL.
 @app.route('/reports/<int:report_id>/vote', methods=['POST'])
 @login_required
 def vote_report(report_id):
@@ -494,21 +1000,23 @@ def vote_report(report_id):
         return jsonify({"error": "vote must be 1 or -1"}), 400
     user_id = session.get('user_id')
     conn = get_db()
+    if vote_buffer.enabled:
+        return _buffer_vote(conn, report_id, user_id, vote)
     c = conn.cursor()
-    c.execute("SELECT id FROM incident_reports WHERE id = ?", (report_id,))
-    if not c.fetchone():
-        conn.close()
+    c.execute("SELECT location_latitude, location_longitude FROM incident_reports WHERE id = ?", (report_id,))
+    location = c.fetchone()
+    if not location:
         return jsonify({"error": "Report not found"}), 404
-    c.execute("INSERT OR REPLACE INTO report_votes (report_id, user_id, vote) VALUES (?, ?, ?)",
-              (report_id, user_id, vote))
+    c.execute('''INSERT INTO report_votes (report_id, user_id, vote, voted_at) VALUES (?, ?, ?, ?)
+                 ON CONFLICT(report_id, user_id) DO UPDATE SET vote = excluded.vote, voted_at = excluded.voted_at''',
+              (report_id, user_id, vote, time.time()))
     conn.commit()
-    c.execute("SELECT COALESCE(SUM(vote), 0) FROM report_votes WHERE report_id = ?", (report_id,))
-    score = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM report_votes WHERE report_id = ? AND vote = 1", (report_id,))
-    upvote_count = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM report_votes WHERE report_id = ? AND vote = -1", (report_id,))
-    downvote_count = c.fetchone()[0]
-    conn.close()
+    c.execute("SELECT vote_score, upvote_count, downvote_count FROM incident_reports WHERE id = ?", (report_id,))
+    score, upvote_count, downvote_count = c.fetchone()
+    feed_broker.publish('report_voted', location[0], location[1], {
+        "report_id": report_id, "vote_score": score,
+        "upvote_count": upvote_count, "downvote_count": downvote_count,
+    })
     return jsonify({
         "vote_score": score,
         "user_vote": vote,
@@ -516,6 +1024,31 @@ def vote_report(report_id):
         "downvote_count": downvote_count
     }), 200
 
+def _buffer_vote(conn, report_id, user_id, vote):
+    tally = None
+    while tally is None:
+        # Re-read if a flush commits between these reads and add() (see votes.py)
+        version = vote_buffer.snapshot_version()
+        report = conn.execute("SELECT location_latitude, location_longitude, vote_score, upvote_count, downvote_count "
+                              "FROM incident_reports WHERE id = ?", (report_id,)).fetchone()
+        if not report:
+            return jsonify({"error": "Report not found"}), 404
+        stored = conn.execute("SELECT vote FROM report_votes WHERE report_id = ? AND user_id = ?",
+                              (report_id, user_id)).fetchone()
+        tally = vote_buffer.add(version, report_id, user_id, vote, stored[0] if stored else None, tuple(report[2:]))
+    score, upvote_count, downvote_count = tally
+    feed_broker.publish('report_voted', report[0], report[1], {
+        "report_id": report_id, "vote_score": score,
+        "upvote_count": upvote_count, "downvote_count": downvote_count,
+    })
+    return jsonify({
+        "vote_score": score,
+        "user_vote": vote,
+        "upvote_count": upvote_count,
+        "downvote_count": downvote_count,
+        "pending": True
+    }), 200
+
 # ---- Admin: verify report ----
 @app.route('/reports/<int:report_id>/verify', methods=['POST'])
 @admin_required
@@ -525,9 +1058,11 @@ def verify_report(report_id):
     c.execute("UPDATE incident_reports SET verified = 1 WHERE id = ?", (report_id,))
     conn.commit()
     if c.rowcount == 0:
-        conn.close()
         return jsonify({"error": "Report not found"}), 404
-    conn.close()
+    c.execute("SELECT location_latitude, location_longitude FROM incident_reports WHERE id = ?", (report_id,))
+    location = c.fetchone()
+    if location:
+        feed_broker.publish('report_verified', location[0], location[1], {"report_id": report_id})
     return jsonify({"message": "Report verified"}), 200
 
 # ---- Nearby (for map alerts) ----
@@ -537,30 +1072,22 @@ def get_nearby_reports():
     data = request.get_json(silent=True)
     if not data or 'latitude' not in data or 'longitude' not in data:
         return jsonify({"error": "Missing latitude/longitude"}), 400
-    radius = data.get('radius_miles', 0.5)
-    user_lat = data['latitude']
-    user_lon = data['longitude']
+    try:
+        radius = float(data.get('radius_miles', 0.5))
+        user_lat = float(data['latitude'])
+        user_lon = float(data['longitude'])
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid latitude/longitude/radius_miles"}), 400
+    if not (math.isfinite(radius) and radius >= 0):
+        return jsonify({"error": "radius_miles must be a non-negative number"}), 400
     conn = get_db()
-    c = conn.cursor()
-    c.execute('SELECT * FROM incident_reports')
-    db_reports = c.fetchall()
-    nearby = []
-    for report in db_reports:
-        try:
-            report_lat = report['location_latitude']
-            report_lon = report['location_longitude']
-            if report_lat is None or report_lon is None:
-                continue
-            distance = haversine_distance(user_lat, user_lon, report_lat, report_lon)
-            if distance <= radius:
-                addr = get_report_address(conn, report)
-                report_dict = report_row_to_dict(report, address=addr)
-                nearby.append({"distance_miles": round(distance, 2), "report": report_dict})
-        except (TypeError, ValueError):
-            continue
-    conn.close()
-    nearby.sort(key=lambda x: x['distance_miles'])
-    return jsonify({"nearby_reports": nearby}), 200
+    etag, rows = cached_reports_within(conn, 'nearby', user_lat, user_lon, radius,
+                                       lambda report: report_dict(report, report_address(conn, report)))
+    if rows is None:
+        return cached_response(None, etag)
+    nearby = [{"distance_miles": round(distance, 2), "report": report} for distance, report in rows]
+    with phase('serialize'):
+        return cached_response({"nearby_reports": nearby}, etag)
 
 # ---- Admin: delete report ----
 @app.route('/reports/<int:report_id>', methods=['DELETE'])
@@ -568,15 +1095,88 @@ def get_nearby_reports():
 def delete_report(report_id):
     conn = get_db()
     c = conn.cursor()
+    c.execute("SELECT location_latitude, location_longitude FROM incident_reports WHERE id = ?", (report_id,))
+    location = c.fetchone()
     c.execute("DELETE FROM report_votes WHERE report_id = ?", (report_id,))
+    c.execute("DELETE FROM report_corroborations WHERE report_id = ?", (report_id,))
     c.execute("DELETE FROM incident_reports WHERE id = ?", (report_id,))
     deleted = c.rowcount
     conn.commit()
-    conn.close()
     if deleted == 0:
         return jsonify({"error": "Report not found"}), 404
+    distance_index.discard(report_id)
+    feed_broker.publish('report_deleted', location[0], location[1], {"report_id": report_id})
     return jsonify({"message": "Report deleted"}), 200
 
+# ---- Admin: duplicate incidents (see incidents.py) ----
+# Submissions close to an existing report are stored as its corroborations.
+# split turns corroborations back into reports; merge folds reports into one.
+def _id_list(data, key):
+    """data[key] as a list of ints, or None if it is missing or malformed."""
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return ids
+
+@app.route('/admin/incidents/<int:report_id>/corroborations', methods=['GET'])
+@admin_required
+def admin_incident_corroborations(report_id):
+    conn = get_db()
+    report = conn.execute("SELECT * FROM incident_reports WHERE id = ?", (report_id,)).fetchone()
+    if report is None:
+        return jsonify({"error": "Report not found"}), 404
+    rows = conn.execute("SELECT * FROM report_corroborations WHERE report_id = ? ORDER BY id", (report_id,)).fetchall()
+    corroborations = [dict(report_row_to_dict(r), id=r['id'], user_id=r['user_id']) for r in rows]
+    return jsonify({"report": report_row_to_dict(report, address=get_report_address(conn, report)),
+                    "corroborations": corroborations}), 200
+
+@app.route('/admin/incidents/<int:report_id>/split', methods=['POST'])
+@admin_required
+def admin_split_incident(report_id):
+    data = request.get_json(silent=True) or {}
+    corroboration_ids = None
+    if data.get('corroboration_ids') is not None:
+        corroboration_ids = _id_list(data, 'corroboration_ids')
+        if corroboration_ids is None:
+            return jsonify({"error": "corroboration_ids must be a list of ids"}), 400
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute("SELECT 1 FROM incident_reports WHERE id = ?", (report_id,)).fetchone() is None:
+        conn.rollback()
+        return jsonify({"error": "Report not found"}), 404
+    created = split_incident(conn, report_id, corroboration_ids)
+    conn.commit()
+    if created:
+        rows = conn.execute("SELECT * FROM incident_reports WHERE id IN (%s)" % ",".join('?' * len(created)),
+                            list(created.values())).fetchall()
+        geocoder.enqueue_many([(r['id'], r['location_latitude'], r['location_longitude']) for r in rows])
+        _publish_created(conn, rows)
+    return jsonify({"message": "Incident split", "report_ids": {str(k): v for k, v in created.items()}}), 200
+
+@app.route('/admin/incidents/<int:report_id>/merge', methods=['POST'])
+@admin_required
+def admin_merge_incidents(report_id):
+    report_ids = _id_list(request.get_json(silent=True), 'report_ids')
+    if report_ids is None:
+        return jsonify({"error": "report_ids must be a list of ids"}), 400
+    conn = get_db()
+    # Votes still buffered in this process would be dropped with the merged reports
+    vote_buffer.flush(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute("SELECT 1 FROM incident_reports WHERE id = ?", (report_id,)).fetchone() is None:
+        conn.rollback()
+        return jsonify({"error": "Report not found"}), 404
+    locations = {r[0]: (r[1], r[2]) for r in conn.execute(
+        "SELECT id, location_latitude, location_longitude FROM incident_reports WHERE id IN (%s)"
+        % ",".join('?' * len(report_ids)), report_ids)} if report_ids else {}
+    merged = merge_reports(conn, report_id, report_ids)
+    count = conn.execute("SELECT corroboration_count FROM incident_reports WHERE id = ?", (report_id,)).fetchone()[0]
+    conn.commit()
+    for merged_id in merged:
+        distance_index.discard(merged_id)
+        feed_broker.publish('report_deleted', *locations[merged_id], {"report_id": merged_id})
+    return jsonify({"message": "Reports merged", "merged": merged, "corroboration_count": count}), 200
+
 # ---- Admin: list users ----
 @app.route('/admin/users', methods=['GET'])
 @admin_required
@@ -585,7 +1185,6 @@ def admin_list_users():
     c = conn.cursor()
     c.execute("SELECT id, username, account_type, created_at FROM users ORDER BY id")
     rows = c.fetchall()
-    conn.close()
     users = [{"id": r[0], "username": r[1], "account_type": r[2], "created_at": r[3]} for r in rows]
     return jsonify({"users": users}), 200
 
@@ -599,13 +1198,13 @@ def admin_delete_user(user_id):
     c = conn.cursor()
     c.execute("SELECT id FROM users WHERE id = ?", (user_id,))
     if not c.fetchone():
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     c.execute("UPDATE incident_reports SET reported_by_user_id = NULL WHERE reported_by_user_id = ?", (user_id,))
     c.execute("DELETE FROM report_votes WHERE user_id = ?", (user_id,))
+    c.execute("UPDATE report_corroborations SET user_id = NULL WHERE user_id = ?", (user_id,))
     c.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    invalidate_user(conn, user_id)
     conn.commit()
-    conn.close()
     return jsonify({"message": "User deleted"}), 200
 
 # ---- Admin: update user (set role / moderate) ----
@@ -621,18 +1220,221 @@ def admin_update_user(user_id):
     conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE users SET account_type = ? WHERE id = ?", (account_type, user_id))
-    conn.commit()
     if c.rowcount == 0:
-        conn.close()
+        conn.rollback()
         return jsonify({"error": "User not found"}), 404
-    conn.close()
+    invalidate_user(conn, user_id)
+    conn.commit()
     return jsonify({"message": "User updated", "account_type": account_type}), 200
 
+# ---- Admin: geocode cache counters (for tuning GEOCODE_CACHE_PRECISION) ----
+@app.route('/admin/geocode-cache', methods=['GET'])
+@admin_required
+def admin_geocode_cache():
+    return jsonify(geocode_cache.stats()), 200
+
+# ---- Admin: archived reports (never returned by the live endpoints) ----
+@app.route('/admin/archive/reports', methods=['GET'])
+@admin_required
+def admin_archive_reports():
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    clauses, params, error = _report_filters(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = _decode_cursor(cursor)
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+        params.extend([after[0], after[0], after[1]])
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    conn = get_db()
+    rows = conn.execute("SELECT * FROM incident_reports_archive%s ORDER BY created_at DESC, id DESC LIMIT %d"
+                        % (where, limit + 1), params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([rows[-1]['created_at'], rows[-1]['id']])
+    reports = [dict(report_row_to_dict(r, vote_score=r['vote_score'], upvote_count=r['upvote_count'],
+                                       downvote_count=r['downvote_count']), archived_at=r['archived_at'])
+               for r in rows]
+    return jsonify({"reports": reports, "next_cursor": next_cursor}), 200
+
+@app.route('/admin/archive/reports/<int:report_id>', methods=['GET'])
+@admin_required
+def admin_archive_report(report_id):
+    conn = get_db()
+    r = conn.execute("SELECT * FROM incident_reports_archive WHERE id = ?", (report_id,)).fetchone()
+    if r is None:
+        return jsonify({"error": "Archived report not found"}), 404
+    votes = conn.execute("SELECT user_id, vote FROM report_votes_archive WHERE report_id = ?", (report_id,)).fetchall()
+    report = report_row_to_dict(r, vote_score=r['vote_score'], upvote_count=r['upvote_count'],
+                                downvote_count=r['downvote_count'])
+    report["archived_at"] = r['archived_at']
+    report["votes"] = [{"user_id": v['user_id'], "vote": v['vote']} for v in votes]
+    return jsonify(report), 200
+
+# ---- Admin: full-table export (raw columns, streamed; one read snapshot for the whole dump) ----
+EXPORT_TABLES = {'live': 'incident_reports', 'archive': 'incident_reports_archive'}
+
+@app.route('/admin/export/reports', methods=['GET'])
+@admin_required
+def admin_export_reports():
+    fmt = request.args.get('format', 'ndjson')
+    table = EXPORT_TABLES.get(request.args.get('table', 'live'))
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    if table is None:
+        return jsonify({"error": "table must be one of: " + ", ".join(EXPORT_TABLES)}), 400
+    c = get_db().execute("SELECT * FROM %s ORDER BY id" % table)
+    columns = [d[0] for d in c.description]
+    headers = {"Content-Disposition": "attachment; filename=%s.%s" % (table, fmt)}
+    if fmt == 'ndjson':
+        return _stream_response(([dict(zip(columns, row)) for row in rows] for rows in _fetch_batches(c)),
+                                'ndjson', headers)
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for rows in _fetch_batches(c):
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv', headers=headers)
+
+# ---- Admin: Prometheus metrics (request instrumentation needs METRICS_ENABLED=1) ----
+@app.route('/metrics', methods=['GET'])
+@admin_required
+def metrics_endpoint():
+    cache = geocode_cache.stats()
+    feed_stats = feed_cache.stats()
+    gauges = [
+        ('geocode_queue_depth', (), geocoder.queue_depth()),
+        ('geocode_requests_total', (), geocoder.requests),
+        ('geocode_coalesced_total', (), geocoder.coalesced),
+        ('geocode_failures_total', (), geocoder.failures),
+        ('geocode_sleep_seconds_total', (), geocoder.sleep_seconds),
+        ('geocode_network_seconds_total', (), geocoder.network_seconds),
+        ('geocode_cache_lookups_total', (('result', 'memory_hit'),), cache['memory_hits']),
+        ('geocode_cache_lookups_total', (('result', 'db_hit'),), cache['db_hits']),
+        ('geocode_cache_lookups_total', (('result', 'miss'),), cache['misses']),
+        ('feed_cache_lookups_total', (('result', 'hit'),), feed_stats['hits']),
+        ('feed_cache_lookups_total', (('result', 'miss'),), feed_stats['misses']),
+        ('feed_cache_lookups_total', (('result', 'not_modified'),), feed_stats['not_modified']),
+        ('feed_cache_entries', (), feed_stats['entries']),
+        ('feed_cache_rows', (), feed_stats['rows']),
+        ('feed_stream_subscribers', (), feed_broker.subscriber_count),
+        ('feed_events_relayed_total', (('direction', 'out'),), feed_broker.relayed_out),
+        ('feed_events_relayed_total', (('direction', 'in'),), feed_broker.relayed_in),
+        ('db_pool_idle_connections', (), db_pool.idle_count()),
+        ('reports_archived_total', (), archiver.archived),
+        ('password_hash_inflight', (), password_hasher.inflight),
+        ('vote_buffer_pending', (), vote_buffer.pending_count()),
+        ('vote_flushes_total', (), vote_buffer.flushes),
+        ('votes_flushed_total', (), vote_buffer.flushed),
+        ('votes_collapsed_total', (), vote_buffer.collapsed),
+        ('vote_flush_failures_total', (), vote_buffer.failures),
+        ('password_hash_rejected_total', (), password_hasher.rejected),
+        ('password_rehashed_total', (), password_hasher.rehashed),
+    ] + admission_controller.gauges()
+    return Response(metrics.registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
 # ---- Admin page ----
 @app.route('/admin')
 @admin_required
 def admin_page():
     return render_template("admin.html")
 
+# ---- CLI: vote tally consistency check / rebuild ----
+@app.cli.command('rebuild-vote-tallies')
+@click.option('--check', is_flag=True, help='Only report reports whose tallies are out of sync.')
+def rebuild_vote_tallies_command(check):
+    """Recompute incident_reports vote tallies from report_votes."""
+    conn = connect(DATABASE)
+    stale = rebuild_vote_tallies(conn, check_only=check)
+    conn.close()
+    if check:
+        click.echo(f"{stale} reports have stale vote tallies")
+        if stale:
+            raise SystemExit(1)
+    else:
+        click.echo(f"Rebuilt vote tallies for {stale} reports")
+
+@app.cli.command('archive-reports')
+@click.option('--older-than-days', type=float, default=ARCHIVE_AFTER_DAYS,
+              help='Archive reports created more than this many days ago (default: ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_reports_command(older_than_days, batch_size):
+    """Move old reports and their votes into the archive tables, in short batches."""
+    if older_than_days <= 0:
+        raise click.UsageError("Pass --older-than-days or set ARCHIVE_AFTER_DAYS")
+    conn = connect(DATABASE)
+    moved = archive_reports(conn, older_than_days, batch_size=batch_size)
+    conn.close()
+    click.echo(f"Archived {moved} reports older than {older_than_days:g} days")
+
+@app.cli.command('geocode-backfill')
+@click.option('--batch-size', type=int, default=GEOCODE_BACKFILL_BATCH, show_default=True,
+              help='Reports read, looked up concurrently and written back per batch.')
+@click.option('--rate', type=float, default=1 / GEOCODE_MIN_INTERVAL, show_default=True,
+              help='Nominatim requests per second (shared with running web workers).')
+@click.option('--burst', type=int, default=1, show_default=True)
+@click.option('--base-url', default=None, help='Nominatim base URL (default: NOMINATIM_URL).')
+@click.option('--limit', type=int, default=None, help='Stop after this many reports.')
+def geocode_backfill_command(batch_size, rate, burst, base_url, limit):
+    """Fill in location_address for every located report that has none. Safe to interrupt and rerun."""
+    if batch_size <= 0 or rate <= 0:
+        raise click.UsageError("--batch-size and --rate must be positive")
+    conn = connect(DATABASE)
+    client = AsyncGeocodeClient(base_url, 1 / rate, burst=burst, precision=geocode_cache.precision,
+                                database=DATABASE)
+
+    def progress(stats):
+        elapsed = time.monotonic() - stats["started"]
+        per_second = stats["done"] / elapsed if elapsed else 0.0
+        remaining = stats["total"] - stats["done"] - stats["failed"]
+        eta = "%.0fs" % (remaining / per_second) if per_second else "?"
+        click.echo(f"{stats['done']}/{stats['total']} geocoded  requests={client.requests} "
+                   f"cached={stats['cached']} coalesced={client.coalesced} failed={stats['failed']}  "
+                   f"{per_second:.1f}/s  eta {eta}")
+
+    try:
+        stats = asyncio.run(backfill(conn, client, geocode_cache, batch_size, limit, progress))
+    finally:
+        client.close()
+        conn.close()
+    click.echo(f"Geocoded {stats['done']} of {stats['total']} reports ({stats['failed']} failed, left NULL)")
+    if stats['failed']:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-map-clusters')
+def rebuild_map_clusters_command():
+    """Recompute map_clusters from incident_reports (clears floating-point drift in centroids)."""
+    conn = connect(DATABASE)
+    cells = rebuild_map_clusters(conn)
+    conn.close()
+    click.echo(f"Rebuilt {cells} map cluster cells")
+
+@app.cli.command('rebuild-hotspots')
+def rebuild_hotspots_command():
+    """Recompute hotspot_counters from incident_reports (recovery if the counters are suspect)."""
+    conn = connect(DATABASE)
+    counters = rebuild_hotspot_counters(conn)
+    conn.close()
+    click.echo(f"Rebuilt {counters} hotspot counters")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Apply pending migrations (and seed the default users on a new database)."""
+    with init_lock(DATABASE):
+        init_db()
+    click.echo(f"Database {DATABASE} is at schema version {SCHEMA_VERSION}")
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,220 @@
+# Opt-in request instrumentation, exported in Prometheus text format by /metrics.
+#
+# With METRICS_ENABLED unset every hook below returns after one flag check, and
+# phase() hands back a shared no-op context manager. When enabled, each request
+# gets a RequestMetrics on flask.g: handlers time named phases (sql, distance,
+# geocode, serialize), the request's SQLite connection counts statements and VM
+# steps (a proxy for rows scanned), and after_request folds everything into the
+# process-wide registry. Requests slower than SLOW_REQUEST_MS are logged with
+# their per-phase breakdown.
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+# The progress handler fires once per this many SQLite VM instructions.
+VM_STEP_GRANULARITY = 1000
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Registry:
+    """Thread-safe counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [buckets, [0] * len(buckets), 0, 0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[1][i] += 1
+            hist[2] += 1
+            hist[3] += value
+
+    def render(self, gauges=()):
+        """Prometheus text exposition; gauges is an iterable of (name, labels, value)."""
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen and name in self._help:
+                seen.add(name)
+                kind, text = self._help[name]
+                lines.append("# HELP %s %s" % (name, text))
+                lines.append("# TYPE %s %s" % (name, kind))
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (v[0], list(v[1]), v[2], v[3])) for k, v in self._histograms.items())
+        for (name, labels), value in counters:
+            header(name)
+            lines.append("%s%s %s" % (name, _labels(labels), _num(value)))
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            header(name)
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append("%s_bucket%s %d" % (name, _labels(labels + (('le', _num(bound)),)), bucket_count))
+            lines.append("%s_bucket%s %d" % (name, _labels(labels + (('le', '+Inf'),)), count))
+            lines.append("%s_sum%s %s" % (name, _labels(labels), _num(total)))
+            lines.append("%s_count%s %d" % (name, _labels(labels), count))
+        for name, labels, value in gauges:
+            header(name)
+            lines.append("%s%s %s" % (name, _labels(labels), _num(value)))
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+
+def _num(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+registry = Registry()
+registry.describe('http_requests_total', 'counter', 'Requests handled, by endpoint and status.')
+registry.describe('http_request_duration_seconds', 'histogram', 'Wall time per request.')
+registry.describe('http_request_phase_seconds_total', 'counter', 'Time spent in each instrumented phase.')
+registry.describe('http_response_size_bytes', 'histogram', 'Response payload size (non-streaming responses).')
+registry.describe('sql_statements_total', 'counter', 'SQL statements executed while handling requests.')
+registry.describe('sqlite_vm_steps_total', 'counter',
+                  'SQLite VM instructions executed (granularity %d); a proxy for rows scanned.' % VM_STEP_GRANULARITY)
+registry.describe('geocode_queue_depth', 'gauge', 'Reverse-geocode jobs waiting for the worker.')
+registry.describe('geocode_requests_total', 'counter', 'Nominatim requests made by the geocode worker.')
+registry.describe('geocode_coalesced_total', 'counter', 'Geocode lookups that joined an in-flight request for the same spot.')
+registry.describe('geocode_failures_total', 'counter', 'Geocode jobs that failed and were left for retry.')
+registry.describe('geocode_sleep_seconds_total', 'counter', 'Time the geocode worker slept for the rate limit.')
+registry.describe('geocode_network_seconds_total', 'counter', 'Time the geocode worker spent waiting on Nominatim.')
+registry.describe('geocode_cache_lookups_total', 'counter', 'Geocode cache lookups by result.')
+registry.describe('feed_cache_lookups_total', 'counter', '/feed and /reports/nearby cache lookups by result.')
+registry.describe('feed_cache_entries', 'gauge', 'Neighbourhood entries held by the feed cache.')
+registry.describe('feed_cache_rows', 'gauge', 'Reports held across all feed cache entries.')
+registry.describe('feed_stream_subscribers', 'gauge', 'Open /feed/stream connections in this process.')
+registry.describe('feed_events_relayed_total', 'counter', 'SSE events written to (out) or read from (in) feed_events by this process.')
+registry.describe('reports_archived_total', 'counter', 'Reports moved to the archive by this process.')
+registry.describe('db_pool_idle_connections', 'gauge', 'Idle pooled SQLite connections in this process.')
+registry.describe('password_hash_inflight', 'gauge', 'Password hashes running or queued in this process.')
+registry.describe('password_hash_rejected_total', 'counter', 'Logins/registrations refused with 503 because hashing was saturated or its pool failed.')
+registry.describe('password_rehashed_total', 'counter', 'Stored password hashes upgraded to PASSWORD_HASH_METHOD at login.')
+registry.describe('vote_buffer_pending', 'gauge', 'Votes accepted but not yet committed by this process.')
+registry.describe('vote_flushes_total', 'counter', 'Group-commit transactions written by the vote buffer.')
+registry.describe('votes_flushed_total', 'counter', 'Votes written by the vote buffer.')
+registry.describe('votes_collapsed_total', 'counter', 'Votes replaced in the buffer by the same user\'s later vote.')
+registry.describe('vote_flush_failures_total', 'counter', 'Vote flushes that failed and were requeued.')
+registry.describe('admission_inflight', 'gauge', 'Requests holding an admission slot, by priority class.')
+registry.describe('admission_waiting', 'gauge', 'Requests queued for an admission slot, by priority class.')
+registry.describe('admission_admitted_total', 'counter', 'Requests admitted, by priority class.')
+registry.describe('admission_queue_seconds_total', 'counter', 'Time requests spent queued for a slot, by priority class.')
+registry.describe('admission_shed_total', 'counter', 'Requests refused with 503/429, by priority class and reason.')
+
+class RequestMetrics:
+    __slots__ = ('start', 'phases', 'sql_statements', 'vm_steps')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.sql_statements = 0
+        self.vm_steps = 0
+
+class _Phase:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        phases = self.metrics.phases
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+def phase(name):
+    """Context manager timing a named phase of the current request (no-op when disabled)."""
+    if not METRICS_ENABLED or not has_request_context():
+        return _NULL_PHASE
+    m = g.get('metrics')
+    return _Phase(m, name) if m is not None else _NULL_PHASE
+
+def instrument_connection(conn):
+    """Count statements and VM steps on the request's connection."""
+    if not METRICS_ENABLED or not has_request_context():
+        return
+    m = g.get('metrics')
+    if m is None:
+        return
+
+    def on_statement(_sql):
+        m.sql_statements += 1
+
+    def on_progress():
+        m.vm_steps += VM_STEP_GRANULARITY
+        return 0
+
+    conn.set_trace_callback(on_statement)
+    conn.set_progress_handler(on_progress, VM_STEP_GRANULARITY)
+
+def release_connection(conn):
+    if METRICS_ENABLED:
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, 0)
+
+def init_app(app):
+    @app.before_request
+    def _start_request_metrics():
+        if METRICS_ENABLED:
+            g.metrics = RequestMetrics()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        m = g.get('metrics') if METRICS_ENABLED else None
+        if m is None:
+            return response
+        elapsed = time.perf_counter() - m.start
+        endpoint = request.endpoint or 'unknown'
+        labels = (('endpoint', endpoint),)
+        registry.inc('http_requests_total', labels + (('status', response.status_code),))
+        registry.observe('http_request_duration_seconds', labels, elapsed, DURATION_BUCKETS)
+        for name, seconds in m.phases.items():
+            registry.inc('http_request_phase_seconds_total', labels + (('phase', name),), seconds)
+        registry.inc('sql_statements_total', labels, m.sql_statements)
+        registry.inc('sqlite_vm_steps_total', labels, m.vm_steps)
+        if not response.is_streamed and response.content_length is not None:
+            registry.observe('http_response_size_bytes', labels, response.content_length, SIZE_BUCKETS)
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            breakdown = " ".join("%s=%.1fms" % (k, v * 1000) for k, v in sorted(m.phases.items()))
+            print("Slow request: %s %s %d %.1fms sql=%d vm_steps=%d %s" % (
+                request.method, request.path, response.status_code, elapsed * 1000,
+                m.sql_statements, m.vm_steps, breakdown))
+        return response
@@ -0,0 +1,129 @@
+# Password hashing off the request threads.
+#
+# generate_password_hash / check_password_hash are deliberately slow key
+# derivations. Run inline, a burst of logins keeps every request thread (and the
+# CPU) busy and /feed and /report queue behind them. PasswordHasher sends the
+# work to a small process pool instead: the request thread just waits on a
+# future, the pool processes run at a lower CPU priority (PASSWORD_HASH_NICE), and
+# at most PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE hashes are in flight per
+# server process. Anything beyond that fails fast with HasherBusy, which the
+# handlers turn into 503 + Retry-After, rather than piling up behind the pool.
+# A broken pool (a process died or could not start) is replaced and the call
+# that hit it gets the same HasherBusy.
+#
+# Hashes carry their own parameters, so PASSWORD_HASH_METHOD can change at any
+# time: a successful login with an old-style hash returns a fresh one for the
+# caller to store.
+#
+# Pool processes are started with spawn, which re-imports the __main__ module:
+# scripts that import main need the usual `if __name__ == '__main__'` guard (or
+# PASSWORD_HASH_WORKERS=0).
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import multiprocessing
+import os
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# werkzeug method string, e.g. "scrypt", "scrypt:65536:8:1" or "pbkdf2:sha256:600000".
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+# Pool processes per server process; 0 hashes on the request thread (still bounded).
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(2, os.cpu_count() or 1)))
+# Hashes allowed to wait for a pool process before new ones are refused.
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 2))
+PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', 10))
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 1))
+
+class HasherBusy(Exception):
+    """Every hashing slot is taken; retry after PASSWORD_HASH_RETRY_AFTER seconds."""
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    """The parameter prefix werkzeug writes for `method` (defaults filled in)."""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def needs_rehash(pwhash, method=PASSWORD_HASH_METHOD):
+    return pwhash.split('$', 1)[0] != _method_prefix(method)
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+def _verify(pwhash, password, method):
+    """(matches, replacement hash or None) — the rehash runs in the same pool call."""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    return True, generate_password_hash(password, method) if needs_rehash(pwhash, method) else None
+
+def _init_worker(nice):
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+
+class PasswordHasher:
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, queue=PASSWORD_HASH_QUEUE, method=PASSWORD_HASH_METHOD,
+                 nice=PASSWORD_HASH_NICE):
+        self.workers = workers
+        self.method = method
+        self.nice = nice
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self.inflight = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _executor(self):
+        # Created on first use, so every gunicorn worker gets its own pool after the fork.
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs request threads is unsafe.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(self.nice,))
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        with self._lock:
+            self.inflight += 1
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            pool = self._executor()
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool as e:
+                # A pool process died (or could not start); the next call gets a fresh pool
+                # and this one is refused like a saturated pool.
+                print(f"Password hash pool failed, restarting it: {e}")
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                    self.rejected += 1
+                pool.shutdown(wait=False)
+                raise HasherBusy() from e
+        finally:
+            with self._lock:
+                self.inflight -= 1
+            self._slots.release()
+
+    def hash(self, password):
+        """New hash for password with the configured method. Raises HasherBusy."""
+        return self._run(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """(matches, replacement hash or None when current). Raises HasherBusy."""
+        ok, new_hash = self._run(_verify, pwhash, password, self.method)
+        if new_hash is not None:
+            with self._lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,69 @@
+# Report serialization for the hot read paths.
+#
+# report_row_to_dict() (main.py) accepts any row shape, so it asks row.keys()
+# and tests column membership for every row. The list, feed, nearby and
+# viewport queries instead select REPORT_COLUMNS, in this order, ahead of any
+# extra columns. Every position is then known at import time, and
+# report_dict() builds the API shape straight from sqlite3.Row indexes, which
+# are C-level and need no per-row name lookups. Column order has to be explicit:
+# SELECT * differs between fresh databases and ones that gained columns through
+# ALTER TABLE migrations.
+#
+# FastJSONProvider swaps Flask's json.dumps for orjson when it is installed,
+# keeping the same output (sorted keys, compact, same date handling); anything
+# orjson cannot encode falls back to the standard encoder.
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+REPORT_COLUMNS = ('id', 'date', 'severity', 'location_latitude', 'location_longitude', 'location_accuracy',
+                  'details', 'status', 'created_at', 'verified', 'location_address',
+                  'vote_score', 'upvote_count', 'downvote_count', 'corroboration_count')
+REPORT_SELECT = ", ".join(REPORT_COLUMNS)
+(ID, DATE, SEVERITY, LATITUDE, LONGITUDE, ACCURACY, DETAILS, STATUS, CREATED_AT, VERIFIED, ADDRESS,
+ VOTE_SCORE, UPVOTE_COUNT, DOWNVOTE_COUNT, CORROBORATION_COUNT) = range(len(REPORT_COLUMNS))
+
+def report_dict(row, address=None):
+    """API dict for a REPORT_COLUMNS row; address overrides the stored one when given."""
+    return {
+        "id": row[ID],
+        "date": row[DATE],
+        "severity": row[SEVERITY],
+        "location": {
+            "latitude": row[LATITUDE],
+            "longitude": row[LONGITUDE],
+            "accuracyMeters": row[ACCURACY],
+        },
+        "details": row[DETAILS],
+        "status": row[STATUS],
+        "created_at": row[CREATED_AT],
+        "verified": bool(row[VERIFIED]),
+        "address": address if address is not None else row[ADDRESS] or None,
+        "corroboration_count": row[CORROBORATION_COUNT],
+    }
+
+def report_dict_with_votes(row, address=None):
+    """report_dict() plus the trigger-maintained vote tallies."""
+    d = report_dict(row, address)
+    d["vote_score"] = row[VOTE_SCORE]
+    d["upvote_count"] = row[UPVOTE_COUNT]
+    d["downvote_count"] = row[DOWNVOTE_COUNT]
+    return d
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when available."""
+
+    def dumps(self, obj, **kwargs):
+        # orjson is always compact; pretty-printing (debug jsonify) keeps the standard encoder.
+        if orjson is None or kwargs.get('indent') is not None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except TypeError:
+            return super().dumps(obj, **kwargs)
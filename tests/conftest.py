@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Read when main is imported: hash on the request thread, no admission control,
+# no duplicate folding, and a throwaway default database.
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('ADMISSION_ENABLED', '0')
+os.environ.setdefault('DEDUPE_RADIUS_METERS', '0')
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='incident-tests-'), 'default.db'))
+
+@pytest.fixture
+def main_module(tmp_path):
+    """main, pointed at a fresh migrated and seeded database (admin/admin, user/user)."""
+    import main
+    main.create_app(str(tmp_path / 'test.db'))
+    main.geocoder.enabled = False
+    yield main
+    for worker in (main.archiver, main.vote_buffer, main.feed_broker):
+        worker.stop(timeout=5)
+
+@pytest.fixture
+def client(main_module):
+    return main_module.app.test_client()
+
+def login(client, username='admin', password='admin'):
+    res = client.post('/login', json={'username': username, 'password': password})
+    assert res.status_code == 200, res.get_json()
+    return client
+
+def report(severity='high', latitude=38.8316, longitude=-77.3076, details='test report'):
+    return {"date": "2026-01-01T12:00", "severity": severity, "details": details,
+            "location": {"latitude": latitude, "longitude": longitude, "accuracyMeters": 10}}
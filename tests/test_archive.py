@@ -0,0 +1,15 @@
+from archive import archive_batch
+from conftest import login, report
+
+def test_archived_votes_keep_voted_at(client, main_module):
+    login(client)
+    assert client.post('/report', json=report()).status_code == 201
+    assert client.post('/reports/1/vote', json={"vote": 1}).status_code == 200
+    conn = main_module.connect(main_module.DATABASE)
+    main_module.vote_buffer.flush(conn)
+    voted_at = conn.execute("SELECT voted_at FROM report_votes WHERE report_id = 1").fetchone()[0]
+    assert voted_at is not None
+    assert archive_batch(conn, '9999-12-31T00:00:00Z') == [1]
+    archived = conn.execute("SELECT user_id, vote, voted_at FROM report_votes_archive WHERE report_id = 1").fetchall()
+    conn.close()
+    assert [tuple(row) for row in archived] == [(1, 1, voted_at)]
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import login, report
+
+@pytest.fixture
+def admin(client, main_module):
+    login(client)
+    for _ in range(3):
+        assert client.post('/report', json=report(latitude=38.9, longitude=-77.2)).status_code == 201
+    return client
+
+BAD_CURSORS = [[{"a": 1}, 2], ["2026-01-01T00:00:00Z", "2"], ["2026-01-01T00:00:00Z", True],
+               ["2026-01-01T00:00:00Z", 1.5], [None, 1], [1], "text"]
+
+@pytest.mark.parametrize('values', BAD_CURSORS + [[1.5, 2]])
+def test_bad_created_at_cursor(admin, main_module, values):
+    res = admin.get('/reports?cursor=' + main_module._encode_cursor(values))
+    assert res.status_code == 400
+
+@pytest.mark.parametrize('values', BAD_CURSORS + [["0.5", 2], [True, 2], [float('nan'), 2], [float('inf'), 2]])
+def test_bad_distance_cursor(admin, main_module, values):
+    res = admin.get('/reports?latitude=38.83&longitude=-77.31&cursor=' + main_module._encode_cursor(values))
+    assert res.status_code == 400
+
+def test_bad_archive_cursor(admin, main_module):
+    res = admin.get('/admin/archive/reports?cursor=' + main_module._encode_cursor([{"a": 1}, 2]))
+    assert res.status_code == 400
+
+def test_cursors_page_through(admin):
+    for query in ('/reports?limit=2', '/reports?limit=2&latitude=38.83&longitude=-77.31'):
+        page = admin.get(query).get_json()
+        assert page["next_cursor"]
+        rest = admin.get(query + '&cursor=' + page["next_cursor"])
+        assert rest.status_code == 200
+        assert len(rest.get_json()["reports"]) == 1
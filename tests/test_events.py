@@ -0,0 +1,17 @@
+import sqlite3
+import time
+
+from events import FeedBroker
+
+def test_stop_gives_up_when_relay_writes_fail(main_module, monkeypatch):
+    broker = FeedBroker(main_module.DATABASE, interval=0.05)
+
+    def failing_write(conn):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(broker, '_write_outbox', failing_write)
+    broker.start()
+    time.sleep(0.2)
+    started = time.monotonic()
+    broker.stop(timeout=2)
+    assert not broker._thread.is_alive()
+    assert time.monotonic() - started < 1
@@ -0,0 +1,17 @@
+from conftest import login, report
+from feedcache import FeedCache
+
+def test_version_without_ranges(main_module):
+    conn = main_module.connect(main_module.DATABASE)
+    assert FeedCache().version(conn, []) == 0
+    conn.close()
+
+def test_version_counts_writes_in_range(client, main_module):
+    login(client)
+    conn = main_module.connect(main_module.DATABASE)
+    cache = FeedCache()
+    _, ranges = cache.cover(38.8316, -77.3076, 1)
+    before = cache.version(conn, ranges)
+    assert client.post('/report', json=report()).status_code in (200, 201)
+    assert cache.version(conn, ranges) > before
+    conn.close()
@@ -0,0 +1,51 @@
+import time
+
+from conftest import login, report
+from db import _migrate_hotspot_pruning, rebuild_hotspot_counters
+from geo import HOTSPOT_MAX_HOURS, HOTSPOT_RETENTION_BUCKETS
+from hotspots import current_bucket
+
+def counter_buckets(conn):
+    return sorted(row[0] for row in conn.execute("SELECT bucket FROM hotspot_counters"))
+
+def iso(bucket):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime(bucket * 3600 + 60))
+
+def test_expired_buckets_are_pruned_on_write(client, main_module):
+    login(client)
+    assert client.post('/report', json=report()).status_code == 201
+    conn = main_module.connect(main_module.DATABASE)
+    now = current_bucket()
+    kept, expired = now - HOTSPOT_RETENTION_BUCKETS + 2, now - HOTSPOT_RETENTION_BUCKETS - 2
+    conn.execute("INSERT INTO hotspot_counters (cell, bucket, weight, count) VALUES (1, ?, 1, 1)", (kept,))
+    conn.execute("INSERT INTO hotspot_counters (cell, bucket, weight, count) VALUES (2, ?, 1, 1)", (expired,))
+    conn.commit()
+    assert counter_buckets(conn) == [kept, now]
+    # A report moved out of the window takes its counter along
+    conn.execute("UPDATE incident_reports SET created_at = ?", (iso(expired),))
+    conn.commit()
+    assert counter_buckets(conn) == [kept]
+    conn.close()
+
+def test_rebuild_and_migration_drop_expired_buckets(client, main_module):
+    login(client)
+    for _ in range(2):
+        assert client.post('/report', json=report()).status_code == 201
+    conn = main_module.connect(main_module.DATABASE)
+    now = current_bucket()
+    expired = now - HOTSPOT_RETENTION_BUCKETS - 2
+    conn.execute("DROP TRIGGER trg_hotspot_counters_prune")
+    conn.execute("UPDATE incident_reports SET created_at = ? WHERE id = 1", (iso(expired),))
+    assert counter_buckets(conn) == [expired, now]
+    assert rebuild_hotspot_counters(conn, commit=False) == 1
+    conn.execute("UPDATE incident_reports SET created_at = ? WHERE id = 1", (iso(expired),))
+    _migrate_hotspot_pruning(conn)
+    conn.commit()
+    assert counter_buckets(conn) == [now]
+    conn.close()
+
+def test_longest_window_is_accepted(client):
+    login(client)
+    res = client.get('/hotspots?recent_hours=%d&baseline_hours=%d' % (HOTSPOT_MAX_HOURS, HOTSPOT_MAX_HOURS))
+    assert res.status_code == 200
+    assert client.get('/hotspots?recent_hours=%d' % (HOTSPOT_MAX_HOURS + 1)).status_code == 400
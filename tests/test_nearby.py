@@ -0,0 +1,22 @@
+import pytest
+
+from conftest import login, report
+from geo import rows_in_cells
+
+@pytest.mark.parametrize('radius', [-5, -0.1, 'inf', 'nan'])
+def test_nearby_rejects_bad_radius(client, radius):
+    login(client)
+    res = client.post('/reports/nearby', json={"latitude": 38.83, "longitude": -77.31, "radius_miles": radius})
+    assert res.status_code == 400
+
+def test_nearby_zero_radius(client):
+    login(client)
+    client.post('/report', json=report())
+    res = client.post('/reports/nearby', json={"latitude": 38.83, "longitude": -77.31, "radius_miles": 0})
+    assert res.status_code == 200
+    assert res.get_json()["nearby_reports"] == []
+
+def test_rows_in_cells_without_ranges(main_module):
+    conn = main_module.connect(main_module.DATABASE)
+    assert rows_in_cells(conn, []) == []
+    conn.close()
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+import pytest
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from conftest import login
+from passwords import PASSWORD_HASH_METHOD, HasherBusy, PasswordHasher, needs_rehash
+
+@pytest.fixture
+def hasher():
+    """A pool of one process and no queue: a single hash in flight saturates it."""
+    hasher = PasswordHasher(workers=1, queue=0)
+    yield hasher
+    hasher.close()
+
+def occupy(hasher, seconds):
+    """Hold the hasher's only slot for `seconds` on a background thread; returns the thread."""
+    thread = threading.Thread(target=hasher._run, args=(time.sleep, seconds))
+    thread.start()
+    deadline = time.monotonic() + 10
+    while hasher.inflight == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert hasher.inflight == 1
+    return thread
+
+def test_saturated_pool_refuses(hasher):
+    thread = occupy(hasher, 1)
+    with pytest.raises(HasherBusy):
+        hasher.hash('secret')
+    thread.join()
+    assert hasher.rejected == 1
+    assert check_password_hash(hasher.hash('secret'), 'secret')
+
+def test_broken_pool_is_replaced(hasher):
+    with pytest.raises(HasherBusy):
+        hasher._run(os._exit, 1)
+    assert check_password_hash(hasher.hash('secret'), 'secret')
+
+def test_login_answers_503_while_saturated(client, main_module, monkeypatch, hasher):
+    monkeypatch.setattr(main_module, 'password_hasher', hasher)
+    thread = occupy(hasher, 1)
+    res = client.post('/login', json={"username": "admin", "password": "admin"})
+    assert res.status_code == 503
+    assert res.headers['Retry-After'] == str(main_module.PASSWORD_HASH_RETRY_AFTER)
+    thread.join()
+    login(client)
+
+def test_login_upgrades_old_hash(client, main_module, monkeypatch, hasher):
+    monkeypatch.setattr(main_module, 'password_hasher', hasher)
+    old_hash = generate_password_hash('admin', 'pbkdf2:sha256:1000')
+    assert needs_rehash(old_hash)
+    conn = main_module.connect(main_module.DATABASE)
+    conn.execute("UPDATE users SET password_hash = ? WHERE username = 'admin'", (old_hash,))
+    conn.commit()
+    login(client)
+    new_hash = conn.execute("SELECT password_hash FROM users WHERE username = 'admin'").fetchone()[0]
+    conn.close()
+    assert new_hash != old_hash
+    assert not needs_rehash(new_hash, PASSWORD_HASH_METHOD)
+    assert check_password_hash(new_hash, 'admin')
+    assert hasher.rehashed == 1
@@ -0,0 +1,110 @@
+"""Every statement a hot-path handler runs must be served by an index.
+
+Rather than a hand-kept copy of the SQL, the test replays the hot-path requests
+below through the test client and captures every statement their handlers run
+(set_trace_callback on the request connection), plus the background write paths,
+then EXPLAINs each one. Full listings (GET /reports without limit, /admin/users,
+exports) and maintenance commands scan by design and are not replayed.
+"""
+from archive import archive_batch
+from conftest import report
+from geocode import BACKFILL_BATCH_SQL
+
+FAIRFAX = {"latitude": 38.8316, "longitude": -77.3076}
+
+def replay_steps(main):
+    """(label, method, path, json body) in replay order; ids refer to the reports created first.
+
+    A step without a method runs path(conn) instead: the background write paths.
+    """
+    after_page = main._encode_cursor(['9999-12-31T00:00:00Z', 10 ** 9])
+    after_nearest = main._encode_cursor([0.0, 0])
+    return [
+        ("login", 'POST', '/login', {"username": "admin", "password": "admin"}),
+        ("submit", 'POST', '/report', report('high', details='plan check')),
+        ("submit: duplicate", 'POST', '/report', report('high', details='plan check again')),
+        ("submit", 'POST', '/report', report('low', details='plan check low')),
+        ("bulk submit", 'POST', '/reports/bulk', [report('medium', details='plan check bulk')]),
+        ("feed", 'POST', '/feed', FAIRFAX),
+        ("nearby", 'POST', '/reports/nearby', dict(FAIRFAX, radius_miles=0.5)),
+        ("nearby: wide radius", 'POST', '/reports/nearby', dict(FAIRFAX, radius_miles=200)),
+        ("viewport: clusters", 'GET', '/reports/viewport?bbox=-77.5,38.7,-77.1,38.9&zoom=8', None),
+        ("viewport: reports", 'GET', '/reports/viewport?bbox=-77.31,38.83,-77.30,38.84&zoom=16', None),
+        ("hotspots", 'GET', '/hotspots', None),
+        ("reports: newest page", 'GET', '/reports?limit=50', None),
+        ("reports: keyset page", 'GET', '/reports?cursor=' + after_page, None),
+        ("reports: severity filter", 'GET', '/reports?limit=50&severity=high,low', None),
+        ("reports: status filter", 'GET', '/reports?limit=50&status=Pending', None),
+        ("reports: verified filter", 'GET', '/reports?limit=50&verified=true', None),
+        ("reports: since filter", 'GET', '/reports?limit=50&since=2026-01-01', None),
+        ("reports: nearest page", 'GET', '/reports?limit=50&latitude=38.83&longitude=-77.31', None),
+        ("reports: nearest keyset", 'GET', '/reports?latitude=38.83&longitude=-77.31&cursor=' + after_nearest, None),
+        ("vote", 'POST', '/reports/1/vote', {"vote": 1}),
+        ("vote flush", None, main.vote_buffer.flush, None),
+        ("verify", 'POST', '/reports/1/verify', None),
+        ("corroborations", 'GET', '/admin/incidents/1/corroborations', None),
+        ("split", 'POST', '/admin/incidents/1/split', {}),
+        ("merge", 'POST', '/admin/incidents/1/merge', {"report_ids": [2]}),
+        ("delete report", 'DELETE', '/reports/3', None),
+        ("delete user", 'DELETE', '/admin/users/2', None),
+        ("archive: batch", None, lambda conn: archive_batch(conn, '9999-12-31T00:00:00Z'), None),
+        ("archive: newest page", 'GET', '/admin/archive/reports?limit=50', None),
+        ("archive: report", 'GET', '/admin/archive/reports/1', None),
+    ]
+
+def capture_sql(main):
+    """[(label, sql)] for every distinct statement the replay runs, in first-seen order."""
+    captured, seen = [], set()
+    label = None
+
+    def trace(sql):
+        sql = sql.strip()
+        if sql.startswith('--') or sql.split(None, 1)[0].upper() not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+            return
+        if sql not in seen:
+            seen.add(sql)
+            captured.append((label, sql))
+
+    main.db_pool.close_all()
+    conn = main.db_pool.acquire()
+    conn.set_trace_callback(trace)
+    main.db_pool.release(conn)
+    client = main.app.test_client()
+    for label, method, path, body in replay_steps(main):
+        if method is None:
+            path(conn)
+            continue
+        response = client.open(path, method=method, json=body)
+        assert response.status_code < 400, f"{label}: {method} {path} returned {response.status_code}"
+    conn.set_trace_callback(None)
+    # Background paths that need the network or a running thread, from their SQL constants
+    captured.append(("geocode backfill: next batch", BACKFILL_BATCH_SQL.replace('?', '0')))
+    return captured
+
+def uses_index(plan):
+    """False if any step is a bare table scan (SCAN without USING ... INDEX / PRIMARY KEY)."""
+    return not any(detail.startswith('SCAN ') and 'USING' not in detail and detail != 'SCAN CONSTANT ROW'
+                   for detail in plan)
+
+def test_uses_index():
+    assert uses_index(['SEARCH incident_reports USING INDEX idx_reports_created (created_at<?)'])
+    assert uses_index(['SCAN incident_reports USING INDEX idx_reports_created', 'SCAN CONSTANT ROW'])
+    assert not uses_index(['SCAN report_corroborations'])
+
+def test_hot_paths_use_indexes(main_module, monkeypatch):
+    # Single-threaded replay: buffered votes and archiving are driven on the traced connection
+    for worker in (main_module.archiver, main_module.vote_buffer, main_module.feed_broker):
+        worker.stop()
+    monkeypatch.setattr(main_module.admission_controller, 'enabled', False)
+    # Request metrics would swap out the trace callback on every request connection
+    monkeypatch.setattr(main_module.metrics, 'METRICS_ENABLED', False)
+    statements = capture_sql(main_module)
+    conn = main_module.connect(main_module.DATABASE)
+    scans = []
+    for label, sql in statements:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        if not uses_index(plan):
+            scans.append("%s: %s\n    %s" % (label, "; ".join(plan), " ".join(sql.split())))
+    conn.close()
+    assert len(statements) > 30
+    assert not scans, "\n".join(scans)
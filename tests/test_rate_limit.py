@@ -0,0 +1,35 @@
+import multiprocessing
+
+from coordination import SharedRateLimiter
+from db import connect, migrate
+
+INTERVAL = 0.05
+PROCESSES = 4
+CALLS = 6
+# How late a process may wake from its sleep() without failing the test
+SLACK = 0.03
+
+def acquire_times(database, calls):
+    """Child process: acquire() calls times over its own connection, returning when each slot started."""
+    import time
+    conn = connect(database)
+    times = []
+    for _ in range(calls):
+        SharedRateLimiter('test').acquire(conn, INTERVAL)
+        times.append(time.time())
+    conn.close()
+    return times
+
+def test_processes_share_one_rate(tmp_path):
+    database = str(tmp_path / 'rate.db')
+    conn = connect(database)
+    migrate(conn)
+    conn.close()
+    with multiprocessing.get_context('spawn').Pool(PROCESSES) as pool:
+        results = pool.starmap(acquire_times, [(database, CALLS)] * PROCESSES)
+    times = sorted(t for result in results for t in result)
+    assert len(times) == PROCESSES * CALLS
+    # Slots are reserved INTERVAL apart; each acquire returns at its slot, plus scheduling delay
+    for i in range(len(times)):
+        for j in range(i + 1, len(times)):
+            assert times[j] - times[i] >= (j - i) * INTERVAL - SLACK, (i, j, times)
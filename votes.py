@@ -0,0 +1,202 @@
+# Write-behind buffering for POST /reports/<id>/vote.
+#
+# Committing every click serializes a viral report's voters on the SQLite write
+# lock. VoteBuffer keeps votes in memory instead, keyed by (report_id, user_id)
+# so a user who changes their mind only leaves their latest vote. A background
+# thread writes them with one executemany in one BEGIN IMMEDIATE transaction
+# every VOTE_FLUSH_INTERVAL seconds, or as soon as VOTE_FLUSH_SIZE votes are
+# waiting. stop() (run at exit) flushes whatever is left. The report_votes
+# triggers keep the tallies on incident_reports exactly as before.
+#
+# Read-your-writes: the vote response carries a provisional tally, the
+# committed tally plus the effect of every vote this process is still holding.
+# All other reads (/feed, /reports, other processes) come from the database
+# and show a vote once it is flushed, i.e. within VOTE_FLUSH_INTERVAL.
+#
+# Several server processes buffer independently, so one user's votes on one
+# report can be flushed out of order. Every vote carries the time it was
+# accepted (report_votes.voted_at) and an older vote never overwrites a newer
+# one. A provisional tally only knows about this process's buffer.
+#
+# Each buffered entry remembers the vote stored when it was first buffered
+# ("base"), so per-report deltas can be kept incrementally. The committed
+# tally and the deltas must describe the same moment: callers read the database
+# between snapshot_version() and add(), and add() refuses (returns None) if a
+# flush committed in between, so the caller re-reads.
+import os
+import sqlite3
+import threading
+import time
+
+from db import connect
+
+VOTE_FLUSH_INTERVAL = float(os.environ.get('VOTE_FLUSH_INTERVAL', 0.1))  # 0 writes every vote synchronously
+VOTE_FLUSH_SIZE = int(os.environ.get('VOTE_FLUSH_SIZE', 1000))
+
+# Votes for reports or users deleted (or archived) while buffered are dropped.
+UPSERT_VOTE_SQL = '''INSERT INTO report_votes (report_id, user_id, vote, voted_at)
+    SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM incident_reports WHERE id = ?)
+                        AND EXISTS (SELECT 1 FROM users WHERE id = ?)
+    ON CONFLICT(report_id, user_id) DO UPDATE SET vote = excluded.vote, voted_at = excluded.voted_at
+    WHERE report_votes.voted_at IS NULL OR report_votes.voted_at <= excluded.voted_at'''
+
+def _shift(deltas, report_id, old, new):
+    """Move report_id's (score, up, down) delta from vote `old` to vote `new` (None = no vote)."""
+    d = deltas.get(report_id)
+    if d is None:
+        d = deltas[report_id] = [0, 0, 0]
+    d[0] += (new or 0) - (old or 0)
+    d[1] += (new == 1) - (old == 1)
+    d[2] += (new == -1) - (old == -1)
+
+class VoteBuffer:
+    """In-process vote buffer flushed by a background thread with group commits."""
+
+    def __init__(self, database, interval=VOTE_FLUSH_INTERVAL, max_pending=VOTE_FLUSH_SIZE):
+        self.database = database
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Notified whenever an in-flight batch commits or is requeued
+        self._flushed = threading.Condition(self._lock)
+        # (report_id, user_id) -> [base vote, latest vote, accepted at]
+        self._pending = {}
+        self._flushing = {}
+        # report_id -> [score, up, down] relative to the committed tallies
+        self._pending_deltas = {}
+        self._flushing_deltas = {}
+        self.version = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.flushed = 0
+        self.collapsed = 0
+        self.failures = 0
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def pending_count(self):
+        return len(self._pending) + len(self._flushing)
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="vote-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the flusher and write out every buffered vote."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._pending and (self._thread is None or not self._thread.is_alive()):
+            conn = connect(self.database)
+            try:
+                self.flush(conn)
+            finally:
+                conn.close()
+
+    def _run(self):
+        conn = connect(self.database)
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                try:
+                    self.flush(conn)
+                except sqlite3.Error as e:
+                    print(f"Vote flush failed, will retry: {e}")
+            self.flush(conn)
+        finally:
+            conn.close()
+
+    # ---- Ingestion ----
+
+    def snapshot_version(self):
+        with self._lock:
+            return self.version
+
+    def add(self, version, report_id, user_id, vote, stored_vote, tally):
+        """Buffer a vote and return the provisional (score, up, down).
+
+        stored_vote and tally are what the caller read from the database after
+        snapshot_version() returned version. Returns None, buffering nothing, if
+        a flush has committed since; read again and retry.
+        """
+        with self._lock:
+            if version != self.version:
+                return None
+            key = (report_id, user_id)
+            entry = self._pending.get(key)
+            if entry is None:
+                flushing = self._flushing.get(key)
+                base = flushing[1] if flushing is not None else stored_vote
+                entry = self._pending[key] = [base, base, None]
+            else:
+                self.collapsed += 1
+            _shift(self._pending_deltas, report_id, entry[1], vote)
+            entry[1] = vote
+            entry[2] = time.time()
+            pending = self._pending_deltas.get(report_id, (0, 0, 0))
+            flushing = self._flushing_deltas.get(report_id, (0, 0, 0))
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+        return tuple(t + p + f for t, p, f in zip(tally, pending, flushing))
+
+    # ---- Flushing ----
+
+    def flush(self, conn):
+        """Write every buffered vote in one transaction. Returns how many were written.
+
+        If another thread is writing a batch, waits for it first: when this
+        returns, every vote buffered before the call is committed.
+        """
+        with self._lock:
+            while self._flushing:
+                self._flushed.wait()
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            self._flushing_deltas, self._pending_deltas = self._pending_deltas, {}
+            # Written even when latest == base: another process may have stored a newer vote since base was read.
+            batch = [(report_id, user_id, latest, voted_at, report_id, user_id)
+                     for (report_id, user_id), (_, latest, voted_at) in self._flushing.items()]
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(UPSERT_VOTE_SQL, batch)
+            # Commit under the lock: add() then never pairs a post-commit read with pre-commit deltas.
+            with self._lock:
+                conn.commit()
+                self._flushing, self._flushing_deltas = {}, {}
+                self.version += 1
+                self.flushes += 1
+                self.flushed += len(batch)
+                self._flushed.notify_all()
+        except sqlite3.Error:
+            conn.rollback()
+            self._requeue()
+            raise
+        return len(batch)
+
+    def _requeue(self):
+        """Put a failed batch back under any votes buffered since."""
+        with self._lock:
+            self.failures += 1
+            for key, (base, latest, voted_at) in self._flushing.items():
+                entry = self._pending.get(key)
+                if entry is None:
+                    self._pending[key] = [base, latest, voted_at]
+                else:
+                    entry[0] = base
+            self._flushing = {}
+            self._flushing_deltas = {}
+            self._pending_deltas = {}
+            self._flushed.notify_all()
+            for (report_id, _), (base, latest, _) in self._pending.items():
+                _shift(self._pending_deltas, report_id, base, latest)
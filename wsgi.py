@@ -0,0 +1,5 @@
+# Production WSGI entry point: gunicorn -c gunicorn.conf.py
+# (the config points gunicorn at wsgi:app and runs migrations once in the master).
+from main import create_app
+
+app = create_app(migrate_db=False)